@@ -0,0 +1,209 @@
+"""
+Benchmark of what pynco adds on top of running NCO directly.
+
+For a few operators and input sizes the phases of an operator call are timed
+one by one (building the command, Popen/communicate, has_error, tempfile
+creation, read_cdf/read_array, the operator docs) and the whole call is
+compared with a bare posix_spawn (execve) of the very same command.
+
+    python benchmarks/overhead.py
+    python benchmarks/overhead.py --sizes 10,500 --repeat 50 --json base.json
+    python benchmarks/overhead.py --compare base.json
+
+The input files are synthetic, like the ones in tests/conftest.py.  With
+--compare the medians are checked against an earlier --json run and phases
+that got slower than --tolerance are reported (non-zero exit status).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import netCDF4
+import numpy as np
+
+from nco import Nco
+from nco.nco import OperatorMethod, operator_doc
+
+OPERATORS = [
+    ("ncks", {"variable": "random"}),
+    ("ncra", {}),
+    ("ncwa", {"average": "lat"}),
+]
+
+
+def make_file(directory, size, n_time=4):
+    """a netCDF file with a time x size x size random field"""
+    filename = os.path.join(directory, "bench_{0}.nc".format(size))
+    dataset = netCDF4.Dataset(filename, "w")
+    dataset.createDimension("time", None)
+    dataset.createDimension("lat", size)
+    dataset.createDimension("lon", size)
+    var = dataset.createVariable("random", "f8", ("time", "lat", "lon"))
+    time_var = dataset.createVariable("time", "f8", ("time",))
+    time_var.units = "days since 1990-01-01"
+    var[:, :, :] = np.random.rand(n_time, size, size)
+    time_var[:] = np.arange(n_time)
+    dataset.close()
+    return filename
+
+
+def spawn(cmd):
+    """run cmd without any wrapper, output goes to /dev/null"""
+    file_actions = [
+        (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+        (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+    ]
+    pid = os.posix_spawn(cmd[0], cmd, os.environ, file_actions=file_actions)
+    os.waitpid(pid, 0)
+
+
+def measure(func, repeat, setup=None):
+    """
+    median and minimum wall time of func in milliseconds, func is given
+    what setup returns, which isn't timed
+    """
+    times = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        times.append((time.perf_counter() - start) * 1000.0)
+    return {"median": statistics.median(times), "min": min(times)}
+
+
+def bench_operator(nco, nco_command, kwargs, infile, outfile, repeat):
+    results = {}
+
+    def build():
+        return nco.build_call(nco_command, infile, dict(kwargs, output=outfile))
+
+    nco_call = build()
+    cmd = nco_call["cmd"] + [infile]
+    retvals = nco.call(nco_call["cmd"], inputs=infile)
+
+    results["build_call"] = measure(build, repeat)
+    results["popen"] = measure(
+        lambda: nco.call(nco_call["cmd"], inputs=infile), repeat
+    )
+    results["execve"] = measure(lambda: spawn(cmd), repeat)
+    results["has_error"] = measure(
+        lambda: nco.has_error(nco_command, infile, nco_call["cmd"], retvals), repeat
+    )
+    results["operator"] = measure(
+        lambda: getattr(nco, nco_command)(input=infile, output=outfile, **kwargs),
+        repeat,
+    )
+    results["overhead"] = {
+        key: results["operator"][key] - results["execve"][key]
+        for key in ("median", "min")
+    }
+    results["read_cdf"] = measure(lambda: nco.read_cdf(outfile).close(), repeat)
+    results["read_array"] = measure(
+        lambda: nco.read_array(outfile, "random"), repeat
+    )
+    return results
+
+
+def bench_common(nco, repeat):
+    results = {}
+
+    def scratch_file():
+        nco.scratch.remove(nco.scratch.new_file(prefix="ncra_", suffix=".tmp"))
+
+    results["tempfile"] = measure(scratch_file, repeat)
+
+    def operator_method():
+        return OperatorMethod(bench_common, "ncks", nco.nco_path)
+
+    results["operator_method"] = measure(operator_method, repeat)
+
+    doc_dir = tempfile.mkdtemp()
+    old_cache_dir = os.environ.get("PYNCO_CACHE_DIR")
+    os.environ["PYNCO_CACHE_DIR"] = doc_dir
+    try:
+        results["doc_cold"] = measure(lambda: operator_doc("ncks", nco.nco_path), 1)
+        results["doc_warm"] = measure(
+            lambda: operator_doc("ncks", nco.nco_path), repeat
+        )
+        # the first __doc__ of a new method, with the docs cached on disk
+        results["first_doc"] = measure(
+            lambda method: method.__doc__, repeat, setup=operator_method
+        )
+    finally:
+        if old_cache_dir is None:
+            del os.environ["PYNCO_CACHE_DIR"]
+        else:
+            os.environ["PYNCO_CACHE_DIR"] = old_cache_dir
+        shutil.rmtree(doc_dir)
+    return results
+
+
+def flatten(results):
+    rows = {}
+    for name, phases in results.items():
+        for phase, timing in phases.items():
+            rows["{0} {1}".format(name, phase)] = timing
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10,100,1000", help="grid sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown for --compare")
+    args = parser.parse_args(argv)
+
+    nco = Nco(cdf_module="netcdf4")
+    workdir = tempfile.mkdtemp()
+    results = {}
+    try:
+        results["common"] = bench_common(nco, args.repeat)
+        for size in [int(size) for size in args.sizes.split(",")]:
+            infile = make_file(workdir, size)
+            outfile = os.path.join(workdir, "out.nc")
+            for nco_command, kwargs in OPERATORS:
+                name = "{0}[{1}]".format(nco_command, size)
+                results[name] = bench_operator(
+                    nco, nco_command, kwargs, infile, outfile, args.repeat
+                )
+    finally:
+        shutil.rmtree(workdir)
+
+    rows = flatten(results)
+    width = max(len(row) for row in rows)
+    print("{0:<{1}} {2:>12} {3:>12}".format("phase", width, "median ms", "min ms"))
+    for row, timing in rows.items():
+        print("{0:<{1}} {2:12.3f} {3:12.3f}".format(
+            row, width, timing["median"], timing["min"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = flatten(json.load(f))
+        slower = []
+        for row, timing in rows.items():
+            if row not in baseline or row.endswith("overhead"):
+                continue
+            before = baseline[row]["median"]
+            if timing["median"] > before * (1.0 + args.tolerance) + 0.01:
+                slower.append((row, before, timing["median"]))
+        for row, before, after in slower:
+            print("SLOWER: {0} {1:.3f} ms -> {2:.3f} ms".format(row, before, after))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+aio module:
+asyncio interface to the NCO operators.  Use it through the aio
+property of an Nco instance:
+
+    nco = Nco()
+    output = await nco.aio.ncra(input="in.nc", output="out.nc")
+
+The commands are built exactly as for the blocking operators, only the NCO
+process is run with asyncio.create_subprocess_exec so many of them can be
+driven concurrently from a single event loop.
+"""
+
+import asyncio
+import shlex
+import time
+
+
+class AsyncNco(object):
+    """
+    awaitable twin of every operator of an Nco instance
+
+    Cancelling an awaiting operator kills the NCO process.
+    """
+
+    def __init__(self, nco):
+        self.nco = nco
+
+    def __dir__(self):
+        res = dir(type(self)) + list(self.__dict__.keys())
+        res.extend(self.nco.operators)
+        return res
+
+    async def call(self, cmd, inputs=None, environment=None, use_shell=False):
+        # imported here, nco.nco imports this module
+        from .nco import call_stats, stdin_source
+
+        cmd, file_list = self.nco.full_command(
+            cmd, inputs=inputs, environment=environment, use_shell=use_shell
+        )
+        start = time.time()
+        counter = time.perf_counter()
+
+        with stdin_source(file_list) as stdin:
+            if use_shell:
+                proc = await asyncio.create_subprocess_shell(
+                    " ".join(map(shlex.quote, cmd)),
+                    stdin=stdin,
+                    stderr=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    env=environment,
+                )
+            else:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=stdin,
+                    stderr=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    env=environment
+                )
+
+        try:
+            retvals = await proc.communicate()
+        except asyncio.CancelledError:
+            # don't leave the NCO process running behind our back
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+
+        # asyncio reaps the process itself, so there is no resource usage
+        stats = call_stats(cmd, inputs, start, proc.pid)
+        stats["wall_time"] = time.perf_counter() - counter
+        return {
+            "stdout": retvals[0],
+            "stderr": retvals[1],
+            "returncode": proc.returncode,
+            "stats": stats,
+        }
+
+    def __getattr__(self, nco_command):
+
+        # act normal if this is not an nco operator
+        if nco_command not in self.nco.operators:
+            raise AttributeError("Unknown operator: {0}".format(nco_command))
+
+        nco = self.nco
+
+        async def get(input, **kwargs):
+            if nco_command == "ncatted":
+                # the -a switches beyond the argument size limit, as in Nco
+                calls = nco.ncatted_parts(input, kwargs)
+                if calls is not None:
+                    for call_input, call_kwargs in calls:
+                        result = await get(call_input, **call_kwargs)
+                    return result
+            nco_call = nco.build_call(nco_command, input, kwargs)
+            if nco_call["stream"] is not None:
+                raise TypeError("The asyncio operators don't stream, use stream=None")
+            retvals = nco.cache_lookup(nco_call)
+            if retvals is None:
+                retvals = await self.call(
+                    nco_call["cmd"],
+                    inputs=nco_call["input"],
+                    environment=nco_call["environment"],
+                    use_shell=nco_call["use_shell"],
+                )
+            return nco.finish_call(nco_call, retvals)
+
+        get.__name__ = nco_command
+        return get
@@ -0,0 +1,186 @@
+"""
+cache module:
+On-disk cache of operator results, opt in with Nco(cache=ResultCache()).
+
+A result is keyed on the NCO command (without its output file), the NCO
+version and the identity of every file the command reads: path, size and
+modification time or, optionally, a hash of the content.  Changing an input
+therefore changes the key; stale entries age out of the cache, which removes
+the least recently used entries once it exceeds max_bytes.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+def cache_dir(*parts):
+    """
+    Directory for the persistent caches of pynco: $PYNCO_CACHE_DIR or
+    $XDG_CACHE_HOME/pynco (default: ~/.cache/pynco)
+    """
+    if "PYNCO_CACHE_DIR" in os.environ:
+        base = os.environ["PYNCO_CACHE_DIR"]
+    else:
+        base = os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "pynco",
+        )
+    return os.path.join(base, *parts)
+
+
+class ResultCache(object):
+    """
+    content addressed store of operator outputs and printed text
+
+    :param directory: location of the store (default: cache_dir("results"))
+    :param max_bytes: total size of the store (default: no limit)
+    :param hash_content: identify inputs by a hash of their content instead
+        of their size and modification time
+    :param max_hashes: number of content hashes kept in memory
+    """
+
+    def __init__(
+        self, directory=None, max_bytes=None, hash_content=False, max_hashes=1024
+    ):
+        if directory is None:
+            directory = cache_dir("results")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.max_hashes = max_hashes
+        # (path, size, mtime) -> hash of the content
+        self.hashes = collections.OrderedDict()
+        self.lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def file_identity(self, path):
+        stat = os.stat(path)
+        identity = [os.path.abspath(path), stat.st_size]
+        if not self.hash_content:
+            return identity + [stat.st_mtime_ns]
+
+        stamp = (identity[0], stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            content_hash = self.hashes.get(stamp)
+            if content_hash is not None:
+                self.hashes.move_to_end(stamp)
+                return [stat.st_size, content_hash]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2 ** 20), b""):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+        with self.lock:
+            self.hashes[stamp] = content_hash
+            self.hashes.move_to_end(stamp)
+            while len(self.hashes) > self.max_hashes:
+                self.hashes.popitem(last=False)
+        return [stat.st_size, content_hash]
+
+    def key(self, cmd, version):
+        """
+        Key of cmd, a fully built NCO command with its output left out.
+        Every argument naming an existing file is identified by its content.
+        """
+        files = [self.file_identity(piece) for piece in cmd if os.path.isfile(piece)]
+        blob = json.dumps([list(cmd), version, files])
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def entry(self, key, kind):
+        return os.path.join(self.directory, "{0}.{1}".format(key, kind))
+
+    def lookup(self, key, kind):
+        path = self.entry(key, kind)
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get(self, key):
+        """Path of the stored output file for key, or None"""
+        return self.lookup(key, "nc")
+
+    def get_stdout(self, key):
+        """Stored printed text for key, or None"""
+        path = self.lookup(key, "out")
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def store(self, key, kind, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, self.entry(key, kind))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def put(self, key, path):
+        """Store a copy of the output file path"""
+
+        def write(f):
+            with open(path, "rb") as src:
+                shutil.copyfileobj(src, f, 2 ** 20)
+
+        self.store(key, "nc", write)
+
+    def put_stdout(self, key, stdout):
+        self.store(key, "out", lambda f: f.write(stdout))
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".nc", ".out")):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    @property
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove the least recently used entries to stay within max_bytes"""
+        if self.max_bytes is None:
+            return
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,164 @@
+"""
+cf module:
+Masking and unpacking of variables following the CF conventions.
+
+Values equal to _FillValue or missing_value, outside valid_min, valid_max
+or valid_range, or equal to the default netCDF fill value (if there is no
+_FillValue, not for bytes) are masked.  Packed data is unpacked with
+scale_factor and add_offset, into the type of those attributes unless
+another dtype is asked for.  _Unsigned = "true" marks unsigned integers in
+signed types.
+
+The variable is read block by block into a preallocated result and mask,
+so next to the result only one block of raw values and its mask are held.
+"""
+
+import numpy as np
+
+# default fill values of netCDF, by numpy type
+DEFAULT_FILL_VALUES = {
+    "i2": -32767,
+    "u2": 65535,
+    "i4": -2147483647,
+    "u4": 4294967295,
+    "i8": -9223372036854775806,
+    "u8": 18446744073709551614,
+    "f4": 9.969209968386869e36,
+    "f8": 9.969209968386869e36,
+}
+
+# bytes of raw values read at a time
+BLOCK_BYTES = 2 ** 24
+
+
+def variable_attributes(variable):
+    """Attributes of a netCDF4 or scipy.io.netcdf variable as a dict"""
+    if hasattr(variable, "ncattrs"):
+        return dict((name, variable.getncattr(name)) for name in variable.ncattrs())
+    return dict(variable._attributes)
+
+
+def is_true(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    return str(value).lower() == "true"
+
+
+def raw_dtype(dtype, attributes):
+    """Type of the raw values of a variable, respecting _Unsigned"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "i" and is_true(attributes.get("_Unsigned", False)):
+        return np.dtype(dtype.str.replace("i", "u"))
+    return dtype
+
+
+def raw_attribute(value, dtype):
+    """
+    Values of a fill or valid attribute as values of the raw dtype:  signed
+    attributes of _Unsigned variables are taken as their unsigned bits
+    """
+    values = np.ravel(value)
+    if dtype.kind == "u" and values.dtype.kind == "i":
+        signed = np.dtype(dtype.str.replace("u", "i"))
+        values = values.astype(signed).view(dtype)
+    return values
+
+
+def unpacked_dtype(dtype, attributes):
+    """Type of the unpacked values: the one of scale_factor/add_offset"""
+    for name in ("scale_factor", "add_offset"):
+        if name in attributes:
+            return np.asarray(attributes[name]).dtype
+    return np.dtype(dtype).newbyteorder("=")
+
+
+def unpack(raw, attributes, out, mask):
+    """
+    Mask and unpack the raw (packed) values into the arrays out and mask,
+    which have the shape of raw.
+    """
+    raw = np.asarray(raw)
+    if raw.dtype.kind in "SUO":
+        # characters and strings are taken as they are
+        out[...] = raw
+        mask[...] = False
+        return
+
+    raw = raw.view(raw_dtype(raw.dtype, attributes))
+    fill_values = []
+    for name in ("_FillValue", "missing_value"):
+        if name in attributes:
+            fill_values.extend(raw_attribute(attributes[name], raw.dtype).tolist())
+    if "_FillValue" not in attributes:
+        fill_value = DEFAULT_FILL_VALUES.get(raw.dtype.str[1:])
+        if fill_value is not None:
+            fill_values.append(fill_value)
+
+    valid_min = valid_max = None
+    if "valid_min" in attributes:
+        valid_min = raw_attribute(attributes["valid_min"], raw.dtype)[0]
+    if "valid_max" in attributes:
+        valid_max = raw_attribute(attributes["valid_max"], raw.dtype)[0]
+    if "valid_range" in attributes:
+        valid_min, valid_max = raw_attribute(attributes["valid_range"], raw.dtype)[:2]
+
+    # one boolean temporary, or'ed into mask condition by condition
+    mask[...] = False
+    condition = np.empty(raw.shape, dtype=bool)
+    for fill_value in fill_values:
+        if fill_value != fill_value:
+            # NaN
+            np.isnan(raw, out=condition)
+        else:
+            np.equal(raw, fill_value, out=condition)
+        mask |= condition
+    if valid_min is not None:
+        np.less(raw, valid_min, out=condition)
+        mask |= condition
+    if valid_max is not None:
+        np.greater(raw, valid_max, out=condition)
+        mask |= condition
+
+    scale_factor = attributes.get("scale_factor")
+    add_offset = attributes.get("add_offset")
+    if scale_factor is not None:
+        np.multiply(raw, out.dtype.type(scale_factor), out=out, casting="unsafe")
+    else:
+        out[...] = raw
+    if add_offset is not None:
+        out += out.dtype.type(add_offset)
+
+
+def read_masked(variable, attributes=None, dtype=None, block_bytes=BLOCK_BYTES):
+    """
+    Return the CF masked and unpacked data of variable (netCDF4 or
+    scipy.io.netcdf) as a masked array of dtype (default: see
+    unpacked_dtype).  The variable must deliver raw values, i.e. without
+    masking and scaling of netCDF4.
+    """
+    if attributes is None:
+        attributes = variable_attributes(variable)
+    source_dtype = getattr(variable, "dtype", None)
+    if source_dtype is None:
+        source_dtype = variable.data.dtype
+    if source_dtype is str:
+        # variable length strings
+        dtype = object
+    elif dtype is None:
+        dtype = unpacked_dtype(raw_dtype(source_dtype, attributes), attributes)
+
+    shape = tuple(variable.shape)
+    out = np.empty(shape, dtype=dtype)
+    mask = np.empty(shape, dtype=bool)
+    if not shape:
+        unpack(variable[...], attributes, out, mask)
+    else:
+        row_size = int(np.prod(shape[1:], dtype=np.int64))
+        rows = max(1, block_bytes // max(row_size * np.dtype(dtype).itemsize, 1))
+        for start in range(0, shape[0], rows):
+            block = slice(start, start + rows)
+            unpack(variable[block], attributes, out[block], mask[block])
+
+    if not mask.any():
+        mask = np.ma.nomask
+    return np.ma.MaskedArray(out, mask=mask, copy=False)
@@ -0,0 +1,273 @@
+"""
+coordinates module:
+Value bounds of hyperslabs (-d) resolved to indices with cached coordinates.
+
+    nco = Nco(coordinates=CoordinateIndex(sidecar=True))
+    nco.ncks(input="in.nc", output="out.nc", options=[Limit("lat", -30.0, 30.0)])
+
+Given float bounds, NCO reads and scans the coordinate on every call.  The
+index reads each coordinate once per version (mtime, size and inode) of a
+file and keeps it in memory, optionally also in a sidecar file, and finds
+the indices of the bounds by binary search.  The call then gets an index
+hyperslab selecting the same elements:  those within the bounds,
+inclusive, of monotonic increasing or decreasing coordinates.  Bounds of
+longitudes (cyclic coordinates) outside the range of the coordinate are
+taken modulo 360 and a start beyond the end wraps around, as NCO does with
+wrapped coordinates.
+
+Limits of calls with several input files are left to NCO, as are bounds
+selecting nothing and coordinates that aren't monotonic.
+"""
+
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from .custom import Limit, LimitSingle
+
+# units of longitudes after CF
+LONGITUDE_UNITS = (
+    "degrees_east",
+    "degree_east",
+    "degree_e",
+    "degrees_e",
+    "degreee",
+    "degreese",
+)
+PERIOD = 360.0
+
+
+def file_stamp(path):
+    """Version of the file path, as the HandlePool tells changed files"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def is_cyclic(variable):
+    """Whether the coordinate variable holds longitudes"""
+    attributes = dict(
+        (name, getattr(variable, name, "")) for name in ("standard_name", "units")
+    )
+    if isinstance(attributes["units"], bytes):
+        attributes["units"] = attributes["units"].decode("utf-8", "replace")
+    if isinstance(attributes["standard_name"], bytes):
+        attributes["standard_name"] = attributes["standard_name"].decode(
+            "utf-8", "replace"
+        )
+    return (
+        attributes["standard_name"] == "longitude"
+        or str(attributes["units"]).lower() in LONGITUDE_UNITS
+    )
+
+
+def index_range(values, srt=None, end=None, cyclic=False):
+    """
+    (first, last) index of the elements of the monotonic values within
+    [srt, end], first > last for a range wrapping around the end of a
+    cyclic coordinate.  None if no element is within the bounds.
+    """
+    size = len(values)
+    if not size:
+        return None
+    decreasing = size > 1 and values[0] > values[-1]
+    if decreasing:
+        values = values[::-1]
+
+    wrapped = False
+    if cyclic and srt is not None and end is not None:
+        if end - srt >= PERIOD:
+            return (0, size - 1)
+        base = values[0]
+        srt = base + (srt - base) % PERIOD
+        end = base + (end - base) % PERIOD
+        wrapped = srt > end
+
+    first = 0 if srt is None else int(np.searchsorted(values, srt, side="left"))
+    last = size - 1
+    if end is not None:
+        last = int(np.searchsorted(values, end, side="right")) - 1
+
+    if wrapped:
+        # the elements from first on and those up to last
+        if first == size and last < 0:
+            return None
+        if first == size:
+            first = 0
+        elif last < 0:
+            last = size - 1
+    elif first > last:
+        return None
+
+    if decreasing:
+        first, last = size - 1 - last, size - 1 - first
+    return (first, last)
+
+
+def nearest_index(values, value):
+    """Index of the element of the monotonic values nearest to value"""
+    size = len(values)
+    decreasing = size > 1 and values[0] > values[-1]
+    if decreasing:
+        values = values[::-1]
+    index = int(np.searchsorted(values, value))
+    if index == size or (
+        index > 0 and value - values[index - 1] <= values[index] - value
+    ):
+        index -= 1
+    return size - 1 - index if decreasing else index
+
+
+def is_monotonic(values):
+    steps = np.diff(values)
+    return bool(np.all(steps > 0) or np.all(steps < 0))
+
+
+class CoordinateIndex(object):
+    """
+    coordinates of files, read once per file version
+
+    :param sidecar: also keep the coordinates of a file in a sidecar file:
+        True for a hidden file next to it, a directory name to keep them
+        there (default: memory only)
+    :param max_coordinates: number of coordinates kept in memory
+    """
+
+    def __init__(self, sidecar=None, max_coordinates=1024):
+        self.sidecar = sidecar
+        self.max_coordinates = max_coordinates
+        # (path, name) -> (stamp, values, cyclic, monotonic)
+        self.entries = collections.OrderedDict()
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def sidecar_path(self, path):
+        """Path of the sidecar of the file path, None without sidecars"""
+        if not self.sidecar:
+            return None
+        path = os.path.abspath(path)
+        if self.sidecar is True:
+            directory, name = os.path.split(path)
+            return os.path.join(directory, ".{0}.coordinates.npz".format(name))
+        digest = hashlib.sha256(path.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.sidecar, "{0}.npz".format(digest))
+
+    def read_sidecar(self, path, name, stamp):
+        sidecar = self.sidecar_path(path)
+        if sidecar is None or not os.path.isfile(sidecar):
+            return None
+        try:
+            with np.load(sidecar) as arrays:
+                if tuple(arrays["stamp"]) != stamp:
+                    return None
+                flags = arrays["flags_" + name]
+                return arrays["values_" + name], bool(flags[0]), bool(flags[1])
+        except (OSError, ValueError, KeyError):
+            # damaged or written by another version
+            return None
+
+    def write_sidecar(self, path, stamp):
+        """Write the coordinates of path in memory to its sidecar"""
+        sidecar = self.sidecar_path(path)
+        if sidecar is None:
+            return
+        path = os.path.abspath(path)
+        arrays = {"stamp": np.array(stamp, dtype=np.int64)}
+        with self.lock:
+            for (entry_path, name), entry in self.entries.items():
+                if entry_path == path and entry[0] == stamp:
+                    arrays["values_" + name] = entry[1]
+                    arrays["flags_" + name] = np.array(entry[2:])
+        try:
+            directory = os.path.dirname(sidecar)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_file, sidecar)
+        except OSError:
+            # e.g. a read-only data directory, the memory still serves
+            pass
+
+    def coordinate(self, path, name, opener):
+        """
+        (values, cyclic, monotonic) of the coordinate name of the file
+        path, None if it has none.  opener(path) lends a cdf handle, e.g.
+        Nco.dataset.
+        """
+        stamp = file_stamp(path)
+        key = (os.path.abspath(path), name)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return entry[1:]
+
+        coordinate = self.read_sidecar(path, name, stamp)
+        if coordinate is None:
+            with opener(path) as file_handle:
+                variable = file_handle.variables.get(name)
+                if variable is None or len(variable.dimensions) != 1:
+                    return None
+                values = np.array(variable[:], dtype=np.float64)
+                coordinate = (values, is_cyclic(variable), is_monotonic(values))
+            new = True
+        else:
+            new = False
+
+        with self.lock:
+            self.entries[key] = (stamp,) + coordinate
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_coordinates:
+                self.entries.popitem(last=False)
+        if new:
+            self.write_sidecar(path, stamp)
+        return coordinate
+
+    def resolve(self, path, limit, opener):
+        """
+        The index Limit selecting what the value bounds of limit select in
+        the file path, limit itself if it has no value bounds or they can't
+        be resolved
+        """
+        if not isinstance(limit, Limit):
+            return limit
+        srt = limit.srt if isinstance(limit.srt, float) else None
+        end = limit.end if isinstance(limit.end, float) else None
+        if srt is None and end is None:
+            return limit
+        if (srt is None and limit.srt != "") or (end is None and limit.end != ""):
+            # index and value bounds mixed
+            return limit
+
+        coordinate = self.coordinate(path, limit.dmn_name, opener)
+        if coordinate is None:
+            return limit
+        values, cyclic, monotonic = coordinate
+        if not monotonic or not len(values):
+            return limit
+        if isinstance(limit, LimitSingle):
+            # NCO takes the element nearest to a single value
+            return LimitSingle(limit.dmn_name, nearest_index(values, srt))
+        if srt is not None and end is not None and srt > end and not cyclic:
+            return limit
+
+        indices = index_range(values, srt, end, cyclic)
+        if indices is None:
+            return limit
+        return Limit(limit.dmn_name, indices[0], indices[1], limit.srd, limit.drn)
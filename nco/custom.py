@@ -5,10 +5,13 @@ It contains wrappers to the most common NCO command line switches.
 This makes it more easy for users to specify strings and literals
 
 Atted - wrapper for -a swtch in ncatted
+AttedBulk - many -a switches of ncatted at once
 Limit/LimtSingle - wrapper to -d switch
 Rename - wrapper for -a, -v, -d, -g switches in ncrename
 """
 
+import collections
+import copy
 import os
 import numpy as np
 
@@ -104,6 +107,9 @@ NP_TYPESNP = dict(
     }
 )
 
+# types of values given without stype, as Atted converts them
+DEFAULT_TYPES = {int: np.int32, float: np.float64, str: str}
+
 __prog__ = os.path.splitext(os.path.basename(__file__))[0]
 
 
@@ -265,6 +271,211 @@ class Atted(object):
         ]
 
 
+def column(values, size, name):
+    """values as an array of str with an entry per attribute"""
+    values = np.asarray(values, dtype=str)
+    if values.ndim == 0:
+        return np.full(size, values)
+    if values.shape != (size,):
+        raise ValueError("{0} needs a single value or one per attribute".format(name))
+    return values
+
+
+def value_kind(value):
+    """The type deciding how value is converted, (list, type) for iterables"""
+    if isinstance(value, str):
+        return str
+    if isinstance(value, (list, tuple, range, np.ndarray)):
+        return (list, value_kind(next(iter(value), None)))
+    return type(value)
+
+
+def format_values(array, stype, listed):
+    """
+    The type character and the value strings of an array with a value (a row
+    of values if listed) per attribute, converted as Atted does
+    """
+    if stype:
+        try:
+            np_type = NP_TYPESNP[stype]
+        except KeyError:
+            raise KeyError(
+                'specified Type "{0}" not found.\nValid '
+                "values {1}\n".format(stype, NP_TYPES.keys())
+            )
+    elif array.dtype.kind in "US":
+        np_type = str
+    else:
+        np_type = array.dtype.type
+        if str(np.dtype(np_type)) not in NP_TYPES:
+            raise KeyError(
+                'The type of value "{0}" is NOT valid\nValid '
+                "values {1}\n".format(np_type, NP_TYPES.keys())
+            )
+
+    if np_type is str:
+        type_char = "sng" if listed or stype in ["string", "sng"] else "c"
+        text = array.astype(str)
+    else:
+        type_char = NP_TYPES[str(np.dtype(np_type))]
+        text = array.astype(np_type).astype(str)
+
+    if listed:
+        # join the values of every row
+        joined = text[:, 0]
+        for i in range(1, text.shape[1]):
+            joined = np.char.add(np.char.add(joined, ","), text[:, i])
+        text = joined
+    return type_char, text
+
+
+class AttedBulk(object):
+    """
+    many -a switches of ncatted, built from columns in vectorized passes
+
+    mode, att_name, var_name and stype are a single value or a sequence with
+    an entry per attribute, value is a sequence with an entry per attribute:
+    a numpy array (2-D for several values per attribute) keeps its type, the
+    entries of a list are converted as in Atted and may differ in type or be
+    lists themselves.  Rows of the same type and stype are formatted at once.
+    """
+
+    def __init__(
+        self, mode="overwrite", att_name=None, var_name="", value=None, stype=None
+    ):
+        if att_name is None:
+            raise ValueError("att_name is required")
+        att_name = np.atleast_1d(np.asarray(att_name, dtype=str))
+        if np.any(np.char.str_len(att_name) == 0):
+            raise ValueError("att_name is required")
+        size = len(att_name)
+
+        modes, inverse = np.unique(column(mode, size, "mode"), return_inverse=True)
+        mode_chars = []
+        for name in modes:
+            if name in VALID_MODES:
+                mode_chars.append(VALID_MODES[name])
+            elif name in VALID_MODES.values():
+                mode_chars.append(str(name))
+            else:
+                raise KeyError('mode "{0}" not found'.format(name))
+
+        self.att_name = att_name
+        self.var_name = column(var_name, size, "var_name")
+        self.mode = np.array(mode_chars, dtype=str)[inverse.reshape(-1)]
+        stypes = column("" if stype is None else stype, size, "stype")
+        self.type_char, self.text = self.format_values(value, stypes)
+
+    @classmethod
+    def from_mapping(cls, attributes, mode="overwrite", stype=None):
+        """
+        Build from a mapping {var_name: {att_name: value}}, "global" for
+        the global attributes
+        """
+        var_names, att_names, values = [], [], []
+        for var_name, atts in attributes.items():
+            for att_name, value in atts.items():
+                var_names.append(var_name)
+                att_names.append(att_name)
+                values.append(value)
+        return cls(mode, att_names, var_names, values, stype)
+
+    def __len__(self):
+        return len(self.att_name)
+
+    def __getitem__(self, index):
+        """The attributes index (a slice or an index array) selects"""
+        part = copy.copy(self)
+        for name in ("att_name", "var_name", "mode", "type_char", "text"):
+            setattr(part, name, getattr(self, name)[index])
+        return part
+
+    def format_values(self, value, stypes):
+        """The type characters and value strings of the attributes"""
+        size = len(self)
+        type_char = np.full(size, "", dtype="U3")
+        text = np.full(size, "", dtype=object)
+        # dont bother about type & value of deletions
+        rows = np.flatnonzero(self.mode != "d")
+        if not len(rows):
+            return type_char, text.astype(str)
+        if value is None:
+            raise ValueError("value is required unless the mode is delete")
+        if len(value) != size:
+            raise ValueError("value needs one entry per attribute")
+
+        # rows formatted at once, by (type, stype)
+        groups = collections.OrderedDict()
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            for stype in np.unique(stypes[rows]):
+                groups[(None, stype)] = rows[stypes[rows] == stype]
+        else:
+            values = np.empty(size, dtype=object)
+            for i, v in enumerate(value):
+                values[i] = v
+            for i in rows:
+                key = (value_kind(values[i]), stypes[i])
+                groups.setdefault(key, []).append(i)
+
+        for (kind, stype), selected in groups.items():
+            selected = np.asarray(selected)
+            if kind is None:
+                array, listed = value[selected], value.ndim > 1
+            else:
+                listed = isinstance(kind, tuple)
+                item_kind = kind[1] if listed else kind
+                dtype = None if stype else DEFAULT_TYPES.get(item_kind, item_kind)
+                try:
+                    array = np.array(values[selected].tolist(), dtype=dtype)
+                except ValueError:
+                    # lists of different lengths, formatted one by one
+                    for i in selected:
+                        array = np.array([values[i]], dtype=dtype)
+                        type_char[i], text[i] = format_values(array, stype, True)
+                    continue
+            type_char[selected], text[selected] = format_values(array, stype, listed)
+        return type_char, text.astype(str)
+
+    def arguments(self):
+        """The values of the -a switches, as an array"""
+        arguments = self.att_name
+        for part in (self.var_name, self.mode, self.type_char, self.text):
+            arguments = np.char.add(np.char.add(arguments, ","), part)
+        return arguments
+
+    def prn_option(self):
+        options = np.empty(2 * len(self), dtype=object)
+        options[0::2] = "-a"
+        options[1::2] = self.arguments().tolist()
+        return options.tolist()
+
+    def split(self, limit=None):
+        """
+        Split into parts whose -a switches fit into limit bytes of
+        arguments, by default the argument size limit (ARG_MAX) less room
+        for the operator, its files, other options and the environment
+        """
+        if limit is None:
+            from .nco import ARG_MAX, argument_bytes
+
+            limit = ARG_MAX - argument_bytes([], None) - 2 ** 14
+        from .nco import POINTER_BYTES
+
+        encoded = np.char.encode(self.arguments(), "utf-8")
+        # "-a" and the value, with their terminating nulls and pointers
+        sizes = np.char.str_len(encoded) + 4 + 2 * POINTER_BYTES
+        total = np.cumsum(sizes)
+
+        parts, start = [], 0
+        while start < len(self):
+            offset = total[start - 1] if start else 0
+            end = int(np.searchsorted(total, offset + limit, side="right"))
+            end = max(end, start + 1)
+            parts.append(self[start:end])
+            start = end
+        return parts
+
+
 class Limit(object):
     """
     wrapper to the NCO command-line hyperslab option
@@ -0,0 +1,196 @@
+"""
+dump module:
+Fast parsing of the data that ncks prints (-H, -P, ...) into numpy arrays.
+
+Three layouts are understood:
+
+- CDL, the default of recent NCO versions:  "data:" followed by
+  "name = v1, v2, ... ;" blocks
+- traditional (--trd):  one value per line, "time[3]=4 lat[1]=-45 T[13]=273.1"
+  where the last "name[index]=value" of a line is the printed variable
+- bare values (--no_nm_prn, -s "%f\\n"):  numbers separated by whitespace or
+  commas, these belong to a single variable
+
+The values are located with array operations on the whole dump (no loop
+over lines) and converted to numbers in bulk by numpy.fromstring, a few
+million values take a fraction of a second.  The traditional layout prints
+several times as much text per value and takes correspondingly longer.
+Missing values printed as "_" become NaN.
+"""
+
+import re
+
+import numpy as np
+
+CDL_DATA = re.compile(rb"^\s*data:\s*$", re.MULTILINE)
+CDL_STRING = re.compile(rb'"((?:[^"\\]|\\.)*)"')
+# a string, possibly unclosed, or the ";" ending the values of a variable
+CDL_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"?|;', re.DOTALL)
+CDL_ESCAPE = re.compile(rb'\\(["\\])')
+COMMENT = re.compile(rb"//[^\n]*")
+MISSING = re.compile(rb"_(?<![^\s,]_)(?![^\s,;])")
+
+
+def to_bytes(text):
+    if isinstance(text, str):
+        return text.encode("utf-8")
+    return bytes(text)
+
+
+def to_strings(tokens):
+    return np.char.decode(np.array(tokens, dtype=bytes), "utf-8")
+
+
+def parse_values(text, dtype=np.float64, count=None):
+    """
+    Parse bare values separated by whitespace or commas into a 1-D array.
+    Tokens that are not numeric make it an array of strings.
+    """
+    text = to_bytes(text)
+    if b"," in text:
+        text = text.replace(b",", b" ")
+    if b"_" in text:
+        text = MISSING.sub(b"nan", text)
+    if count is None:
+        count = len(text.split())
+    try:
+        values = np.fromstring(text, dtype=dtype, sep=" ")
+    except ValueError:
+        values = None
+    if values is None or values.size != count:
+        return to_strings(text.split())
+    return values
+
+
+def gather(buf, starts, ends, fill=b" "):
+    """
+    Cut the spans buf[starts:ends] out of buf into the rows of a 2-D array,
+    padded with fill.  Works column by column, the spans are short.
+    """
+    lengths = ends - starts
+    width = int(lengths.max()) + 1
+    out = np.full((starts.size, width), ord(fill), dtype=np.uint8)
+    for column in range(width - 1):
+        inside = lengths > column
+        out[inside, column] = buf[starts[inside] + column]
+    return out
+
+
+def parse_trd(text, dtype=np.float64):
+    if not text.endswith(b"\n"):
+        text += b"\n"
+    buf = np.frombuffer(text, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == ord("\n"))
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    filled = newlines > line_starts
+    newlines, line_starts = newlines[filled], line_starts[filled]
+
+    # the printed value is the last "name[index]=value" on every line
+    equals = np.flatnonzero(buf == ord("="))
+    last = np.searchsorted(equals, newlines) - 1
+    valid = last >= 0
+    valid[valid] = equals[last[valid]] > line_starts[valid]
+    equals = equals[last[valid]]
+    newlines, line_starts = newlines[valid], line_starts[valid]
+    valid = buf[equals - 1] == ord("]")
+    equals = equals[valid]
+    if equals.size == 0:
+        return {}
+
+    # "name[index]=value" is delimited by whitespace
+    separators = np.flatnonzero(buf <= ord(" "))
+    following = np.searchsorted(separators, equals)
+    value_ends = separators[following]
+    name_starts = np.where(following > 0, separators[following - 1] + 1, 0)
+
+    values = parse_values(
+        gather(buf, equals + 1, value_ends).tobytes(), dtype, count=equals.size
+    )
+    names = gather(buf, name_starts, equals, fill=b"\0")
+    # blank out the "[index]"
+    brackets = (names == ord("[")).argmax(axis=1)
+    names[np.arange(names.shape[1]) >= brackets[:, None]] = 0
+    names = names.view("S{0}".format(names.shape[1])).ravel()
+
+    # variables are printed one after the other, group their runs
+    result = {}
+    runs = np.concatenate(([0], np.flatnonzero(names[1:] != names[:-1]) + 1))
+    bounds = np.append(runs, names.size)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        name = names[start].decode("utf-8")
+        result.setdefault(name, []).append(values[start:end])
+    return dict(
+        (name, chunks[0] if len(chunks) == 1 else np.concatenate(chunks))
+        for name, chunks in result.items()
+    )
+
+
+def parse_cdl(text, dtype=np.float64):
+    data = text[CDL_DATA.search(text).end():]
+    data = data[:data.rfind(b"}")]
+    result = {}
+    pos = 0
+    while True:
+        equal = data.find(b"=", pos)
+        if equal < 0:
+            break
+        name = data[pos:equal].split()[-1].decode("utf-8")
+        # a ";" inside a string doesn't end the values
+        end = len(data)
+        for token in CDL_TOKEN.finditer(data, equal):
+            if token.group() == b";":
+                end = token.start()
+                break
+        body = data[equal + 1:end]
+        if b'"' in body:
+            strings = CDL_STRING.findall(body)
+            result[name] = np.array(
+                [CDL_ESCAPE.sub(rb"\1", s).decode("utf-8") for s in strings]
+            )
+        else:
+            if b"//" in body:
+                body = COMMENT.sub(b"", body)
+            result[name] = parse_values(body, dtype)
+        pos = data.find(b"\n", end) + 1
+        if pos == 0:
+            break
+    return result
+
+
+def parse_dump(text, var_names=None, shapes=None, dtype=np.float64):
+    """
+    Parse the data printed by ncks into a dict mapping variable names to
+    numpy arrays.  Numeric data is converted to dtype.
+
+    :param text: stdout of ncks, bytes or str
+    :param var_names: variable name for bare values (which carry no names),
+        or a list of the variables to return
+    :param shapes: dict of shapes to reshape the (flat) arrays to
+    :param dtype: numpy type of numeric data (default: float64)
+    :return: dict
+    """
+    text = to_bytes(text)
+    if text.lstrip().startswith(b"netcdf"):
+        result = parse_cdl(text, dtype)
+    elif b"]=" in text:
+        result = parse_trd(text, dtype)
+    else:
+        if isinstance(var_names, str):
+            name = var_names
+        elif var_names is not None and len(var_names) == 1:
+            name = var_names[0]
+        else:
+            raise ValueError(
+                "Bare values carry no variable name, give exactly one in var_names"
+            )
+        result = {name: parse_values(text, dtype)}
+
+    if var_names is not None:
+        if isinstance(var_names, str):
+            var_names = [var_names]
+        result = dict((name, result[name]) for name in var_names)
+    if shapes:
+        for name, shape in shapes.items():
+            if name in result:
+                result[name] = result[name].reshape(shape)
+    return result
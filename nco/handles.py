@@ -0,0 +1,145 @@
+"""
+handles module:
+Pool of open netCDF handles, so repeated reads of a file don't open it and
+parse its metadata again.
+
+    pool = HandlePool(max_open=32)
+    with pool.borrow("out.nc", "r", netCDF4.Dataset) as dataset:
+        data = dataset.variables["T"][:]
+
+Handles are kept per path and mode.  A file that changed on disk (mtime,
+size or inode) is opened again, and the least recently used handles are
+closed once more than max_open are open.  Handles that are lent out are
+never closed under their borrower.
+"""
+
+import collections
+import contextlib
+import os
+import threading
+
+
+class HandlePool(object):
+    """
+    LRU pool of open file handles
+
+    :param max_open: number of handles kept open (default: 64)
+    """
+
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        # (path, mode) -> [handle, stamp, number of borrowers]
+        self.entries = collections.OrderedDict()
+        # handles of changed files waiting for their borrowers
+        self.retired = {}
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        # open handles belong to this process, a copy starts out empty
+        state = self.__dict__.copy()
+        state["entries"] = collections.OrderedDict()
+        state["retired"] = {}
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    @contextlib.contextmanager
+    def borrow(self, path, mode, opener):
+        """
+        Lend the handle of path opened in mode, opening it with
+        opener(path, mode) if the pool has none or the file has changed.
+        """
+        handle = self.acquire(path, mode, opener)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def acquire(self, path, mode, opener):
+        key = (os.path.abspath(path), mode)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] != stamp:
+                self.discard(key)
+                entry = None
+            if entry is None:
+                entry = [opener(path, mode), stamp, 0]
+                self.entries[key] = entry
+            entry[2] += 1
+            self.entries.move_to_end(key)
+            self.evict()
+            return entry[0]
+
+    def release(self, handle):
+        with self.lock:
+            if id(handle) in self.retired:
+                entry = self.retired[id(handle)]
+                entry[2] -= 1
+                if entry[2] == 0:
+                    del self.retired[id(handle)]
+                    close(handle)
+                return
+            for entry in self.entries.values():
+                if entry[0] is handle:
+                    entry[2] -= 1
+                    break
+            self.evict()
+
+    def discard(self, key):
+        """Drop the handle of key, closing it as soon as nobody uses it"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return
+            if entry[2] > 0:
+                self.retired[id(entry[0])] = entry
+            else:
+                close(entry[0])
+
+    def evict(self):
+        """Close the least recently used idle handles beyond max_open"""
+        with self.lock:
+            excess = len(self.entries) - self.max_open
+            for key in list(self.entries):
+                if excess <= 0:
+                    break
+                if self.entries[key][2] == 0:
+                    self.discard(key)
+                    excess -= 1
+
+    def invalidate(self, path):
+        """Drop the handles of path, e.g. before it is rewritten"""
+        path = os.path.abspath(path)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == path]:
+                self.discard(key)
+
+    def close(self):
+        """Close all idle handles, the lent ones once they are released"""
+        with self.lock:
+            for key in list(self.entries):
+                self.discard(key)
+
+
+def close(handle):
+    try:
+        handle.close()
+    except Exception:
+        # e.g. a handle that its user closed already
+        pass
@@ -0,0 +1,409 @@
+"""
+lazy module:
+Deferred ncbo, ncwa and ncap2 calls, optimized as a whole before they run.
+
+    lazy = nco.lazy()
+    anomaly = lazy.ncbo(input=[ifile, climatology], op_typ="sbt")
+    scaled = lazy.ncap2(input=anomaly, options=["-s", "T=T*1.8"])
+    kelvin = lazy.ncap2(input=scaled, options=["-s", "TK=T+273.15"])
+    mean = lazy.ncwa(input=kelvin, average="lon", options=[Limit("lat", 0, 9)])
+    result = mean.compute(output="mean.nc", variables=["TK"])
+
+The calls return Nodes.  compute() optimizes a copy of the graph and runs
+the remaining calls as a Pipeline:
+
+- chains of ncap2 calls become a single call of one script (Ncap2Script)
+- hyperslabs (custom.Limit) of ncwa and ncbo calls move to the ncbo calls
+  they read, which work element by element, so only the hyperslab is read
+  and differenced.  Hyperslabs of dimensions the ncbo calls cut already
+  stay.
+- calls are restricted (-v) to the variables read downstream:  those asked
+  for, the ones ncap2 scripts read and the weights and masks of ncwa
+
+ncbo reads two files and ncap2 only one, so ncbo calls are not fused into
+ncap2 scripts.  Intermediate results live in the scratch space.
+"""
+
+import copy
+import shlex
+
+from .custom import Limit
+from .script import Ncap2Script, analyze, attribute_owner, statements
+
+OPERATORS = ("ncap2", "ncbo", "ncwa")
+# operators working element by element on (hyperslabs of) their inputs
+ELEMENTWISE = ("ncbo",)
+
+VARIABLE_OPTIONS = ("-v", "--variable", "--var")
+DIMENSION_OPTIONS = ("-d", "--dimension", "--dmn")
+DIMENSION_KWARGS = ("dimension", "dmn")
+# variables ncwa reads besides the averaged ones
+NCWA_OPTIONS = ("-w", "--weight", "--wgt_var", "-m", "--mask_variable", "--msk_nm")
+NCWA_KWARGS = ("weight", "wgt_var", "mask_variable", "msk_nm")
+
+
+def tokens(options):
+    """The command line pieces of the str options"""
+    pieces = []
+    for option in options:
+        if isinstance(option, str):
+            pieces.extend(shlex.split(option))
+    return pieces
+
+
+def option_values(options, names):
+    """The values of the options names, given as "-x val" or "--x=val" """
+    pieces = tokens(options)
+    values = []
+    for i, piece in enumerate(pieces):
+        if piece in names and i + 1 < len(pieces):
+            values.append(pieces[i + 1])
+        for name in names:
+            if name.startswith("--") and piece.startswith(name + "="):
+                values.append(piece[len(name) + 1:])
+    return values
+
+
+def split_names(values):
+    if isinstance(values, str):
+        values = [values]
+    return set(name for value in values for name in value.split(",") if name)
+
+
+class Node(object):
+    """a deferred operator call, pass it as (part of) the input of others"""
+
+    def __init__(self, lazy, nco_command, input, kwargs):
+        self.lazy = lazy
+        self.nco_command = nco_command
+        self.input = input
+        self.options = list(kwargs.pop("options", None) or [])
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return "Node({0!r})".format(self.nco_command)
+
+    def inputs(self):
+        if isinstance(self.input, (str, Node)):
+            return [self.input]
+        return list(self.input)
+
+    def dependencies(self):
+        return [i for i in self.inputs() if isinstance(i, Node)]
+
+    def selection(self):
+        """The variables the call is restricted to (-v), None for all"""
+        if self.nco_command == "ncap2":
+            # -v of ncap2 is a flag:  only the variables of the script
+            return None
+        values = option_values(self.options, VARIABLE_OPTIONS)
+        variable = self.kwargs.get("variable")
+        if variable:
+            values.extend([variable] if isinstance(variable, str) else variable)
+        return split_names(values) if values else None
+
+    def script(self):
+        """The ncap2 expressions (-s) of the call and its other options"""
+        pieces = []
+        for option in self.options:
+            if isinstance(option, str):
+                pieces.extend(shlex.split(option))
+            else:
+                pieces.append(option)
+
+        expressions, others = [], []
+        while pieces:
+            piece = pieces.pop(0)
+            if isinstance(piece, Ncap2Script):
+                expressions.extend(piece.expressions)
+            elif piece in ("-s", "--spt", "--script") and pieces:
+                expressions.append(pieces.pop(0))
+            elif isinstance(piece, str) and piece.startswith(("--spt=", "--script=")):
+                expressions.append(piece.split("=", 1)[1])
+            else:
+                others.append(piece)
+        return expressions, others
+
+    def compute(self, output=None, variables=None, **kwargs):
+        """
+        Optimize and run the graph of this node.  Returns the result of
+        this node, written to output or a scratch file.
+
+        :param variables: variables of the result that are needed
+        :param kwargs: passed on to the call of this node, e.g. returnArray
+        """
+        return self.lazy.compute(self, output=output, variables=variables, **kwargs)
+
+    def plan(self, variables=None):
+        """The optimized calls as a list of (nco_command, input, options)"""
+        return self.lazy.plan(self, variables=variables)
+
+
+class Lazy(object):
+    """
+    factory of deferred operator calls
+
+    :param nco: Nco instance running the calls
+    """
+
+    def __init__(self, nco):
+        self.nco = nco
+
+    def __getattr__(self, nco_command):
+        if nco_command not in OPERATORS:
+            raise AttributeError(
+                "Only {0} can be deferred, not {1}".format(
+                    ", ".join(OPERATORS), nco_command
+                )
+            )
+
+        def call(input, **kwargs):
+            if "output" in kwargs:
+                raise TypeError("Deferred calls get their output from compute()")
+            return Node(self, nco_command, input, kwargs)
+
+        return call
+
+    def optimize(self, root, variables=None):
+        """Return an optimized copy of the graph of root"""
+        copies = {}
+
+        def copy_node(node):
+            if node not in copies:
+                clone = copy.copy(node)
+                clone.options = list(node.options)
+                clone.kwargs = dict(node.kwargs)
+                copies[node] = clone
+                clone.input = [
+                    copy_node(i) if isinstance(i, Node) else i for i in node.inputs()
+                ]
+                if isinstance(node.input, (str, Node)):
+                    clone.input = clone.input[0]
+            return copies[node]
+
+        root = copy_node(root)
+        self.fuse_scripts(root)
+        readers = self.readers(root)
+        self.push_limits(root, readers)
+        self.restrict_variables(root, readers, variables)
+        return root
+
+    def nodes(self, root):
+        """The nodes of the graph of root, inputs before their readers"""
+        order, seen = [], set()
+
+        def visit(node):
+            if node in seen:
+                return
+            seen.add(node)
+            for dependency in node.dependencies():
+                visit(dependency)
+            order.append(node)
+
+        visit(root)
+        return order
+
+    def readers(self, root):
+        readers = dict((node, 0) for node in self.nodes(root))
+        for node in readers:
+            for dependency in set(node.dependencies()):
+                readers[dependency] += 1
+        return readers
+
+    def fuse_scripts(self, root):
+        """Join every ncap2 call with the ncap2 call it alone reads"""
+        for node in reversed(self.nodes(root)):
+            readers = self.readers(root)
+            while node.nco_command == "ncap2" and node in readers:
+                inner = node.input
+                if not (
+                    isinstance(inner, Node)
+                    and inner.nco_command == "ncap2"
+                    and readers[inner] == 1
+                    and not inner.kwargs
+                ):
+                    break
+                inner_expressions, inner_others = inner.script()
+                if inner_others:
+                    break
+                expressions, others = node.script()
+                script = Ncap2Script(
+                    self.nco, expressions=inner_expressions + expressions
+                )
+                node.options = [script] + others
+                node.input = inner.input
+                readers = self.readers(root)
+
+    def push_limits(self, root, readers):
+        """Move the hyperslabs of ncwa/ncbo calls to the ncbo calls they read"""
+        for node in reversed(self.nodes(root)):
+            if node.nco_command not in ("ncwa",) + ELEMENTWISE:
+                continue
+            limits = [o for o in node.options if isinstance(o, Limit)]
+            sources = node.dependencies()
+            if (
+                not limits
+                or not sources
+                or len(sources) != len(node.inputs())
+                or any(
+                    s.nco_command not in ELEMENTWISE or readers[s] != 1 for s in sources
+                )
+            ):
+                continue
+            # the indices of a hyperslab of a source's output don't count
+            # from the start of its inputs, those limits stay
+            limited = set()
+            for source in sources:
+                limited |= self.hyperslab_dimensions(source)
+            pushed = [limit for limit in limits if limit.dmn_name not in limited]
+            if not pushed:
+                continue
+            node.options = [o for o in node.options if o not in pushed]
+            for source in set(sources):
+                source.options.extend(pushed)
+
+    def hyperslab_dimensions(self, node):
+        """The dimensions node has hyperslabs (-d) of"""
+        values = option_values(node.options, DIMENSION_OPTIONS)
+        values.extend(
+            node.kwargs[key] for key in DIMENSION_KWARGS if node.kwargs.get(key)
+        )
+        names = set(value.split(",")[0] for value in values)
+        names.update(o.dmn_name for o in node.options if isinstance(o, Limit))
+        return names
+
+    def restrict_variables(self, root, readers, variables=None):
+        """Restrict the calls to the variables read downstream (-v)"""
+        # variables needed of the output of every node, None for all
+        needed = dict((node, set()) for node in readers)
+        needed[root] = None if variables is None else split_names(variables)
+
+        available = self.available(root)
+        for node in reversed(self.nodes(root)):
+            wanted = needed[node]
+            if wanted is not None and node.selection() is None:
+                if node.nco_command != "ncap2":
+                    # names from scripts may be no variables at all
+                    names = wanted & available[node]
+                    if names:
+                        node.kwargs["variable"] = ",".join(sorted(names))
+                elif "-v" not in tokens(node.options):
+                    if wanted <= self.script_variables(node)[0]:
+                        node.options.append("-v")
+
+            reads = self.reads(node, wanted)
+            for dependency in node.dependencies():
+                if reads is None or needed[dependency] is None:
+                    needed[dependency] = None
+                else:
+                    needed[dependency] |= reads
+
+    def available(self, root):
+        """The variables of the output of every node (at most)"""
+        files = {}
+
+        def variables(input):
+            if isinstance(input, Node):
+                return available[input]
+            if input not in files:
+                with self.nco.dataset(input) as file_handle:
+                    files[input] = set(file_handle.variables)
+            return files[input]
+
+        available = {}
+        for node in self.nodes(root):
+            names = set()
+            for input in node.inputs():
+                names |= variables(input)
+            if node.nco_command == "ncap2":
+                names |= self.script_variables(node)[0]
+            available[node] = names
+        return available
+
+    def script_variables(self, node):
+        """The variables the script of an ncap2 node defines and reads"""
+        expressions, _ = node.script()
+        defined, reads = set(), set()
+        for expression in expressions:
+            for statement in statements(expression):
+                name, _, statement_reads = analyze(statement)
+                owner = attribute_owner(statement)
+                if owner is not None:
+                    # the variable keeps its attribute
+                    statement_reads = statement_reads | {owner}
+                reads |= statement_reads - defined
+                if name is not None:
+                    defined.add(name)
+        return defined, reads
+
+    def reads(self, node, wanted):
+        """The variables node reads of its inputs, None for all"""
+        if node.nco_command == "ncap2":
+            defined, reads = self.script_variables(node)
+            if "-v" in tokens(node.options):
+                return reads
+            if wanted is None:
+                return None
+            return (wanted - defined) | reads
+
+        selection = node.selection()
+        if selection is None:
+            selection = wanted
+        if selection is None:
+            return None
+        if node.nco_command == "ncwa":
+            selection = selection | split_names(
+                option_values(node.options, NCWA_OPTIONS)
+                + [node.kwargs[k] for k in NCWA_KWARGS if node.kwargs.get(k)]
+            )
+        return selection
+
+    def plan(self, root, variables=None):
+        """The optimized calls of the graph of root, in the order they run"""
+        root = self.optimize(root, variables)
+        nodes = self.nodes(root)
+        return [
+            (
+                node.nco_command,
+                [
+                    "<{0}>".format(nodes.index(i)) if isinstance(i, Node) else i
+                    for i in node.inputs()
+                ],
+                self.options(node),
+            )
+            for node in nodes
+        ]
+
+    def options(self, node):
+        """The options of the call of node as NCO arguments"""
+        args = []
+        for option in node.options:
+            if isinstance(option, str):
+                args.extend(shlex.split(option))
+            elif isinstance(option, Ncap2Script):
+                args.extend(["-s", "; ".join(option.expressions)])
+            elif hasattr(option, "prn_option"):
+                args.extend(option.prn_option())
+            else:
+                args.extend(option)
+        for key, value in sorted(node.kwargs.items()):
+            args.append("--{0}={1}".format(key, value))
+        return args
+
+    def compute(self, root, output=None, variables=None, **kwargs):
+        root = self.optimize(root, variables)
+        pipe = self.nco.pipeline()
+        steps = {}
+        for node in self.nodes(root):
+            input = [steps[i] if isinstance(i, Node) else i for i in node.inputs()]
+            if isinstance(node.input, (str, Node)):
+                input = input[0]
+            node_kwargs = dict(node.kwargs, options=node.options)
+            if node is root:
+                node_kwargs.update(kwargs)
+                steps[node] = pipe.add(
+                    node.nco_command, input, output=output, name="result", **node_kwargs
+                )
+            else:
+                steps[node] = pipe.add(node.nco_command, input, **node_kwargs)
+        return pipe.run()["result"]
@@ -0,0 +1,182 @@
+"""
+memmap module:
+Zero-copy access to the variables of netCDF3 files (classic, 64-bit offset
+and CDF-5) through numpy.memmap.
+
+The data of a netCDF3 variable lies at a fixed offset of the file, big-endian
+and uncompressed, so an array over the mapped file is all it takes to read
+it: pages are only read when they are touched and nothing is copied.  Record
+variables are strided views, one record after the other.
+
+The values are the raw stored ones, _FillValue/scale_factor/add_offset are
+not applied.  Other formats (netCDF4/HDF5) can't be mapped.
+"""
+
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b"CDF"
+
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+
+# numpy types of the netCDF3 types
+NC_DTYPES = {
+    1: ">i1",
+    2: "S1",
+    3: ">i2",
+    4: ">i4",
+    5: ">f4",
+    6: ">f8",
+    # CDF-5
+    7: ">u1",
+    8: ">u2",
+    9: ">u4",
+    10: ">i8",
+    11: ">u8",
+}
+
+
+def is_netcdf3(path):
+    """Return whether path is a netCDF3 file, i.e. can be mapped"""
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(4)
+    except OSError:
+        return False
+    return magic[:3] == MAGIC and magic[3:] in (b"\x01", b"\x02", b"\x05")
+
+
+class Header(object):
+    """
+    Reader of the header of a netCDF3 file, see
+    https://docs.unidata.ucar.edu/netcdf-c/current/file_format_specifications.html
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 4
+        version = buf[3]
+        # sizes are 64 bit in CDF-5, offsets also in the 64-bit offset format
+        self.size_format = ">q" if version == 5 else ">i"
+        self.offset_format = ">i" if version == 1 else ">q"
+
+        self.numrecs = self.read(self.size_format)
+        self.dimensions = []
+        self.variables = {}
+
+        for name, size in self.read_list(NC_DIMENSION, self.read_dimension):
+            self.dimensions.append((name, size))
+        self.read_list(NC_ATTRIBUTE, self.read_attribute)
+        for variable in self.read_list(NC_VARIABLE, self.read_variable):
+            self.variables[variable["name"]] = variable
+
+    def read(self, fmt):
+        value = struct.unpack_from(fmt, self.buf, self.pos)[0]
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def read_name(self):
+        length = self.read(self.size_format)
+        name = bytes(self.buf[self.pos:self.pos + length]).decode("utf-8")
+        self.pos += -(-length // 4) * 4
+        return name
+
+    def read_list(self, tag, read_item):
+        found = self.read(">i")
+        count = self.read(self.size_format)
+        if found not in (0, tag):
+            raise ValueError("Invalid netCDF3 header")
+        return [read_item() for _ in range(count)]
+
+    def read_dimension(self):
+        return self.read_name(), self.read(self.size_format)
+
+    def read_attribute(self):
+        self.read_name()
+        nc_type = self.read(">i")
+        count = self.read(self.size_format)
+        size = count * np.dtype(NC_DTYPES[nc_type]).itemsize
+        self.pos += -(-size // 4) * 4
+
+    def read_variable(self):
+        name = self.read_name()
+        count = self.read(self.size_format)
+        dimension_ids = [self.read(self.size_format) for _ in range(count)]
+        self.read_list(NC_ATTRIBUTE, self.read_attribute)
+        nc_type = self.read(">i")
+        vsize = self.read(self.size_format)
+        begin = self.read(self.offset_format)
+
+        shape = [self.dimensions[i][1] for i in dimension_ids]
+        return {
+            "name": name,
+            "dtype": np.dtype(NC_DTYPES[nc_type]),
+            "shape": shape,
+            # the record dimension has size 0 in the header
+            "record": bool(shape) and shape[0] == 0,
+            "vsize": vsize,
+            "begin": begin,
+        }
+
+
+def read_header(path):
+    """Return the Header of the netCDF3 file path"""
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buf)
+    try:
+        header = Header(view)
+    finally:
+        view.release()
+        buf.close()
+    del header.buf
+    return header
+
+
+def memmap_variable(path, var_name, header=None):
+    """
+    Return a read-only array of the variable var_name of the netCDF3 file
+    path which maps the file instead of reading it.
+    """
+    if header is None:
+        header = read_header(path)
+    try:
+        variable = header.variables[var_name]
+    except KeyError:
+        raise KeyError("Cannot find variable: {0}".format(var_name))
+
+    dtype = variable["dtype"]
+    shape = list(variable["shape"])
+    if not variable["record"]:
+        return np.memmap(
+            path, dtype=dtype, mode="r", offset=variable["begin"], shape=tuple(shape)
+        )
+
+    records = [v for v in header.variables.values() if v["record"]]
+    if len(records) == 1:
+        # a single record variable isn't padded
+        record_size = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+    else:
+        record_size = sum(v["vsize"] for v in records)
+
+    numrecs = header.numrecs
+    if numrecs < 0:
+        # written in streaming mode, the number of records is unknown
+        size = len(np.memmap(path, dtype=np.uint8, mode="r"))
+        numrecs = (size - variable["begin"]) // record_size
+    shape[0] = numrecs
+    if numrecs == 0:
+        return np.empty(shape, dtype=dtype)
+
+    # the records of the variable are record_size bytes apart
+    item_size = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+    span = (numrecs - 1) * record_size + item_size
+    data = np.memmap(
+        path, dtype=np.uint8, mode="r", offset=variable["begin"], shape=(span,)
+    )
+    strides = (record_size,) + np.empty(shape[1:], dtype=dtype).strides
+    return np.ndarray(tuple(shape), dtype=dtype, buffer=data, strides=strides)
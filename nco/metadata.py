@@ -0,0 +1,235 @@
+"""
+metadata module:
+Deferred metadata edits, fused into the fewest ncatted/ncrename calls.
+
+    with nco.metadata_editor() as editor:
+        editor.add("out.nc", Atted("overwrite", "units", "T", "K"))
+        editor.add("out.nc", Rename("variable", {"T": "temp"}))
+        editor.add("out.nc", Atted("overwrite", "long_name", "Q", "humidity"))
+
+Each call can rewrite a netCDF4 file, so the edits of a file are collected
+and run on flush() (on leaving the with block) as few calls with many
+-a/-v/-d/-g arguments.  The edits keep their order where it matters:  an
+edit joins the last call of its operator only if it doesn't touch the names
+renamed (or whose attributes are edited) by the calls in between.  Within a
+call, edits overwritten or deleted later on are dropped, chains of renames
+are joined (a to b to c is a to c) and renames back to the original name
+vanish.  Calls whose arguments would exceed ARG_MAX are split.
+"""
+
+import collections
+import copy
+import re
+
+from .custom import Atted, Rename
+
+# kinds of the names an edit touches
+VARIABLE = "variable"
+ATTRIBUTE = "attribute"
+DIMENSION = "dimension"
+GROUP = "group"
+
+RENAME_KINDS = {"v": VARIABLE, "a": ATTRIBUTE, "d": DIMENSION, "g": GROUP}
+SIMPLE_NAME = re.compile(r"^[\w.-]+$")
+
+
+class Edit(object):
+    """a single attribute edit or rename of a MetadataEditor"""
+
+    def __init__(self, operator, option=None, rtype=None, old=None, new=None):
+        self.operator = operator
+        self.option = option
+        self.rtype = rtype
+        self.old = old
+        self.new = new
+
+    @classmethod
+    def from_option(cls, option):
+        """The Edits of an Atted or Rename option"""
+        if isinstance(option, Atted):
+            return [cls("ncatted", option=option)]
+        if isinstance(option, Rename):
+            return [
+                cls("ncrename", rtype=option.rtype, old=str(old), new=str(new))
+                for old, new in option.rDict.items()
+            ]
+        raise TypeError(
+            "Only Atted and Rename edits can be collected, not {0!r}".format(option)
+        )
+
+    @property
+    def key(self):
+        """(variable, attribute) of an attribute edit"""
+        return (self.option.var_name, self.option.att_name)
+
+    def names(self):
+        """(kind, name) of the names the edit touches, name None for any"""
+        if self.operator == "ncatted":
+            var_name, att_name = self.key
+            if not var_name or not SIMPLE_NAME.match(var_name):
+                # blank and regular expressions mean several variables
+                var_name = None
+            if not SIMPLE_NAME.match(att_name):
+                att_name = None
+            return {(VARIABLE, var_name), (ATTRIBUTE, att_name)}
+
+        kind = RENAME_KINDS[self.rtype]
+        if kind == GROUP:
+            # variable names can contain group paths
+            return {(GROUP, None), (VARIABLE, None)}
+        names = set()
+        for name in (self.old, self.new):
+            if kind == ATTRIBUTE:
+                if "@" in name:
+                    var_name, name = name.split("@", 1)
+                    names.add((VARIABLE, var_name))
+                # a leading "." marks an optional attribute
+                name = name.lstrip(".")
+            names.add((kind, name))
+        return names
+
+    def option_args(self):
+        if self.operator == "ncatted":
+            # prn_option() changes the Atted
+            return copy.copy(self.option).prn_option()
+        return ["-{0}".format(self.rtype), "{0},{1}".format(self.old, self.new)]
+
+
+def overlaps(names, other_names):
+    """Whether two sets of Edit.names() share a name"""
+    for kind, name in names:
+        for other_kind, other_name in other_names:
+            if kind == other_kind and (
+                name is None or other_name is None or name == other_name
+            ):
+                return True
+    return False
+
+
+class Batch(object):
+    """edits of one ncatted/ncrename call"""
+
+    def __init__(self, operator):
+        self.operator = operator
+        self.edits = []
+
+    def names(self):
+        names = set()
+        for edit in self.edits:
+            names |= edit.names()
+        return names
+
+    def add(self, edit):
+        """Add edit, return False if it can't go into this call"""
+        if self.operator == "ncatted":
+            exact = None not in [name for _, name in edit.names()]
+            if edit.option.mode in ("o", "d") and exact:
+                # the earlier edits of the attribute make no difference
+                self.edits = [e for e in self.edits if e.key != edit.key]
+            self.edits.append(edit)
+            return True
+
+        # a rename of the result of an earlier one joins it
+        for earlier in self.edits:
+            if earlier.rtype == edit.rtype and earlier.new == edit.old:
+                joined = copy.copy(edit)
+                joined.old = earlier.old
+                others = Batch(self.operator)
+                others.edits = [e for e in self.edits if e is not earlier]
+                if overlaps(joined.names(), others.names()):
+                    return False
+                earlier.new = edit.new
+                if earlier.new == earlier.old:
+                    self.edits.remove(earlier)
+                return True
+        if overlaps(edit.names(), self.names()):
+            return False
+        self.edits.append(edit)
+        return True
+
+    def option_args(self):
+        return [edit.option_args() for edit in self.edits]
+
+
+class MetadataEditor(object):
+    """
+    collects Atted and Rename edits per file and runs them on flush()
+
+    :param nco: Nco instance running the calls
+    """
+
+    def __init__(self, nco):
+        self.nco = nco
+        self.edits = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return sum(len(edits) for edits in self.edits.values())
+
+    def add(self, path, *options):
+        """Collect the Atted/Rename options for the file path"""
+        edits = self.edits.setdefault(path, [])
+        for option in options:
+            edits.extend(Edit.from_option(option))
+        return self
+
+    def batches(self, path):
+        """The calls of the edits of path, as Batch objects"""
+        batches = []
+        for edit in self.edits.get(path, []):
+            # batches change their edits
+            edit = copy.copy(edit)
+            names = edit.names()
+            target = None
+            for batch in reversed(batches):
+                if batch.operator == edit.operator:
+                    target = batch
+                    break
+                if overlaps(names, batch.names()):
+                    break
+            if target is None or not target.add(edit):
+                batch = Batch(edit.operator)
+                batch.add(edit)
+                batches.append(batch)
+        return [batch for batch in batches if batch.edits]
+
+    def commands(self, path):
+        """
+        (operator, options) of the calls running the edits of path, split
+        where the options exceed the argument size limit
+        """
+        from .nco import ARG_MAX, argument_bytes
+
+        # room for the operator, its other options and the environment
+        limit = ARG_MAX - argument_bytes([path], None) - 2 ** 12
+        commands = []
+        for batch in self.batches(path):
+            options, size = [], 0
+            for args in batch.option_args():
+                args_size = argument_bytes(args, {})
+                if options and size + args_size > limit:
+                    commands.append((batch.operator, options))
+                    options, size = [], 0
+                options.extend(args)
+                size += args_size
+            commands.append((batch.operator, options))
+        return commands
+
+    def flush(self):
+        """
+        Run the collected edits, file by file.  Returns the number of calls.
+        """
+        calls = 0
+        while self.edits:
+            path = next(iter(self.edits))
+            for operator, options in self.commands(path):
+                getattr(self.nco, operator)(input=path, options=options)
+                calls += 1
+            del self.edits[path]
+        return calls
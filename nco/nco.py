@@ -1,14 +1,130 @@
 """
 nco module.  Use Nco class as interface.
 """
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import hashlib
+import json
 import shutil
 import os.path
 import re
 import shlex
 import subprocess
+import sys
 import tempfile
+import threading
+import time
+import types
 from packaging.version import parse as parse_version
 
+from .aio import AsyncNco
+from .cache import ResultCache, cache_dir
+from .custom import AttedBulk
+from .handles import HandlePool
+from .pipeline import Pipeline
+from .scratch import Scratch, ScratchFile
+from .script import Ncap2Script
+
+OPERATORS = [
+    "ncap2",
+    "ncatted",
+    "ncbo",
+    "nces",
+    "ncecat",
+    "ncflint",
+    "ncks",
+    "ncpdq",
+    "ncra",
+    "ncrcat",
+    "ncrename",
+    "ncwa",
+    "ncea",
+]
+
+# capabilities of the NCO installations probed by this process, by nco_path
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+
+# descriptions of files by nco_path, path, size and modification time
+_descriptions = collections.OrderedDict()
+_descriptions_lock = threading.Lock()
+MAX_DESCRIPTIONS = 4096
+
+# names of the netCDF types in the JSON output of ncks, by numpy dtype
+NC_TYPES = {
+    "int8": "byte",
+    "uint8": "ubyte",
+    "int16": "short",
+    "uint16": "ushort",
+    "int32": "int",
+    "uint32": "uint",
+    "int64": "int64",
+    "uint64": "uint64",
+    "float32": "float",
+    "float64": "double",
+}
+
+# virtual attributes ncks --hdn adds, describe() tells the chunking only
+HIDDEN_ATTRIBUTES = frozenset(
+    [
+        "_ChunkSizes",
+        "_DeflateLevel",
+        "_Endianness",
+        "_Filter",
+        "_Fletcher32",
+        "_Format",
+        "_IsNetcdf4",
+        "_NCProperties",
+        "_NOFILL",
+        "_Shuffle",
+        "_SOURCE_FORMAT",
+        "_Storage",
+        "_SuperblockVersion",
+    ]
+)
+
+# unit of ru_maxrss in bytes
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# bytes per hyperslab of Nco.iter_array()
+BLOCK_BYTES = 2 ** 26
+
+# arguments of Nco.split_records() that go to the merging call
+MERGE_KWARGS = (
+    "output",
+    "returnCdf",
+    "returnArray",
+    "returnMaArray",
+    "dtype",
+    "mmap",
+    "returnDump",
+)
+
+# arguments of split_records() and tree_reduce() for all calls
+SHARED_KWARGS = ("force", "env", "use_shell")
+
+# size of the arguments and environment of a process, and of an argument
+if sys.platform == "win32":
+    ARG_MAX = ARG_STRLEN_MAX = 32767
+else:
+    try:
+        ARG_MAX = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        ARG_MAX = 2 ** 17
+    # a single argument is limited to 32 pages on Linux
+    ARG_STRLEN_MAX = 2 ** 17 if sys.platform.startswith("linux") else ARG_MAX
+    # leave room for the auxiliary vector and alignment
+    ARG_MAX -= 2 ** 12
+POINTER_BYTES = 8
+
+# operators reading their input file list from stdin
+STDIN_OPERATORS = ["ncea", "ncecat", "nces", "ncra", "ncrcat"]
+
+# bytes read from the pipes of a streaming call at a time
+STREAM_CHUNK_SIZE = 2 ** 16
+
 
 class NCOException(Exception):
     def __init__(self, stdout, stderr, returncode):
@@ -21,6 +137,10 @@ class NCOException(Exception):
     def __str__(self):
         return self.msg
 
+    def __reduce__(self):
+        # keep the exception picklable so it survives process pools
+        return (NCOException, (self.stdout, self.stderr, self.returncode))
+
 
 class Nco(object):
     def __init__(
@@ -30,24 +150,14 @@ class Nco(object):
         force_output=True,
         cdf_module="netcdf4",
         debug=0,
+        scratch=None,
+        cache=None,
+        handles=None,
+        coordinates=None,
         **kwargs
     ):
 
-        operators = [
-            "ncap2",
-            "ncatted",
-            "ncbo",
-            "nces",
-            "ncecat",
-            "ncflint",
-            "ncks",
-            "ncpdq",
-            "ncra",
-            "ncrcat",
-            "ncrename",
-            "ncwa",
-            "ncea",
-        ]
+        operators = list(OPERATORS)
 
         if "NCOpath" in os.environ:
             self.nco_path = os.environ["NCOpath"]
@@ -60,6 +170,24 @@ class Nco(object):
         self.force_output = force_output
         self.cdf_module = cdf_module
         self.debug = debug
+        # temporary outputs are created and cleaned up by the scratch space
+        if scratch is None:
+            scratch = Scratch()
+        self.scratch = scratch
+        # opt-in cache of operator results
+        if cache is True:
+            cache = ResultCache()
+        self.cache = cache
+        # open cdf handles reused by read_array and friends
+        if handles is None:
+            handles = HandlePool()
+        self.handles = handles
+        # opt-in index resolving value bounds of Limit options
+        if coordinates is True:
+            from .coordinates import CoordinateIndex
+
+            coordinates = CoordinateIndex()
+        self.coordinates = coordinates
         self.outputOperatorsPattern = [
             "-H",
             "--data",
@@ -93,6 +221,11 @@ class Nco(object):
         self.returncode = 0
         self.stdout = ""
         self.stderr = ""
+        # bytes of stderr kept by streaming calls
+        self.stderr_limit = 2 ** 16
+        # measurements of the last operator call and callbacks receiving them
+        self.stats = None
+        self.call_hooks = []
 
         if kwargs:
             self.options = kwargs
@@ -104,15 +237,31 @@ class Nco(object):
         res.extend(self.operators)
         return res
 
-    def call(self, cmd, inputs=None, environment=None, use_shell=False):
+    def __getstate__(self):
+        # the loaded cdf module can't be pickled, workers load it again
+        state = self.__dict__.copy()
+        state.pop("cdf", None)
+        # hooks run in the process that made the call, see map()
+        state["call_hooks"] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.return_cdf:
+            self.load_cdf_module()
 
-        cmd = list(cmd)
-        if inputs is not None:
-            if isinstance(inputs, str):
-                cmd.append(inputs)
-            else:
-                # assume it's an iterable
-                cmd.extend(inputs)
+    @property
+    def aio(self):
+        """Awaitable versions of the operators, e.g. ``await nco.aio.ncra(...)``"""
+        return AsyncNco(self)
+
+    def full_command(self, cmd, inputs=None, environment=None, use_shell=False):
+        """
+        Append the inputs to cmd and print it when debugging.  Returns the
+        command and the input file list to feed to its stdin, None unless
+        the inputs don't fit on the command line (see fit_inputs).
+        """
+        cmd, file_list = fit_inputs(cmd, inputs, environment, use_shell)
 
         if self.debug:
             print("# DEBUG ==================================================")
@@ -120,40 +269,134 @@ class Nco(object):
                 for key, val in list(environment.items()):
                     print("# DEBUG: ENV: {0} = {1}".format(key, val))
             print("# DEBUG: CALL>> {0}".format(" ".join(map(shlex.quote, cmd))))
+            if file_list is not None:
+                print("# DEBUG: STDIN: {0} input files".format(len(inputs)))
             print("# DEBUG ==================================================")
 
-        # if we're using the shell then we need to pass a single string as the
-        # command rather than in iterable
-        if use_shell:
-            shell_cmd = " ".join(map(shlex.quote, cmd))
-            try:
-                proc = subprocess.Popen(
-                    shell_cmd,
-                    shell=True,
-                    stdin=subprocess.DEVNULL,
-                    stderr=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    env=environment,
-                )
-            except OSError:
-                # Argument list may have been too long, so don't use a shell
-                use_shell = False
+        return cmd, file_list
+
+    def spawn(self, cmd, environment=None, use_shell=False, file_list=None):
+        """
+        Start cmd with its stdout and stderr connected to pipes and
+        file_list, if any, as its stdin
+        """
+        with stdin_source(file_list) as stdin:
+            # if we're using the shell then we need to pass a single string as
+            # the command rather than in iterable
+            if use_shell:
+                shell_cmd = " ".join(map(shlex.quote, cmd))
+                try:
+                    return subprocess.Popen(
+                        shell_cmd,
+                        shell=True,
+                        stdin=stdin,
+                        stderr=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        env=environment,
+                    )
+                except OSError:
+                    # the command string may be too long for the shell alone
+                    pass
 
-        if not use_shell:
-            proc = subprocess.Popen(
+            return subprocess.Popen(
                 cmd,
-                stdin=subprocess.DEVNULL,
+                stdin=stdin,
                 stderr=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 env=environment,
             )
 
-        retvals = proc.communicate()
-        return {
-            "stdout": retvals[0],
-            "stderr": retvals[1],
-            "returncode": proc.returncode,
-        }
+    def call(self, cmd, inputs=None, environment=None, use_shell=False):
+
+        cmd, file_list = self.full_command(
+            cmd, inputs=inputs, environment=environment, use_shell=use_shell
+        )
+        start = time.time()
+        counter = time.perf_counter()
+        proc = self.spawn(
+            cmd, environment=environment, use_shell=use_shell, file_list=file_list
+        )
+        stdout, stderr, rusage = communicate(proc)
+        return call_retvals(cmd, inputs, proc, stdout, stderr, rusage, start, counter)
+
+    def stream(self, nco_call):
+        """
+        Run a call built by build_call() with its stdout handed over to
+        nco_call["stream"] while NCO writes it: a file object or a function
+        receiving every chunk, True for an iterator of chunks or "lines" for
+        an iterator of lines.  Only one chunk is held at a time, NCO waits
+        (the pipe fills up) while the consumer is busy.  Of stderr only the
+        last stderr_limit bytes are kept for error reporting.
+
+        The iterators start NCO on their first item, the error of a failing
+        call is raised at their end.  Stopping early kills NCO.
+        """
+        chunks = self.stream_chunks(nco_call)
+        sink = nco_call["stream"]
+        if sink is True:
+            return chunks
+        if sink == "lines":
+            return iter_lines(chunks)
+
+        write = sink.write if hasattr(sink, "write") else sink
+        for chunk in chunks:
+            write(chunk)
+        return None
+
+    def stream_chunks(self, nco_call):
+        cmd, file_list = self.full_command(
+            nco_call["cmd"],
+            inputs=nco_call["input"],
+            environment=nco_call["environment"],
+            use_shell=nco_call["use_shell"],
+        )
+        start = time.time()
+        counter = time.perf_counter()
+        proc = self.spawn(
+            cmd,
+            environment=nco_call["environment"],
+            use_shell=nco_call["use_shell"],
+            file_list=file_list,
+        )
+
+        stderr = bytearray()
+        reader = threading.Thread(
+            target=read_tail, args=(proc.stderr, self.stderr_limit, stderr)
+        )
+        reader.start()
+        finished = False
+        try:
+            for chunk in iter(lambda: proc.stdout.read1(STREAM_CHUNK_SIZE), b""):
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                # the consumer gave up, don't leave NCO blocked on the pipe
+                proc.kill()
+            reader.join()
+            proc.stdout.close()
+            proc.stderr.close()
+            rusage = reap(proc)
+
+        retvals = call_retvals(
+            cmd, nco_call["input"], proc, b"", bytes(stderr), rusage, start, counter
+        )
+        self.finish_call(nco_call, retvals)
+
+    def add_call_hook(self, hook):
+        """
+        Call hook(stats) after every operator call, stats being the dict
+        that is also kept as self.stats: cmd, operator, inputs, output, pid
+        (of NCO), start (epoch seconds), wall_time, user_time, sys_time
+        (seconds of CPU time of the NCO process), max_rss (bytes),
+        input_bytes, output_bytes, returncode and the process, thread and
+        thread_name that ran the call.  Measurements that are not available
+        are None.
+        """
+        self.call_hooks.append(hook)
+
+    def remove_call_hook(self, hook):
+        self.call_hooks.remove(hook)
 
     def has_error(self, method_name, inputs, cmd, retvals):
         if self.debug:
@@ -191,183 +434,755 @@ class Nco(object):
             :param kwargs:
             :return:
             """
-            options = kwargs.pop("options", [])
-            force = kwargs.pop("force", self.force_output)
-            output = kwargs.pop("output", None)
-            environment = kwargs.pop("env", None)
-            debug = kwargs.pop("debug", self.debug)
-            return_cdf = kwargs.pop("returnCdf", False)
-            return_array = kwargs.pop("returnArray", False)
-            return_ma_array = kwargs.pop("returnMaArray", False)
-            operator_prints_out = kwargs.pop("operator_prints_out", False)
-            use_shell = kwargs.pop("use_shell", False)
-
-            # build the NCO command
-            # 1. the NCO operator
-            cmd = [os.path.join(self.nco_path, nco_command)]
-
-            if options:
-                for option in options:
-                    if isinstance(option, str):
-                        cmd.extend(shlex.split(option))
-                    elif hasattr(option, "prn_option"):
-                        cmd.extend(option.prn_option())
-                    else:
-                        # assume it's an iterable
-                        cmd.extend(option)
+            if nco_command == "ncatted":
+                calls = self.ncatted_parts(input, kwargs)
+                if calls is not None:
+                    for call_input, call_kwargs in calls:
+                        result = get(self, call_input, **call_kwargs)
+                    return result
+            nco_call = self.build_call(nco_command, input, kwargs)
+            if nco_call["stream"] is not None:
+                return self.stream(nco_call)
+            retvals = self.cache_lookup(nco_call)
+            if retvals is None:
+                retvals = self.call(
+                    nco_call["cmd"],
+                    inputs=nco_call["input"],
+                    environment=nco_call["environment"],
+                    use_shell=nco_call["use_shell"],
+                )
+            return self.finish_call(nco_call, retvals)
 
-            if debug:
-                if type(debug) == bool:
-                    # assume debug level is 3
-                    cmd.append("--nco_dbg_lvl=3")
-                elif type(debug) == int:
-                    cmd.append("--nco_dbg_lvl={0}".format(debug))
-                else:
-                    raise TypeError(
-                        "Unknown type for debug: {0}".format(type(debug))
+        # cache the method for later
+        if self.debug:
+            print("Found method: {0}".format(nco_command))
+        setattr(self.__class__, nco_command, get)
+        return get.__get__(self)
+
+    def map(
+        self,
+        nco_command,
+        inputs,
+        output_template=None,
+        max_workers=None,
+        executor="thread",
+        **kwargs
+    ):
+        """
+        Run one operator over many input files, at most max_workers at a
+        time.  Yields (input, result, exception) tuples as the calls
+        complete.  A failing call yields its NCOException instead of
+        stopping the batch.
+
+        :param nco_command: name of the NCO operator, e.g. "ncpdq"
+        :param inputs: iterable of input files
+        :param output_template: format string for the output file of each
+            input, it can use {input}, {dirname}, {basename}, {stem} and
+            {index}.  Temporary files are used if not given.
+        :param max_workers: number of concurrent calls (default: cpu count)
+        :param executor: "thread" or "process"
+        :param kwargs: passed on to the operator
+        :return: generator
+        """
+        if nco_command not in self.operators:
+            raise AttributeError("Unknown operator: {0}".format(nco_command))
+
+        pool = make_executor(executor, max_workers)
+        with pool:
+            futures = {}
+            for index, input in enumerate(inputs):
+                call_kwargs = dict(kwargs)
+                if output_template is not None:
+                    basename = os.path.basename(input)
+                    call_kwargs["output"] = output_template.format(
+                        input=input,
+                        dirname=os.path.dirname(input),
+                        basename=basename,
+                        stem=os.path.splitext(basename)[0],
+                        index=index,
                     )
+                future = pool.submit(
+                    _call_operator, self, nco_command, input, call_kwargs
+                )
+                futures[future] = input
+
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        result, scratch_output, stats = future.result()
+                        if scratch_output:
+                            result = self.scratch.adopt(result)
+                        if executor == "process" and stats is not None:
+                            # the worker's copy of this instance has no hooks
+                            for hook in self.call_hooks:
+                                hook(stats)
+                        yield futures[future], result, None
+                    except NCOException as exception:
+                        yield futures[future], None, exception
+            finally:
+                # the consumer may stop early, don't start what is left
+                for future in futures:
+                    future.cancel()
+
+    def split_records(
+        self,
+        nco_command,
+        input,
+        parts=None,
+        max_workers=None,
+        executor="process",
+        dim=None,
+        **kwargs
+    ):
+        """
+        Run ncra or ncrcat in parallel:  the records of input are split into
+        parts (see nco.reduction) which are reduced concurrently, then the
+        partial results are merged into the result of the serial call:
+
+            mean = nco.ncra(input=files, output="mean.nc")
+            mean = nco.split_records("ncra", input=files, output="mean.nc")
+
+        Averages are combined weighted by the number of records of the
+        parts (ncra -w).  Records with missing values
+        count fully, so where the averaged variables have missing values
+        the result differs from the serial call.  A hyperslab of the records
+        (-d) is split into the parts, it has to be a single index range.
+        Weighted averages (-w) raise ValueError.
+
+        :param nco_command: "ncra" or "ncrcat"
+        :param input: input file or list of input files
+        :param parts: number of record ranges (default: max_workers or
+            cpu count).  The ranges are aligned to the chunks of the
+            record variables of the first input.
+        :param max_workers: number of concurrent calls (default: cpu count)
+        :param executor: "thread" or "process"
+        :param dim: record dimension (default: the unlimited one)
+        :param kwargs: passed on to the operator, output and the return
+            options (returnArray, ...) to the merging call, the options of
+            the output file (format, compression, ...) to every call
+        :return: result of the merging call
+        """
+        if nco_command not in ("ncra", "ncrcat"):
+            raise ValueError(
+                "Only ncra and ncrcat can be split along the record dimension"
+            )
+        from .reduction import (
+            check_unweighted,
+            dimension_options,
+            merge_options,
+            part_options,
+            record_hyperslab,
+            record_layout,
+            split_ranges,
+        )
+
+        inputs = [input] if isinstance(input, str) else list(input)
+        length = 0
+        for index, path in enumerate(inputs):
+            with self.dataset(path) as file_handle:
+                name, size, chunk = record_layout(file_handle, dim)
+            if index == 0:
+                dim, record_chunk = name, chunk
+            length += size
+
+        if parts is None:
+            parts = max_workers or os.cpu_count() or 1
+        options = list(kwargs.pop("options", None) or [])
+        options.extend(dimension_options(kwargs))
+        if parts <= 1:
+            return getattr(self, nco_command)(input=input, options=options, **kwargs)
+        if nco_command == "ncra":
+            check_unweighted(options, kwargs)
+        # the parts cut the records the user's hyperslab selects
+        split, first, last = record_hyperslab(options, dim, length)
+        ranges = split_ranges(last + 1, parts, record_chunk, first)
+        if len(ranges) <= 1:
+            return getattr(self, nco_command)(input=input, options=options, **kwargs)
+
+        merge = merge_options(
+            nco_command,
+            options,
+            [end - start + 1 for start, end in ranges],
+            kwargs,
+        )
+        merge_kwargs = pop_merge_kwargs(kwargs)
+        calls = []
+        for start, end in ranges:
+            call_kwargs = dict(kwargs, options=part_options(split, dim, start, end))
+            calls.append((nco_command, inputs, call_kwargs))
+        partials = self.run_parts(calls, max_workers, executor)
+        return self.merge_parts(nco_command, partials, merge, merge_kwargs)
+
+    def tree_reduce(
+        self,
+        nco_command,
+        inputs,
+        fan_in=8,
+        max_workers=None,
+        executor="process",
+        **kwargs
+    ):
+        """
+        Run nces/ncea or ncecat over very many ensemble members as a tree
+        reduction:  groups of fan_in members are reduced in parallel, their
+        partial results in groups of fan_in in the next round, and so on
+        until one result is left.  No call opens more than fan_in files.
+
+            mean = nco.tree_reduce("nces", members, output="mean.nc", fan_in=16)
+
+        Partial averages are combined weighted by the number of members
+        they hold (nces -w), totals are summed and extrema reduced again,
+        see nco.reduction.  Members with missing values count fully, so
+        where the averaged variables have missing values the result differs
+        from the serial call.  Weighted averages (-w) raise ValueError.
+        ncecat groups are glued with ncrcat.
+        Intermediate results live in the scratch space of this instance.
+
+        :param nco_command: "nces", "ncea" or "ncecat"
+        :param inputs: list of member files
+        :param fan_in: number of files per call (default: 8)
+        :param max_workers: number of concurrent calls (default: cpu count)
+        :param executor: "thread" or "process"
+        :param kwargs: passed on to the calls of the first round, output and
+            the return options (returnArray, ...) to the final call, the
+            options of the output file (format, compression, ...) to every
+            call
+        :return: result of the final call
+        """
+        if nco_command not in ("nces", "ncea", "ncecat"):
+            raise ValueError("Only nces, ncea and ncecat can be tree reduced")
+        if fan_in < 2:
+            raise ValueError("fan_in must be at least 2")
+        from .reduction import (
+            MERGE_OPERATORS,
+            check_unweighted,
+            dimension_options,
+            merge_options,
+        )
+
+        options = list(kwargs.pop("options", None) or [])
+        options.extend(dimension_options(kwargs))
+        merge_kwargs = pop_merge_kwargs(kwargs)
+        shared_kwargs = dict(
+            (key, value) for key, value in kwargs.items() if key in SHARED_KWARGS
+        )
+        # (file, number of members it holds)
+        level = [(path, 1) for path in inputs]
+        if len(level) <= fan_in:
+            return getattr(self, nco_command)(
+                input=inputs, options=options, **dict(kwargs, **merge_kwargs)
+            )
+        if nco_command != "ncecat":
+            check_unweighted(options, kwargs)
+
+        first = True
+        while len(level) > fan_in:
+            groups = [level[i:i + fan_in] for i in range(0, len(level), fan_in)]
+            carried = []
+            if not first and len(groups[-1]) == 1:
+                # nothing to combine it with in this round
+                carried = groups.pop()
+            calls = []
+            for group in groups:
+                paths = [path for path, _ in group]
+                if first:
+                    calls.append((nco_command, paths, dict(kwargs, options=options)))
+                else:
+                    counts = [count for _, count in group]
+                    merge = merge_options(nco_command, options, counts, kwargs)
+                    call_kwargs = dict(shared_kwargs, options=merge)
+                    calls.append((MERGE_OPERATORS[nco_command], paths, call_kwargs))
+            partials = self.run_parts(calls, max_workers, executor)
+            if not first:
+                # the partial results of the previous round
+                self.remove_parts(path for group in groups for path, _ in group)
+            if partials is None:
+                self.remove_parts(path for path, _ in carried)
+                return None
+            level = [
+                (partial, sum(count for _, count in group))
+                for partial, group in zip(partials, groups)
+            ] + carried
+            first = False
+
+        return self.merge_parts(
+            MERGE_OPERATORS[nco_command],
+            [path for path, _ in level],
+            merge_options(
+                nco_command, options, [count for _, count in level], kwargs
+            ),
+            merge_kwargs,
+        )
 
-            if output and force and os.path.isfile(output):
-                # make sure overwrite is set
-                if debug:
-                    print("Overwriting file: {0}".format(output))
-                if any([i for i in cmd if i in self.DontForcePattern]):
-                    force = False
+    def run_parts(self, calls, max_workers=None, executor="process"):
+        """
+        Run the (nco_command, input, kwargs) calls of split_records() and
+        tree_reduce() in a pool and return their results in order, None if
+        a call failed with return_none_on_error.  Temporary outputs are
+        adopted by the scratch space of this instance.
+        """
+        results = []
+        with make_executor(executor, max_workers) as pool:
+            futures = [
+                pool.submit(_call_operator, self, nco_command, input, kwargs)
+                for nco_command, input, kwargs in calls
+            ]
+            try:
+                for future in futures:
+                    result, scratch_output, stats = future.result()
+                    if scratch_output:
+                        result = self.scratch.adopt(result)
+                    if executor == "process" and stats is not None:
+                        # the worker's copy of this instance has no hooks
+                        for hook in self.call_hooks:
+                            hook(stats)
+                    results.append(result)
+            except BaseException:
+                self.remove_parts(results)
+                raise
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        if any(result is None for result in results):
+            self.remove_parts(results)
+            return None
+        return results
+
+    def merge_parts(self, nco_command, partials, options, kwargs):
+        """Merge the partial results of run_parts() and remove them"""
+        if partials is None:
+            return None
+        try:
+            return getattr(self, nco_command)(input=partials, options=options, **kwargs)
+        finally:
+            self.remove_parts(partials)
+
+    def remove_parts(self, partials):
+        for partial in partials:
+            if partial in self.scratch:
+                self.scratch.remove(partial)
+
+    def pipeline(self, scratch_dir=None, max_workers=None):
+        """Return an empty Pipeline running its steps with this instance"""
+        return Pipeline(self, scratch_dir=scratch_dir, max_workers=max_workers)
+
+    def lazy(self):
+        """
+        Return a factory of deferred ncbo, ncwa and ncap2 calls, whose graph
+        is optimized before it runs with this instance (see nco.lazy)
+        """
+        from .lazy import Lazy
+
+        return Lazy(self)
+
+    def metadata_editor(self):
+        """
+        Return a MetadataEditor collecting Atted and Rename edits, which
+        are run as few ncatted/ncrename calls with this instance
+        """
+        from .metadata import MetadataEditor
+
+        return MetadataEditor(self)
+
+    def ncap2_script(self, expressions=None, keep=None, directory=None):
+        """
+        Return an Ncap2Script running its expressions in a single ncap2
+        call with this instance
+        """
+        return Ncap2Script(
+            self, expressions=expressions, keep=keep, directory=directory
+        )
+
+    def ncatted_parts(self, input, kwargs):
+        """
+        Spread an ncatted call whose AttedBulk options exceed the argument
+        size limit (ARG_MAX) over several calls.  Returns their (input,
+        kwargs), None if the call fits.  The first call writes the output,
+        if any, the next ones edit it in place.  Other edits run with the
+        first call, the other options with every call.  Raises ValueError
+        if a single -a switch exceeds the limit.
+        """
+        options = list(kwargs.get("options") or [])
+        bulks = [option for option in options if isinstance(option, AttedBulk)]
+        if not bulks:
+            return None
+        others = [option for option in options if not isinstance(option, AttedBulk)]
+        flags = without_edits(others)
+        other_args = flags[:]
+        for option in others:
+            if hasattr(option, "prn_option"):
+                # prn_option() of Atted changes it
+                other_args.extend(copy.copy(option).prn_option())
+
+        inputs = [input] if isinstance(input, str) else list(input)
+        # room for the operator, its output and the keyword options
+        limit = (
+            ARG_MAX - argument_bytes(inputs + other_args, kwargs.get("env")) - 2 ** 14
+        )
+        if sum(argument_bytes(bulk.prn_option(), {}) for bulk in bulks) <= limit:
+            return None
+        parts = []
+        if limit > 0:
+            parts = [part for bulk in bulks for part in bulk.split(limit)]
+        if not parts or any(
+            argument_bytes(part.prn_option(), {}) > limit for part in parts
+        ):
+            raise ValueError(
+                "An -a switch of ncatted exceeds the argument size limit "
+                "(ARG_MAX {0} bytes, {1} left for -a switches)".format(
+                    ARG_MAX, max(limit, 0)
+                )
+            )
+
+        call_kwargs = dict(kwargs)
+        final_kwargs = pop_merge_kwargs(call_kwargs)
+        output = final_kwargs.pop("output", None)
+        calls = []
+        for index, part in enumerate(parts):
+            if index == 0:
+                part_kwargs = dict(call_kwargs, options=others + [part])
+                if output is not None:
+                    part_kwargs["output"] = output
+                part_input = input
             else:
+                part_kwargs = dict(call_kwargs, options=flags + [part])
+                part_input = input if output is None else output
+            if index == len(parts) - 1:
+                part_kwargs.update(final_kwargs)
+            calls.append((part_input, part_kwargs))
+        return calls
+
+    def build_call(self, nco_command, input, kwargs):
+        """
+        Parse the keyword arguments of an operator call and construct the
+        corresponding NCO command.  Returns a dict describing the call which
+        is run with call() and handed, together with its retvals, to
+        finish_call().
+
+        :param nco_command: name of the NCO operator
+        :param input: input file name or list of file names
+        :param kwargs: keyword arguments given to the operator method
+        :return: dict
+        """
+        options = kwargs.pop("options", [])
+        force = kwargs.pop("force", self.force_output)
+        output = kwargs.pop("output", None)
+        environment = kwargs.pop("env", None)
+        debug = kwargs.pop("debug", self.debug)
+        return_cdf = kwargs.pop("returnCdf", False)
+        return_array = kwargs.pop("returnArray", False)
+        return_ma_array = kwargs.pop("returnMaArray", False)
+        ma_dtype = kwargs.pop("dtype", None)
+        return_dump = kwargs.pop("returnDump", False)
+        memmap = kwargs.pop("mmap", False)
+        stream = kwargs.pop("stream", None)
+        operator_prints_out = kwargs.pop("operator_prints_out", False)
+        use_shell = kwargs.pop("use_shell", False)
+
+        if input is not None and not isinstance(input, str):
+            input = list(input)
+
+        # build the NCO command
+        # 1. the NCO operator
+        cmd = [os.path.join(self.nco_path, nco_command)]
+
+        # value bounds of hyperslabs are resolved against the single input
+        resolve_file = None
+        if self.coordinates is not None:
+            if isinstance(input, str):
+                resolve_file = input
+            elif input is not None and len(input) == 1:
+                resolve_file = input[0]
+            if resolve_file is not None and not os.path.isfile(resolve_file):
+                resolve_file = None
+
+        if options:
+            for option in options:
+                if resolve_file is not None:
+                    option = self.coordinates.resolve(
+                        resolve_file, option, self.dataset
+                    )
+                if isinstance(option, str):
+                    cmd.extend(shlex.split(option))
+                elif hasattr(option, "prn_option"):
+                    cmd.extend(option.prn_option())
+                else:
+                    # assume it's an iterable
+                    cmd.extend(option)
+
+        if debug:
+            if type(debug) == bool:
+                # assume debug level is 3
+                cmd.append("--nco_dbg_lvl=3")
+            elif type(debug) == int:
+                cmd.append("--nco_dbg_lvl={0}".format(debug))
+            else:
+                raise TypeError(
+                    "Unknown type for debug: {0}".format(type(debug))
+                )
+
+        if output and force and os.path.isfile(output):
+            # make sure overwrite is set
+            if debug:
+                print("Overwriting file: {0}".format(output))
+            if any([i for i in cmd if i in self.DontForcePattern]):
                 force = False
+        else:
+            force = False
 
-            # 2b. all other keyword args become options
-            if kwargs:
-                for key, val in list(kwargs.items()):
-                    if val and type(val) == bool:
-                        cmd.append("--{0}".format(key))
-                        if cmd[-1] in self.DontForcePattern:
-                            force = False
-                    elif (
-                        isinstance(val, str)
-                        or isinstance(val, int)
-                        or isinstance(val, float)
-                    ):
-                        cmd.append("--{option}={value}".format(option=key, value=val))
-                    else:
-                        # we assume it's either a list, a tuple or any iterable
-                        cmd.append(
-                            "--{option}={values}".format(
-                                option=key, values=",".join(val)
-                            )
+        # 2b. all other keyword args become options
+        if kwargs:
+            for key, val in list(kwargs.items()):
+                if val and type(val) == bool:
+                    cmd.append("--{0}".format(key))
+                    if cmd[-1] in self.DontForcePattern:
+                        force = False
+                elif (
+                    isinstance(val, str)
+                    or isinstance(val, int)
+                    or isinstance(val, float)
+                ):
+                    cmd.append("--{option}={value}".format(option=key, value=val))
+                else:
+                    # we assume it's either a list, a tuple or any iterable
+                    cmd.append(
+                        "--{option}={values}".format(
+                            option=key, values=",".join(val)
                         )
+                    )
 
-            # 2c. Global options come in
-            if self.options:
-                for key, val in list(self.options.items()):
-                    if val and type(val) == bool:
-                        cmd.append("--" + key)
-                    elif isinstance(val, str):
-                        cmd.append("--{0}={1}".format(key, val))
-                    else:
-                        # we assume it's either a list, a tuple or any iterable
-                        cmd.append("--{0}={1}".format(key, ",".join(val)))
-
-            # 3.  Add in overwrite if necessary
-            if force:
-                cmd.append("--overwrite")
-
-            # Check if operator appends
-            operator_appends = False
-            for piece in cmd:
-                if piece in self.AppendOperatorsPattern:
-                    operator_appends = True
-
-            # If operator appends and NCO version >= 4.3.7, remove -H -M -m
-            # and their ancillaries from outputOperatorsPattern
-            if operator_appends and nco_command == "ncks":
-                nco_version = self.version()
-                if parse_version(nco_version) >= parse_version("4.3.7"):
-                    self.outputOperatorsPattern = [
-                        "-r",
-                        "--revision",
-                        "--vrs",
-                        "--version",
-                    ]
-
-            # Check if operator prints out
-            for piece in cmd:
-                if piece in self.outputOperatorsPattern:
-                    operator_prints_out = True
-
-            if operator_prints_out:
-                retvals = self.call(cmd, inputs=input)
-                self.returncode = retvals["returncode"]
-                self.stdout = retvals["stdout"]
-                self.stderr = retvals["stderr"]
-                if not self.has_error(nco_command, input, cmd, retvals):
-                    return retvals["stdout"]
-                    # parsing can be done by 3rd party
+        # 2c. Global options come in
+        if self.options:
+            for key, val in list(self.options.items()):
+                if val and type(val) == bool:
+                    cmd.append("--" + key)
+                elif isinstance(val, str):
+                    cmd.append("--{0}={1}".format(key, val))
                 else:
-                    if self.return_none_on_error:
-                        return None
-                    else:
-                        raise NCOException(**retvals)
-            else:
-                if output is not None:
-                    if isinstance(output, str):
-                        cmd.append("--output={0}".format(output))
-                    else:
-                        # we assume it's an iterable.
-                        if len(output) > 1:
-                            raise TypeError(
-                                "Only one output allowed, must be string or 1 "
-                                "length iterable. Recieved output: {out} with "
-                                "a type of {type}".format(
-                                    out=output, type=type(output)
-                                )
+                    # we assume it's either a list, a tuple or any iterable
+                    cmd.append("--{0}={1}".format(key, ",".join(val)))
+
+        # 3.  Add in overwrite if necessary
+        if force:
+            cmd.append("--overwrite")
+
+        # Check if operator appends
+        operator_appends = False
+        for piece in cmd:
+            if piece in self.AppendOperatorsPattern:
+                operator_appends = True
+
+        # If operator appends and NCO version >= 4.3.7, remove -H -M -m
+        # and their ancillaries from outputOperatorsPattern
+        if operator_appends and nco_command == "ncks":
+            nco_version = self.version()
+            if parse_version(nco_version) >= parse_version("4.3.7"):
+                self.outputOperatorsPattern = [
+                    "-r",
+                    "--revision",
+                    "--vrs",
+                    "--version",
+                ]
+
+        # Check if operator prints out
+        for piece in cmd:
+            if piece in self.outputOperatorsPattern:
+                operator_prints_out = True
+
+        if not operator_prints_out:
+            if output is not None:
+                if isinstance(output, str):
+                    cmd.append("--output={0}".format(output))
+                else:
+                    # we assume it's an iterable.
+                    if len(output) > 1:
+                        raise TypeError(
+                            "Only one output allowed, must be string or 1 "
+                            "length iterable. Recieved output: {out} with "
+                            "a type of {type}".format(
+                                out=output, type=type(output)
                             )
-                        cmd.extend("--output={0}".format(output))
+                        )
+                    cmd.extend("--output={0}".format(output))
 
-                elif not (nco_command in self.SingleFileOperatorsPattern):
-                    # create a temporary file, use this as the output
-                    file_name_prefix = (
-                        nco_command + "_" + os.path.basename(input)
-                    )
-                    tmp_file = tempfile.NamedTemporaryFile(
-                        mode="w+b",
-                        prefix=file_name_prefix,
-                        suffix=".tmp",
-                        delete=False
+            elif not (nco_command in self.SingleFileOperatorsPattern):
+                # create a temporary file, use this as the output
+                inputs = [input] if isinstance(input, str) else input
+                file_name_prefix = (
+                    nco_command + "_" + os.path.basename(inputs[0])
+                )
+                size_hint = None
+                if self.scratch.fast_directory is not None:
+                    size_hint = sum(
+                        os.path.getsize(i) for i in inputs if os.path.isfile(i)
                     )
-                    output = tmp_file.name
-                    cmd.append("--output={0}".format(output))
-
-                retvals = self.call(
-                    cmd, inputs=input, environment=environment, use_shell=use_shell
+                output = self.scratch.new_file(
+                    prefix=file_name_prefix, suffix=".tmp", size_hint=size_hint
                 )
-                self.returncode = retvals["returncode"]
-                self.stdout = retvals["stdout"]
-                self.stderr = retvals["stderr"]
-                if self.has_error(nco_command, input, cmd, retvals):
-                    if self.return_none_on_error:
-                        return None
-                    else:
-                        print(self.stdout)
-                        print(self.stderr)
-                        raise NCOException(**retvals)
-            
-            if return_array:
-                return self.read_array(output, return_array)
-            elif return_ma_array:
-                return self.read_ma_array(output, return_ma_array)
-            elif self.return_cdf or return_cdf:
-                if not self.return_cdf:
-                    self.load_cdf_module()
-                    return self.read_cdf(output)
+                cmd.append("--output={0}".format(output))
+
+        # an open read handle of the pool keeps NCO from writing a file
+        # (netCDF4/HDF5 lock it), drop those of the files the call writes
+        written = [output] if isinstance(output, str) else []
+        if (
+            output is None
+            and input is not None
+            and not operator_prints_out
+            and nco_command in self.SingleFileOperatorsPattern
+        ):
+            # edited in place
+            written.extend([input] if isinstance(input, str) else input)
+        for path in written:
+            self.handles.invalidate(path)
+
+        # results can be reused if the command only depends on its inputs
+        cache_key = None
+        if (
+            self.cache is not None
+            and not operator_appends
+            and not use_shell
+            and environment is None
+            and stream is None
+            and (operator_prints_out or output is not None)
+        ):
+            key_cmd = [
+                "--output=" if piece.startswith("--output=") else piece
+                for piece in cmd
+                if piece not in self.OverwriteOperatorsPattern
+            ]
+            if input is not None:
+                key_cmd.extend([input] if isinstance(input, str) else input)
+            cache_key = self.cache.key(key_cmd, self.version())
+
+        return {
+            "operator": nco_command,
+            "input": input,
+            "cmd": cmd,
+            "output": output,
+            "environment": environment,
+            "use_shell": use_shell,
+            "prints_out": operator_prints_out,
+            "return_cdf": return_cdf,
+            "return_array": return_array,
+            "return_ma_array": return_ma_array,
+            "dtype": ma_dtype,
+            "return_dump": return_dump,
+            "mmap": memmap,
+            "stream": stream,
+            "cache_key": cache_key,
+            "cache_hit": False,
+        }
+
+    def cache_lookup(self, nco_call):
+        """
+        Return the retvals of an earlier run of a call built by build_call()
+        if the result cache has it, otherwise None.  A cached output file is
+        copied to the output of the call, or read in place if the call only
+        wants its data returned.
+        """
+        key = nco_call["cache_key"]
+        if key is None:
+            return None
+
+        if nco_call["prints_out"]:
+            stdout = self.cache.get_stdout(key)
+            if stdout is None:
+                return None
+        else:
+            path = self.cache.get(key)
+            if path is None:
+                return None
+            output = nco_call["output"]
+            returns_data = (
+                nco_call["return_array"]
+                or nco_call["return_ma_array"]
+                or nco_call["return_cdf"]
+            )
+            if output in self.scratch and returns_data:
+                self.scratch.remove(output)
+                nco_call["output"] = path
             else:
-                return output
+                shutil.copyfile(path, output)
+            stdout = b""
 
-        # cache the method for later
         if self.debug:
-            print("Found method: {0}".format(nco_command))
-        setattr(self.__class__, nco_command, get)
-        return get.__get__(self)
+            print("# DEBUG: CACHED>> {0}".format(key))
+        nco_call["cache_hit"] = True
+        return {"stdout": stdout, "stderr": b"", "returncode": 0, "stats": None}
+
+    def finish_call(self, nco_call, retvals):
+        """
+        Check the retvals of a call built by build_call() for errors and
+        convert its output to what the caller asked for.
+        """
+        self.returncode = retvals["returncode"]
+        self.stdout = retvals["stdout"]
+        self.stderr = retvals["stderr"]
+        output = nco_call["output"]
+
+        stats = retvals.get("stats")
+        if stats is not None:
+            stats["operator"] = nco_call["operator"]
+            stats["returncode"] = retvals["returncode"]
+            if isinstance(output, str):
+                # a plain str doesn't keep a scratch file alive
+                stats["output"] = str(output)
+                if os.path.isfile(output):
+                    stats["output_bytes"] = os.path.getsize(output)
+            self.stats = stats
+            for hook in self.call_hooks:
+                hook(stats)
+        if self.has_error(
+            nco_call["operator"], nco_call["input"], nco_call["cmd"], retvals
+        ):
+            if output in self.scratch:
+                self.scratch.remove(output)
+            if self.return_none_on_error:
+                return None
+            else:
+                if not nco_call["prints_out"]:
+                    print(self.stdout)
+                    print(self.stderr)
+                raise NCOException(
+                    retvals["stdout"], retvals["stderr"], retvals["returncode"]
+                )
+
+        if nco_call["prints_out"]:
+            if nco_call["cache_key"] is not None and not nco_call["cache_hit"]:
+                self.cache.put_stdout(nco_call["cache_key"], retvals["stdout"])
+            if nco_call["return_dump"]:
+                return self.read_dump(retvals["stdout"], nco_call["return_dump"])
+            # parsing can be done by 3rd party
+            return retvals["stdout"]
+
+        if output in self.scratch:
+            self.scratch.track(output)
+        if isinstance(output, str):
+            # handles of an earlier version of the output are stale
+            self.handles.invalidate(output)
+        if nco_call["cache_key"] is not None and not nco_call["cache_hit"]:
+            self.cache.put(nco_call["cache_key"], output)
+
+        if nco_call["return_array"] or nco_call["return_ma_array"]:
+            if nco_call["return_array"]:
+                result = self.read_array(
+                    output, nco_call["return_array"], mmap=nco_call["mmap"]
+                )
+            else:
+                result = self.read_ma_array(
+                    output, nco_call["return_ma_array"], dtype=nco_call["dtype"]
+                )
+            if output in self.scratch:
+                # the temporary output goes away with its ScratchFile
+                self.handles.invalidate(output)
+            return result
+        elif self.return_cdf or nco_call["return_cdf"]:
+            if not self.return_cdf:
+                self.load_cdf_module()
+                return self.read_cdf(output)
+        else:
+            return output
 
     def load_cdf_module(self):
         if self.cdf_module == "netcdf4":
@@ -437,22 +1252,51 @@ class Nco(object):
 
     def version(self):
         # return NCO's version
-        proc = subprocess.Popen(
-            [os.path.join(self.nco_path, "ncra"), "--version"],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-        )
-        ret = proc.communicate()
-        ncra_help = ret[1]
-        if isinstance(ncra_help, bytes):
-            ncra_help = ncra_help.decode("utf-8")
-        match = re.search(r"NCO netCDF Operators version (\d.*) ", ncra_help)
-        # some versions write version information in quotation marks
-        if not match:
-            match = re.search(r'NCO netCDF Operators version "(\d.*)" ', ncra_help)
-        return match.group(1).split(" ")[0]
-
-    def read_cdf(self, infile):
+        return self.capabilities()["version"]
+
+    def capabilities(self, persist=True):
+        """
+        Return what the NCO installation at nco_path supports: its version,
+        the operators that exist and optional features (json, thr_nbr, ppc,
+        quantize).  It is probed once per nco_path and process, and with
+        persist also cached on disk.
+        """
+        return probe_nco(self.nco_path, persist=persist)
+
+    def describe(self, path):
+        """
+        Return the metadata of the netCDF file path as a dict: "dimensions"
+        (name: size), "variables" (name: dict of "type", "shape" (dimension
+        names), "chunking" (chunk sizes or None) and "attributes"), the
+        global "attributes" and, for netCDF4 files with groups, "groups".
+
+        It is read with "ncks --json -m" where NCO supports it, otherwise
+        with the cdf module.  Descriptions are memoized by path, size and
+        modification time, so repeated queries don't run NCO again.
+        """
+        stat = os.stat(path)
+        key = (self.nco_path, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with _descriptions_lock:
+            if key in _descriptions:
+                _descriptions.move_to_end(key)
+                return copy.deepcopy(_descriptions[key])
+
+        if self.capabilities()["json"]:
+            text = self.ncks(input=path, options=["--json", "-m", "--hdn"])
+            if text is None:
+                return None
+            description = json_description(json.loads(text.decode("utf-8")))
+        else:
+            with self.dataset(path) as file_handle:
+                description = cdf_description(file_handle)
+
+        with _descriptions_lock:
+            _descriptions[key] = description
+            while len(_descriptions) > MAX_DESCRIPTIONS:
+                _descriptions.popitem(last=False)
+        return copy.deepcopy(description)
+
+    def read_cdf(self, infile, mode="r"):
         """Return a cdf handle created by the available cdf library.
         python-netcdf4 and scipy supported (default:scipy)"""
         if not self.return_cdf:
@@ -460,9 +1304,9 @@ class Nco(object):
 
         if self.cdf_module == "scipy":
             # making it compatible to older scipy versions
-            file_obj = self.cdf.netcdf_file(infile, mode="r")
+            file_obj = self.cdf.netcdf_file(infile, mode=mode)
         elif self.cdf_module == "netcdf4":
-            file_obj = self.cdf.Dataset(infile)
+            file_obj = self.cdf.Dataset(infile, mode)
         else:
             raise ImportError(
                 "Could not import data \
@@ -472,6 +1316,19 @@ class Nco(object):
             )
         return file_obj
 
+    def dataset(self, infile, mode="r"):
+        """
+        Context manager lending a pooled cdf handle of infile (see
+        nco.handles), which stays open for the next reads of the file:
+
+            with nco.dataset("out.nc") as dataset:
+                units = dataset.variables["T"].units
+
+        Don't close it, nor keep using it (or arrays of the scipy module,
+        which map the file) after the with block.
+        """
+        return self.handles.borrow(infile, mode, self.read_cdf)
+
     def open_cdf(self, infile):
         """Return a cdf handle created by the available cdf library.
         python-netcdf4 and scipy suported (default:scipy)"""
@@ -495,77 +1352,677 @@ class Nco(object):
 
         return file_obj
 
-    def read_array(self, infile, var_names):
-        """Directly return single/multiple numpy arrays for given variable names"""
-        file_handle = self.read_cdf(infile)
-        result = {}
+    def read_array(self, infile, var_names, mmap=False):
+        """
+        Directly return single/multiple numpy arrays for given variable names.
+        With mmap, the variables of netCDF3 files are read-only arrays
+        mapping the file (see nco.memmap): no copy is made and the data is
+        only read when it's accessed, but _FillValue, scale_factor and
+        add_offset are not applied.  Other files are read as usual.
+        """
+        if mmap:
+            from .memmap import is_netcdf3, memmap_variable, read_header
+
+            if is_netcdf3(infile):
+                header = read_header(infile)
+                if isinstance(var_names, list):
+                    return dict(
+                        (var_name, memmap_variable(infile, var_name, header))
+                        for var_name in var_names
+                    )
+                return memmap_variable(infile, var_names, header)
+
+        with self.dataset(infile) as file_handle:
+            if isinstance(var_names, list):
+                result = {}
+                for var_name in var_names:
+                    result[var_name] = self.read_variable(file_handle, var_name)
+                return result
+            else:
+                # return the single data array
+                return self.read_variable(file_handle, var_names)
 
-        if isinstance(var_names, list):
-            for var_name in var_names:
-                try:
-                    # return the data arrays for each variable
-                    result[var_name] = file_handle.variables[var_name][:]
-                except KeyError:
-                    print("Cannot find variable: {0}".format(var_name))
-                    raise KeyError
-            return result
-        else:
+    def read_variable(self, file_handle, var_name, index=slice(None)):
+        """
+        Return the data of var_name (at index), not tied to the (pooled)
+        file_handle
+        """
+        try:
+            data = file_handle.variables[var_name][index]
+        except KeyError:
+            print("Cannot find variable: {0}".format(var_name))
+            raise KeyError
+        if self.cdf_module == "scipy":
+            # scipy maps the file, the handle may be closed by the pool
+            data = data.copy()
+        return data
+
+    def iter_array(self, infile, var_name, dim=None, block=None):
+        """
+        Iterate over the data of var_name in consecutive hyperslabs along
+        the dimension dim (default: the first one), so variables larger
+        than memory can be processed piece by piece:
+
+            total = sum(data.sum() for data in nco.iter_array(ofile, "T"))
+
+        :param block: number of indices of dim per hyperslab (default: as
+            many as fit in about BLOCK_BYTES).  For chunked (netCDF4/HDF5)
+            variables it is rounded up to whole chunks along dim.
+        """
+        with self.dataset(infile) as file_handle:
             try:
-                # return the single data array
-                return file_handle.variables[var_names][:]
+                variable = file_handle.variables[var_name]
             except KeyError:
-                print("Cannot find variable: {0}".format(var_names))
+                print("Cannot find variable: {0}".format(var_name))
                 raise KeyError
-
-    def read_ma_array(self, infile, var_name):
-        """Create a masked array based on cdf's FillValue"""
-        file_obj = self.read_cdf(infile)
-
-        # .data is not backwards compatible to old scipy versions, [:] is
-        data = file_obj.variables[var_name][:]
-
+            dimensions = list(variable.dimensions)
+            if not dimensions:
+                yield self.read_variable(file_handle, var_name)
+                return
+            axis = 0 if dim is None else dimensions.index(dim)
+            shape = list(variable.shape)
+            block = block_length(variable, axis, block)
+
+            index = [slice(None)] * len(shape)
+            for start in range(0, shape[axis], block):
+                index[axis] = slice(start, min(start + block, shape[axis]))
+                yield self.read_variable(file_handle, var_name, tuple(index))
+
+    def read_dump(self, text, var_names=True):
+        """
+        Return numpy arrays of the data printed by ncks (see nco.dump):
+        a dict of all variables for var_names=True, else like read_array
+        """
+        try:
+            from .dump import parse_dump
+        except Exception:
+            raise ImportError("numpy is required to parse printed data.")
+
+        if var_names is True:
+            return parse_dump(text)
+        result = parse_dump(text, var_names)
+        if isinstance(var_names, str):
+            return result[var_names]
+        return result
+
+    def read_ma_array(self, infile, var_name, dtype=None):
+        """
+        Create a masked array following the CF conventions (see nco.cf):
+        masked by _FillValue, missing_value and valid_min/valid_max/
+        valid_range, unpacked with scale_factor/add_offset into dtype
+        (default: the type of scale_factor/add_offset, else of the data).
+        """
         # load numpy if available
         try:
-            import numpy as np
+            from .cf import read_masked
         except Exception:
             raise ImportError("numpy is required to return masked arrays.")
 
-        if hasattr(file_obj.variables[var_name], "_FillValue"):
-            # return masked array
-            fill_val = file_obj.variables[var_name]._FillValue
-            retval = np.ma.masked_where(data == fill_val, data)
+        with self.dataset(infile) as file_obj:
+            try:
+                variable = file_obj.variables[var_name]
+            except KeyError:
+                print("Cannot find variable: {0}".format(var_name))
+                raise KeyError
+
+            if not hasattr(variable, "set_auto_maskandscale"):
+                return read_masked(variable, dtype=dtype)
+
+        # netCDF4 would mask and scale the values itself.  Switching that off
+        # on the pooled handle would hand its other borrowers raw values, the
+        # raw values are read through a handle of this call.
+        file_obj = self.read_cdf(infile)
+        try:
+            variable = file_obj.variables[var_name]
+            variable.set_auto_maskandscale(False)
+            return read_masked(variable, dtype=dtype)
+        finally:
+            file_obj.close()
+
+
+def block_length(variable, axis, block=None):
+    """
+    Number of indices along axis per hyperslab of variable for
+    Nco.iter_array(), aligned to the chunks of variable if it has any
+    """
+    shape = list(variable.shape)
+    chunking = None
+    if hasattr(variable, "chunking"):
+        chunking = variable.chunking()
+    chunk = 1 if chunking in (None, "contiguous") else chunking[axis]
+
+    if block is None:
+        itemsize = getattr(variable, "dtype", None)
+        itemsize = getattr(itemsize, "itemsize", 8)
+        slab_bytes = itemsize
+        for i, size in enumerate(shape):
+            if i != axis:
+                slab_bytes *= size
+        block = max(1, BLOCK_BYTES // max(slab_bytes, 1))
+    # whole chunks, so no chunk is read (and decompressed) twice
+    return max(chunk, -(-block // chunk) * chunk)
+
+
+def argument_bytes(args, environment=None):
+    """Space that args and environment take in the argument area of exec"""
+    if environment is None:
+        environment = os.environ
+    size = 0
+    for arg in args:
+        size += len(os.fsencode(arg)) + 1 + POINTER_BYTES
+    for key, value in environment.items():
+        size += len(os.fsencode(key)) + len(os.fsencode(value)) + 2 + POINTER_BYTES
+    return size
+
+
+def fit_inputs(cmd, inputs, environment=None, use_shell=False, arg_max=None):
+    """
+    Append inputs to cmd, unless that exceeds the kernel limit on the size
+    of the arguments (ARG_MAX).  Then the multi-file operators with an
+    output get the inputs as a list on stdin, which NCO reads if no input
+    is given on the command line.  Otherwise the inputs are given relative
+    to their common directory, passed as path prefix with -p.
+
+    Returns the command and the bytes of the input list for stdin (None).
+    """
+    cmd = list(cmd)
+    if inputs is None:
+        return cmd, None
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    inputs = [os.fspath(i) for i in inputs]
+
+    if arg_max is None:
+        arg_max = ARG_MAX
+    if use_shell:
+        # the whole command is a single argument of the shell
+        arg_max = min(arg_max, ARG_STRLEN_MAX)
+
+    def fits(args):
+        if use_shell:
+            args = ["/bin/sh", "-c", " ".join(map(shlex.quote, args))]
+        return argument_bytes(args, environment) <= arg_max
+
+    if fits(cmd + inputs):
+        return cmd + inputs, None
+
+    operator = os.path.basename(cmd[0]) if cmd else ""
+    has_output = any(
+        piece.startswith("--output=") or piece in ("-o", "--fl_out", "--output")
+        for piece in cmd
+    )
+    # NCO splits the list on whitespace
+    if (
+        operator in STDIN_OPERATORS
+        and has_output
+        and all(len(i.split()) == 1 for i in inputs)
+    ):
+        return cmd, "\n".join(inputs).encode("utf-8") + b"\n"
+
+    inputs = [os.path.abspath(i) for i in inputs]
+    directory = os.path.commonpath([os.path.dirname(i) for i in inputs])
+    relative = [os.path.relpath(i, directory) for i in inputs]
+    # if this doesn't fit either, starting the process fails with E2BIG
+    return cmd + ["-p", directory] + relative, None
+
+
+@contextlib.contextmanager
+def stdin_source(file_list):
+    """stdin of a call: /dev/null or a temporary file holding file_list"""
+    if file_list is None:
+        yield subprocess.DEVNULL
+        return
+    with tempfile.TemporaryFile() as stdin:
+        stdin.write(file_list)
+        stdin.seek(0)
+        yield stdin
+
+
+def communicate(proc):
+    """
+    proc.communicate() that reaps the process with os.wait4 to also return
+    its resource usage, which is None where os.wait4 is not available.
+    """
+    if not hasattr(os, "wait4"):
+        stdout, stderr = proc.communicate()
+        return stdout, stderr, None
+
+    # read stderr in a thread so neither pipe can fill up and block NCO
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()))
+    reader.start()
+    stdout = proc.stdout.read()
+    reader.join()
+    proc.stdout.close()
+    proc.stderr.close()
+    return stdout, stderr[0], reap(proc)
+
+
+def reap(proc):
+    """
+    Wait for proc, whose pipes are closed, and return its resource usage
+    (None where os.wait4 is not available).
+    """
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # somebody else reaped it
+        proc.wait()
+        return None
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return rusage
+
+
+def read_tail(pipe, limit, tail):
+    """Read pipe to its end, keeping its last limit bytes in the bytearray tail"""
+    for chunk in iter(lambda: pipe.read(STREAM_CHUNK_SIZE), b""):
+        tail.extend(chunk)
+        del tail[:-limit]
+
+
+def iter_lines(chunks):
+    """Iterate over the lines (with their b"\\n") in an iterator of chunks"""
+    rest = b""
+    try:
+        for chunk in chunks:
+            lines = (rest + chunk).split(b"\n")
+            rest = lines.pop()
+            for line in lines:
+                yield line + b"\n"
+        if rest:
+            yield rest
+    finally:
+        chunks.close()
+
+
+def call_retvals(cmd, inputs, proc, stdout, stderr, rusage, start, counter):
+    """The retvals of a finished call, with its stats"""
+    stats = call_stats(cmd, inputs, start, proc.pid)
+    stats["wall_time"] = time.perf_counter() - counter
+    if rusage is not None:
+        stats["user_time"] = rusage.ru_utime
+        stats["sys_time"] = rusage.ru_stime
+        stats["max_rss"] = rusage.ru_maxrss * MAXRSS_UNIT
+    return {
+        "stdout": stdout,
+        "stderr": stderr,
+        "returncode": proc.returncode,
+        "stats": stats,
+    }
+
+
+def call_stats(cmd, inputs, start, pid):
+    """The measurements of a call that don't depend on how it was run"""
+    if inputs is None:
+        inputs = []
+    elif isinstance(inputs, str):
+        inputs = [inputs]
+    return {
+        "cmd": cmd,
+        "operator": os.path.basename(cmd[0]),
+        "inputs": list(inputs),
+        "output": None,
+        "pid": pid,
+        "start": start,
+        "wall_time": None,
+        "user_time": None,
+        "sys_time": None,
+        "max_rss": None,
+        "input_bytes": sum(os.path.getsize(i) for i in inputs if os.path.isfile(i)),
+        "output_bytes": None,
+        "returncode": None,
+        "process": os.getpid(),
+        "thread": threading.get_ident(),
+        "thread_name": threading.current_thread().name,
+    }
+
+
+def without_edits(options):
+    """The str and iterable options, without the -a edits among them"""
+    tokens = []
+    for option in options:
+        if isinstance(option, str):
+            tokens.extend(shlex.split(option))
+        elif not hasattr(option, "prn_option"):
+            tokens.extend(option)
+    flags = []
+    while tokens:
+        token = tokens.pop(0)
+        if token in ("-a", "--attribute"):
+            if tokens:
+                tokens.pop(0)
+        elif not token.startswith("--attribute="):
+            flags.append(token)
+    return flags
+
+
+def pop_merge_kwargs(kwargs):
+    """
+    Move the arguments of the merging call of split_records() and
+    tree_reduce() out of kwargs
+    """
+    merge_kwargs = {}
+    for key in MERGE_KWARGS:
+        if key in kwargs:
+            merge_kwargs[key] = kwargs.pop(key)
+    for key in SHARED_KWARGS:
+        if key in kwargs:
+            merge_kwargs[key] = kwargs[key]
+    return merge_kwargs
+
+
+def make_executor(executor, max_workers=None):
+    """Return a pool of max_workers threads or processes"""
+    if executor == "thread":
+        return concurrent.futures.ThreadPoolExecutor(max_workers)
+    elif executor == "process":
+        return concurrent.futures.ProcessPoolExecutor(max_workers)
+    raise ValueError(
+        "Unknown value provided for executor.  Valid values are "
+        "'thread' and 'process'"
+    )
+
+
+def _call_operator(nco, nco_command, input, kwargs):
+    """Run a single operator call of Nco.map(), possibly in another process"""
+    result = getattr(nco, nco_command)(input=input, **kwargs)
+    if isinstance(result, ScratchFile):
+        # hand the temporary output over to the Scratch of Nco.map()'s caller
+        return nco.scratch.release(result), True, nco.stats
+    return result, False, nco.stats
+
+
+def json_description(group):
+    """Normalize a group of the output of ncks --json -m --hdn for describe()"""
+
+    def value(attribute):
+        # types other than float, char and int come as {"type":, "data":}
+        if isinstance(attribute, dict) and "data" in attribute:
+            attribute = attribute["data"]
+        if isinstance(attribute, list) and len(attribute) == 1:
+            # single values as the cdf modules give them
+            return attribute[0]
+        return attribute
+
+    def attributes(obj):
+        return dict(
+            (name, value(attribute))
+            for name, attribute in obj.get("attributes", {}).items()
+            if name not in HIDDEN_ATTRIBUTES
+        )
+
+    description = {
+        "dimensions": group.get("dimensions", {}),
+        "variables": {},
+        "attributes": attributes(group),
+    }
+    for name, variable in group.get("variables", {}).items():
+        chunking = None
+        if variable.get("attributes", {}).get("_Storage") != "contiguous":
+            chunking = value(variable.get("attributes", {}).get("_ChunkSizes"))
+        if chunking is not None and not isinstance(chunking, list):
+            chunking = [chunking]
+        description["variables"][name] = {
+            "type": variable.get("type"),
+            "shape": variable.get("shape", []),
+            "chunking": chunking,
+            "attributes": attributes(variable),
+        }
+    if "groups" in group:
+        description["groups"] = dict(
+            (name, json_description(subgroup))
+            for name, subgroup in group["groups"].items()
+        )
+    return description
+
+
+def cdf_description(file_handle):
+    """describe() a file opened by netCDF4 or scipy.io.netcdf"""
+
+    def value(attribute):
+        if isinstance(attribute, bytes):
+            return attribute.decode("utf-8", "replace")
+        if hasattr(attribute, "tolist"):
+            return attribute.tolist()
+        return attribute
+
+    def attributes(obj):
+        if hasattr(obj, "ncattrs"):
+            return dict((name, value(obj.getncattr(name))) for name in obj.ncattrs())
+        return dict((name, value(attr)) for name, attr in obj._attributes.items())
+
+    def size(dimension):
+        # scipy keeps sizes, None for the record dimension
+        if dimension is None:
+            return file_handle._recs
+        if isinstance(dimension, int):
+            return dimension
+        return len(dimension)
+
+    description = {
+        "dimensions": dict(
+            (name, size(dimension))
+            for name, dimension in file_handle.dimensions.items()
+        ),
+        "variables": {},
+        "attributes": attributes(file_handle),
+    }
+    for name, variable in file_handle.variables.items():
+        # scipy only has the dtype of the data
+        dtype = getattr(variable, "dtype", None)
+        if dtype is None:
+            dtype = variable.data.dtype
+        if dtype is str:
+            type_name = "string"
+        elif dtype.kind == "S":
+            type_name = "char"
         else:
-            # generate dummy mask which is always valid
-            retval = np.ma.array(data)
+            type_name = NC_TYPES.get(dtype.name, dtype.name)
+        chunking = None
+        if hasattr(variable, "chunking"):
+            chunking = variable.chunking()
+            if chunking == "contiguous":
+                chunking = None
+        description["variables"][name] = {
+            "type": type_name,
+            "shape": list(variable.dimensions),
+            "chunking": chunking,
+            "attributes": attributes(variable),
+        }
+    groups = getattr(file_handle, "groups", None)
+    if groups:
+        description["groups"] = dict(
+            (name, cdf_description(group)) for name, group in groups.items()
+        )
+    return description
+
+
+def parse_version_text(text):
+    """Return the version number from the output of an NCO --version call"""
+    match = re.search(r"NCO netCDF Operators version (\d.*) ", text)
+    # some versions write version information in quotation marks
+    if not match:
+        match = re.search(r'NCO netCDF Operators version "(\d.*)" ', text)
+    return match.group(1).split(" ")[0]
 
-        return retval
+
+def probe_nco(nco_path, persist=True):
+    """
+    Return the capabilities of the NCO installation at nco_path, see
+    Nco.capabilities().  Probing runs "ncra --version" and "ncks --help".
+    """
+    with _capabilities_lock:
+        if nco_path in _capabilities:
+            return _capabilities[nco_path]
+
+        ncra = os.path.join(nco_path, "ncra")
+        probe_file = None
+        if persist:
+            try:
+                stat = os.stat(ncra)
+            except OSError:
+                pass
+            else:
+                stamp = "{0}:{1}:{2}".format(
+                    os.path.realpath(ncra), stat.st_size, stat.st_mtime_ns
+                )
+                probe_file = cache_dir(
+                    "capabilities",
+                    hashlib.sha1(stamp.encode("utf-8")).hexdigest() + ".json",
+                )
+                try:
+                    with open(probe_file, encoding="utf-8") as f:
+                        _capabilities[nco_path] = json.load(f)
+                    return _capabilities[nco_path]
+                except (OSError, ValueError):
+                    pass
+
+        def run(cmd):
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            retvals = proc.communicate()
+            return (retvals[0] + retvals[1]).decode("utf-8", "replace")
+
+        version = parse_version_text(run([ncra, "--version"]))
+        ncks_help = run([os.path.join(nco_path, "ncks"), "--help"])
+        capabilities = {
+            "version": version,
+            "operators": [
+                operator
+                for operator in OPERATORS
+                if os.access(os.path.join(nco_path, operator), os.X_OK)
+            ],
+            # JSON output of ncks appeared in NCO 4.6.1
+            "json": "--json" in ncks_help
+            or parse_version(version) >= parse_version("4.6.1"),
+            "thr_nbr": "--thr_nbr" in ncks_help,
+            "ppc": "--ppc" in ncks_help,
+            "quantize": "--qnt" in ncks_help,
+        }
+
+        if probe_file is not None:
+            try:
+                os.makedirs(os.path.dirname(probe_file), exist_ok=True)
+                fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(probe_file))
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(capabilities, f)
+                os.replace(tmp_file, probe_file)
+            except OSError:
+                pass
+
+        _capabilities[nco_path] = capabilities
+        return capabilities
 
 
 def auto_doc(tool, nco_self):
     """
     Generate the __doc__ string of the decorated function by
-    retrieving the nco man page or help information.
+    retrieving the nco man page or help information.  This only happens
+    when __doc__ is read, see OperatorMethod.
 
     :param tool:
     :param nco_self:
     :return:
     """
+
+    def add_doc(func):
+        return OperatorMethod(func, tool, nco_self.nco_path)
+
+    return add_doc
+
+
+def operator_doc(tool, nco_path):
+    """
+    Return the man page of an NCO operator, or its --help output if there is
+    no man page.  The result is cached on disk for each NCO installation.
+    """
+
     def get_doc(cmd):
         try:
-            return nco_self.call(cmd).get("stdout", b"").decode("utf-8")
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            return proc.communicate()[0].decode("utf-8")
         except Exception:
             return ""
 
-    def add_doc(func):
-        doc = get_doc(["man", tool])
-        if not doc:
-            doc = get_doc([tool, "--help"])
-        else:
-            m = re.search(r"(?<=\n\n)\S", doc)
-            if m:
-                doc = doc[m.start():]
-        func.__doc__ = doc
-        func.__name__ = tool
-        return func
+    executable = os.path.join(nco_path, tool)
+    try:
+        stat = os.stat(executable)
+    except OSError:
+        doc_file = None
+    else:
+        stamp = "{0}:{1}:{2}".format(
+            os.path.realpath(executable), stat.st_size, stat.st_mtime_ns
+        )
+        doc_file = cache_dir(
+            "docs",
+            "{0}-{1}.txt".format(
+                tool, hashlib.sha1(stamp.encode("utf-8")).hexdigest()
+            ),
+        )
+        try:
+            with open(doc_file, encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            pass
+
+    doc = get_doc(["man", tool])
+    if not doc:
+        doc = get_doc([executable, "--help"])
+    else:
+        m = re.search(r"(?<=\n\n)\S", doc)
+        if m:
+            doc = doc[m.start():]
+
+    if doc and doc_file is not None:
+        try:
+            os.makedirs(os.path.dirname(doc_file), exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(doc_file))
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(doc)
+            os.replace(tmp_file, doc_file)
+        except OSError:
+            pass
+    return doc
+
+
+class OperatorMethod(object):
+    # The method of an operator that Nco.__getattr__ puts on the class.  Its
+    # __doc__ is the man page of the operator, which is only retrieved when
+    # it is read so that calling an operator costs no extra processes.
+
+    def __init__(self, func, tool, nco_path):
+        self.func = func
+        self.tool = tool
+        self.nco_path = nco_path
+        self.__name__ = tool
+        self.doc = None
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return types.MethodType(self, instance)
 
-    return add_doc
+    @property
+    def __doc__(self):
+        if self.doc is None:
+            self.doc = operator_doc(self.tool, self.nco_path)
+        return self.doc
@@ -0,0 +1,178 @@
+"""
+pipeline module:
+Chains of NCO operators whose steps use the outputs of earlier steps.
+
+    pipe = nco.pipeline()
+    subset = pipe.add("ncks", input="in.nc", variable="T,Q")
+    derived = pipe.add("ncap2", input=subset, options=["-s", "TQ=T*Q"])
+    pipe.add("ncra", input=derived, output="out.nc")
+    results = pipe.run()
+
+Steps whose inputs are ready run concurrently.  Steps without an output
+write to the scratch space and are removed as soon as every step reading
+them is done, unless nothing reads them, then they are returned by run().
+"""
+
+import concurrent.futures
+
+from .scratch import Scratch
+
+
+class Step(object):
+    """
+    a single operator call of a Pipeline, pass it as (part of) the input of
+    later steps to use its output
+    """
+
+    def __init__(self, name, nco_command, input, output, kwargs):
+        self.name = name
+        self.nco_command = nco_command
+        self.input = input
+        self.output = output
+        self.kwargs = kwargs
+        self.intermediate = output is None
+        self.result = None
+
+    def __repr__(self):
+        return "Step({0!r}, {1!r})".format(self.name, self.nco_command)
+
+    def dependencies(self):
+        if isinstance(self.input, Step):
+            return [self.input]
+        elif isinstance(self.input, str):
+            return []
+        else:
+            return [i for i in self.input if isinstance(i, Step)]
+
+    def resolved_input(self):
+        if isinstance(self.input, Step):
+            return self.input.output
+        elif isinstance(self.input, str):
+            return self.input
+        else:
+            return [i.output if isinstance(i, Step) else i for i in self.input]
+
+
+class Pipeline(object):
+    """
+    declarative chain/graph of NCO operator calls
+
+    :param nco: Nco instance used to run the steps
+    :param scratch_dir: directory for intermediate outputs, e.g. /dev/shm
+        (default: the scratch space of nco)
+    :param max_workers: maximum number of concurrent NCO processes
+    """
+
+    def __init__(self, nco, scratch_dir=None, max_workers=None):
+        self.nco = nco
+        if scratch_dir is None:
+            self.scratch = nco.scratch
+        else:
+            self.scratch = Scratch(scratch_dir)
+        self.max_workers = max_workers
+        self.steps = []
+
+    def add(self, nco_command, input, output=None, name=None, **kwargs):
+        """
+        Add an operator call.  input may contain Steps added before, any
+        other keyword argument is passed on to the operator.
+        """
+        if nco_command not in self.nco.operators:
+            raise AttributeError("Unknown operator: {0}".format(nco_command))
+        if name is None:
+            name = "{0}_{1}".format(nco_command, len(self.steps))
+        if name in [step.name for step in self.steps]:
+            raise ValueError("Step {0} already exists".format(name))
+
+        step = Step(name, nco_command, input, output, kwargs)
+        for dependency in step.dependencies():
+            if dependency not in self.steps:
+                raise ValueError(
+                    "Step {0} is not part of this pipeline".format(dependency.name)
+                )
+        self.steps.append(step)
+        return step
+
+    def scratch_file(self, step):
+        path = self.scratch.new_file(prefix=step.name + "_", suffix=".nc")
+        # don't let the scratch space evict it before all readers are done
+        self.scratch.pin(path)
+        return path
+
+    def run_step(self, step):
+        kwargs = dict(step.kwargs)
+        if step.intermediate:
+            # the scratch file exists already, it must be overwritten
+            kwargs["force"] = True
+        return getattr(self.nco, step.nco_command)(
+            input=step.resolved_input(), output=step.output, **kwargs
+        )
+
+    def run(self):
+        """
+        Run all steps, independent ones concurrently.  Returns a dict
+        mapping the step names to their results for every step that has an
+        explicit output or is not read by any other step.
+        """
+        waiting = {}
+        readers = {}
+        for step in self.steps:
+            dependencies = set(step.dependencies())
+            waiting[step] = len(dependencies)
+            readers.setdefault(step, 0)
+            for dependency in dependencies:
+                readers[dependency] = readers.get(dependency, 0) + 1
+        kept = [
+            step for step in self.steps if not step.intermediate or not readers[step]
+        ]
+
+        created = []
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+                running = {}
+
+                def submit(step):
+                    if step.intermediate:
+                        step.output = self.scratch_file(step)
+                        created.append(step.output)
+                    running[pool.submit(self.run_step, step)] = step
+
+                for step in self.steps:
+                    if waiting[step] == 0:
+                        submit(step)
+
+                while running:
+                    done, _ = concurrent.futures.wait(
+                        running, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        step = running.pop(future)
+                        try:
+                            step.result = future.result()
+                        except BaseException:
+                            for other in running:
+                                other.cancel()
+                            raise
+
+                        if step.intermediate:
+                            self.scratch.track(step.output)
+                            if not readers[step]:
+                                self.scratch.unpin(step.output)
+
+                        for dependency in set(step.dependencies()):
+                            readers[dependency] -= 1
+                            if readers[dependency] == 0 and dependency.intermediate:
+                                self.scratch.remove(dependency.output)
+                                created.remove(dependency.output)
+
+                        for other in self.steps:
+                            if step in other.dependencies():
+                                waiting[other] -= 1
+                                if waiting[other] == 0:
+                                    submit(other)
+        except BaseException:
+            for path in created:
+                self.scratch.remove(path)
+            raise
+
+        return dict((step.name, step.result) for step in kept)
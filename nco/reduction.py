@@ -0,0 +1,358 @@
+"""
+reduction module:
+Parallel reductions:  the input is cut into parts that are reduced
+concurrently, then the partial results are merged.
+
+    mean = nco.split_records("ncra", input=hourly_files, parts=8)
+    mean = nco.tree_reduce("nces", members, fan_in=16)
+
+split_records() cuts the record dimension into "-d time,srt,end"
+hyperslabs (see custom.Limit) aligned to the chunks of the record
+variables, so no chunk is read by two parts.  tree_reduce() reduces groups
+of ensemble members, then groups of their partial results, round by round.
+
+Partial results of ncrcat/ncecat are concatenated, those of ncra/nces are
+combined according to the operation type (-y):  averages are averaged
+weighted by the number of records or members of every part, totals are
+summed and extrema are reduced again.  Weighted averages (-w) can't be
+combined that way and are refused, as are record hyperslabs with strides,
+subcycles or value bounds.  Options of the output file (format,
+compression, chunking and header padding) are given to every call, so the
+partial results and the merged result are written as the serial call
+writes its output.
+"""
+
+import shlex
+
+from .custom import Limit, LimitSingle
+
+# operation types of ncra and how their partial results are combined
+COMBINE = {
+    "avg": "avg",
+    "avgsqr": "avg",
+    "mebs": "avg",
+    "ttl": "ttl",
+    "tabs": "ttl",
+    "max": "max",
+    "mabs": "max",
+    "min": "min",
+    "mibs": "min",
+}
+
+OP_TYPE_OPTIONS = ("-y", "--op_typ", "--operation")
+WEIGHT_OPTIONS = ("-w", "--wgt", "--wgt_var", "--weight")
+WEIGHT_KWARGS = ("wgt", "wgt_var", "weight")
+DIMENSION_OPTIONS = ("-d", "--dimension", "--dmn")
+DIMENSION_KWARGS = ("dimension", "dmn")
+# options of the output file:  flags and options with a value
+OUTPUT_FLAGS = (
+    "-3",
+    "-4",
+    "-5",
+    "-6",
+    "-7",
+    "--3",
+    "--4",
+    "--5",
+    "--6",
+    "--7",
+    "--64bit_offset",
+    "--64bit_data",
+    "--cdf5",
+    "--classic",
+    "--netcdf4",
+)
+OUTPUT_OPTIONS = (
+    "-L",
+    "--dfl_lvl",
+    "--deflate",
+    "--fl_fmt",
+    "--file_format",
+    "--cmp",
+    "--compression",
+    "--cnk_plc",
+    "--chunk_policy",
+    "--cnk_map",
+    "--chunk_map",
+    "--cnk_dmn",
+    "--chunk_dimension",
+    "--cnk_sz",
+    "--chunk_size",
+    "--cnk_min",
+    "--chunk_min",
+    "--cnk_byt",
+    "--chunk_byte",
+    "--cnk_csh",
+    "--chunk_cache",
+    "--cnk_scl",
+    "--chunk_scalar",
+    "--hdr_pad",
+    "--header_pad",
+)
+OUTPUT_KWARGS = tuple(
+    name[2:] for name in OUTPUT_FLAGS + OUTPUT_OPTIONS if name.startswith("--")
+)
+
+# operators that concatenate, the others reduce
+CONCATENATORS = ("ncrcat", "ncecat")
+
+# operators combining the partial results of an operator
+MERGE_OPERATORS = {
+    "ncra": "ncra",
+    "ncrcat": "ncrcat",
+    "nces": "nces",
+    "ncea": "ncea",
+    "ncecat": "ncrcat",
+}
+
+
+def record_layout(file_handle, dim=None):
+    """
+    Return name, length and chunk size of the record dimension (or of dim)
+    of a file opened by netCDF4 or scipy.io.netcdf
+    """
+    for name, dimension in file_handle.dimensions.items():
+        if dim is None:
+            # scipy has None for the record dimension
+            if dimension is not None and not (
+                hasattr(dimension, "isunlimited") and dimension.isunlimited()
+            ):
+                continue
+        elif name != dim:
+            continue
+
+        if dimension is None:
+            length = file_handle._recs
+        elif isinstance(dimension, int):
+            length = dimension
+        else:
+            length = len(dimension)
+        # the chunks of the largest record variable, which dominates the I/O
+        chunk, largest = 1, -1
+        for variable in file_handle.variables.values():
+            if tuple(variable.dimensions)[:1] != (name,):
+                continue
+            record_size = 1
+            for size in variable.shape[1:]:
+                record_size *= size
+            if record_size <= largest:
+                continue
+            largest = record_size
+            chunking = None
+            if hasattr(variable, "chunking"):
+                chunking = variable.chunking()
+            chunk = 1 if chunking in (None, "contiguous") else chunking[0]
+        return name, length, chunk
+
+    if dim is None:
+        raise ValueError("The file has no record dimension")
+    raise ValueError("Cannot find dimension: {0}".format(dim))
+
+
+def split_ranges(length, parts, chunk=1, first=0):
+    """
+    Cut range(first, length) into at most parts (srt, end) index ranges,
+    end included, whose inner bounds are multiples of chunk
+    """
+    if length <= first:
+        return []
+    step = -(-(length - first) // max(parts, 1))
+    step = max(chunk, -(-step // chunk) * chunk)
+    starts = [first]
+    for part in range(1, parts):
+        # the chunk boundary nearest to the even split
+        bound = (first + part * step + chunk // 2) // chunk * chunk
+        if bound >= length:
+            break
+        if bound > starts[-1]:
+            starts.append(bound)
+    return [(start, end - 1) for start, end in zip(starts, starts[1:] + [length])]
+
+
+def operation_type(options):
+    """Return the operation type (-y) among options, "avg" by default"""
+    tokens = []
+    for option in options:
+        if isinstance(option, str):
+            tokens.extend(option.split())
+    for i, token in enumerate(tokens):
+        if token in OP_TYPE_OPTIONS and i + 1 < len(tokens):
+            return tokens[i + 1]
+        for name in OP_TYPE_OPTIONS[1:]:
+            if token.startswith(name + "="):
+                return token[len(name) + 1:]
+    return "avg"
+
+
+def check_unweighted(options, kwargs=None):
+    """Raise ValueError for weights (-w), partial results can't be merged"""
+    tokens = []
+    for option in options:
+        if isinstance(option, str):
+            tokens.extend(option.split())
+    weighted = [
+        token
+        for token in tokens
+        if token in WEIGHT_OPTIONS
+        or token.startswith(tuple(name + "=" for name in WEIGHT_OPTIONS[1:]))
+    ]
+    weighted.extend(key for key in WEIGHT_KWARGS if (kwargs or {}).get(key))
+    if weighted:
+        raise ValueError(
+            "Weighted partial results can't be combined: {0}".format(weighted[0])
+        )
+
+
+def record_hyperslab(options, dim, length):
+    """
+    Take the hyperslab of the record dimension dim (of length records)
+    out of options.  Returns the other options and the first and last
+    record it selects, raises ValueError for hyperslabs that aren't a
+    single index range.
+    """
+    # str and iterable options as one stream of tokens, other objects as is
+    items = []
+    for option in options:
+        if isinstance(option, str):
+            items.extend(shlex.split(option))
+        elif hasattr(option, "prn_option"):
+            items.append(option)
+        else:
+            items.extend(option)
+
+    remaining, hyperslabs = [], []
+    while items:
+        item = items.pop(0)
+        if isinstance(item, Limit) and item.dmn_name == dim:
+            if (
+                isinstance(item.srt, float)
+                or isinstance(item.end, float)
+                or item.srd not in ("", 1)
+                or item.drn != ""
+            ):
+                raise ValueError(
+                    "Only index ranges of the records can be split: {0}".format(item)
+                )
+            if isinstance(item, LimitSingle):
+                hyperslabs.append((item.srt, item.srt))
+            else:
+                hyperslabs.append((item.srt, item.end))
+            continue
+        if not isinstance(item, str):
+            remaining.append(item)
+            continue
+
+        value = None
+        if item in DIMENSION_OPTIONS and items and isinstance(items[0], str):
+            value = items.pop(0)
+        elif item.startswith(tuple(name + "=" for name in DIMENSION_OPTIONS[1:])):
+            value = item.split("=", 1)[1]
+        if value is None or value.split(",")[0] != dim:
+            remaining.append(item)
+            if value is not None:
+                remaining.append(value)
+            continue
+        bounds = value.split(",")[1:]
+        try:
+            if len(bounds) > 3 or (len(bounds) == 3 and bounds[2] not in ("", "1")):
+                raise ValueError(value)
+            bounds = [int(bound) if bound else "" for bound in bounds[:2]]
+        except ValueError:
+            raise ValueError(
+                "Only index ranges of the records can be split: {0}".format(value)
+            )
+        if len(bounds) == 1:
+            # a single record
+            bounds.append(bounds[0])
+        hyperslabs.append(tuple(bounds))
+
+    if len(hyperslabs) > 1:
+        raise ValueError("Several hyperslabs of the records can't be split")
+    first, last = 0, length - 1
+    if hyperslabs:
+        srt, end = hyperslabs[0]
+        first = first if srt == "" else int(srt)
+        last = last if end == "" else int(end)
+        if not 0 <= first <= last < length:
+            raise ValueError(
+                "Records {0} to {1} are out of range of {2} records".format(
+                    first, last, length
+                )
+            )
+    return remaining, first, last
+
+
+def dimension_options(kwargs):
+    """
+    Move the hyperslabs given as keyword arguments (dimension="lat,0,5" or
+    a list of them) out of kwargs into options
+    """
+    options = []
+    for key in DIMENSION_KWARGS:
+        values = kwargs.pop(key, None)
+        if not values:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        options.extend("--{0}={1}".format(key, value) for value in values)
+    return options
+
+
+def output_options(options, kwargs=None):
+    """
+    The options of the output file (format, compression, chunking and
+    header padding) among options and kwargs, as option strings
+    """
+    tokens = []
+    for option in options:
+        if isinstance(option, str):
+            tokens.extend(shlex.split(option))
+    selected = []
+    while tokens:
+        token = tokens.pop(0)
+        if token in OUTPUT_FLAGS:
+            selected.append(token)
+        elif token in OUTPUT_OPTIONS and tokens:
+            selected.extend([token, tokens.pop(0)])
+        elif token.startswith(
+            tuple(name + "=" for name in OUTPUT_OPTIONS if name.startswith("--"))
+        ) or (token.startswith("-L") and not token.startswith("--")):
+            selected.append(token)
+    for key in OUTPUT_KWARGS:
+        value = (kwargs or {}).get(key)
+        if value is True:
+            selected.append("--{0}".format(key))
+        elif isinstance(value, (str, int, float)) and value is not False:
+            selected.append("--{0}={1}".format(key, value))
+        elif value:
+            selected.append("--{0}={1}".format(key, ",".join(value)))
+    return selected
+
+
+def part_options(options, dim, start, end):
+    """options of the call reducing the records start to end"""
+    return list(options) + [Limit(dim, start, end)]
+
+
+def merge_options(nco_command, options, counts, kwargs=None):
+    """
+    options of the call merging the partial results of nco_command over
+    parts of counts records (or ensemble members) each.  Averages are
+    weighted by the counts (-w) unless these are all equal.  The options
+    of the output file among options and kwargs are kept.
+    """
+    merge = output_options(options, kwargs)
+    if nco_command in CONCATENATORS:
+        return merge
+    check_unweighted(options)
+    op_type = operation_type(options)
+    try:
+        combine = COMBINE[op_type]
+    except KeyError:
+        raise ValueError(
+            "Partial results of ncra -y {0} can't be combined".format(op_type)
+        )
+    merge.extend(["-y", combine])
+    if combine == "avg" and len(set(counts)) > 1:
+        merge.extend(["-w", ",".join(str(count) for count in counts)])
+    return merge
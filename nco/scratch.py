@@ -0,0 +1,173 @@
+"""
+scratch module:
+Managed scratch space for the temporary outputs of the NCO operators.
+
+The operators return a ScratchFile (a str subclass) when no output is
+given.  Its file is removed as soon as the ScratchFile is garbage collected,
+when the Scratch is cleaned up (e.g. on leaving a with block) or when it is
+evicted because the scratch space exceeds its byte budget.
+
+    with Scratch("/dev/shm", max_bytes=2 ** 30) as scratch:
+        nco = Nco(scratch=scratch)
+        mean = nco.ncra(input="in.nc")
+"""
+
+import collections
+import os
+import tempfile
+import threading
+import weakref
+
+
+class ScratchFile(str):
+    """path of a file in a Scratch, removed when it is garbage collected"""
+
+    def __reduce__(self):
+        # the file belongs to the process that created it, see Scratch.release
+        return (str, (str(self),))
+
+
+class Scratch(object):
+    """
+    directory for temporary operator outputs with a total byte budget
+
+    :param directory: directory of the scratch files (default: tempfile dir)
+    :param max_bytes: total size of the scratch files, the least recently
+        used files are removed when it is exceeded (default: no limit)
+    :param fast_directory: directory on fast storage, e.g. /dev/shm, used
+        for calls whose inputs are at most fast_max_bytes in total
+    :param fast_max_bytes: see fast_directory
+    """
+
+    def __init__(
+        self, directory=None, max_bytes=None, fast_directory=None, fast_max_bytes=0
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fast_directory = fast_directory
+        self.fast_max_bytes = fast_max_bytes
+        self.files = collections.OrderedDict()
+        self.pinned = set()
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        # the files belong to this process, a copy starts out empty
+        state = self.__dict__.copy()
+        state["files"] = collections.OrderedDict()
+        state["pinned"] = set()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+    def __contains__(self, path):
+        return isinstance(path, str) and path in self.files
+
+    @property
+    def total_bytes(self):
+        with self.lock:
+            return sum(size for size, _ in self.files.values())
+
+    def new_file(self, prefix="", suffix=".tmp", size_hint=None):
+        """
+        Create an empty scratch file and return its ScratchFile path.
+        size_hint is the expected size (e.g. of the inputs), it decides
+        between the fast and the regular directory.
+        """
+        directory = self.directory
+        if (
+            self.fast_directory is not None
+            and size_hint is not None
+            and size_hint <= self.fast_max_bytes
+        ):
+            directory = self.fast_directory
+
+        fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=directory)
+        os.close(fd)
+        return self.adopt(path)
+
+    def adopt(self, path):
+        """Put an existing file under the management of this Scratch"""
+        scratch_file = ScratchFile(path)
+        with self.lock:
+            finalizer = weakref.finalize(scratch_file, self.remove, str(path))
+            self.files[str(path)] = (0, finalizer)
+        return scratch_file
+
+    def release(self, path):
+        """Stop managing path, the file is kept.  Returns path as str."""
+        with self.lock:
+            entry = self.files.pop(str(path), None)
+            self.pinned.discard(str(path))
+        if entry is not None:
+            entry[1].detach()
+        return str(path)
+
+    def pin(self, path):
+        """Protect path from eviction, e.g. while it is still to be read"""
+        with self.lock:
+            self.pinned.add(str(path))
+
+    def unpin(self, path):
+        with self.lock:
+            self.pinned.discard(str(path))
+
+    def track(self, path):
+        """
+        Record the size of path after an operator wrote it, mark it as most
+        recently used and evict other files to stay within max_bytes.
+        """
+        path = str(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+
+        with self.lock:
+            if path not in self.files:
+                return
+            self.files[path] = (size, self.files[path][1])
+            self.files.move_to_end(path)
+            if self.max_bytes is None:
+                return
+
+            total = sum(size for size, _ in self.files.values())
+            for other in list(self.files):
+                if total <= self.max_bytes:
+                    break
+                if other == path or other in self.pinned:
+                    continue
+                total -= self.files[other][0]
+                self.remove(other)
+
+    def touch(self, path):
+        """Mark path as most recently used"""
+        with self.lock:
+            if str(path) in self.files:
+                self.files.move_to_end(str(path))
+
+    def remove(self, path):
+        with self.lock:
+            entry = self.files.pop(str(path), None)
+            self.pinned.discard(str(path))
+        if entry is not None:
+            entry[1].detach()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self):
+        """Remove all scratch files"""
+        with self.lock:
+            paths = list(self.files)
+        for path in paths:
+            self.remove(path)
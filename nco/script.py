@@ -0,0 +1,237 @@
+"""
+script module:
+Many ncap2 expressions run in a single pass over the data.
+
+    script = nco.ncap2_script()
+    script.add("TK = T + 273.15")
+    script.add("TK@units = \"K\"; TF = TK * 1.8 - 459.67")
+    script.run(input="in.nc", output="out.nc")
+
+Every separate ncap2 call reads and writes the whole file, a script of all
+expressions does so once.  The expressions run in the order they were
+added, as the separate calls would have.  Before running, the variables
+each statement reads are checked against those defined by earlier
+statements and those of the input, so a typo or a statement added before
+the one it depends on fails before the pass over the data.  Intermediate
+variables not in keep become RAM variables, which are not written.
+
+The script file is content addressed:  the same expressions reuse the same
+file in cache_dir("scripts"), so results of the script can also be served
+by the ResultCache.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+from .cache import cache_dir
+
+STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+COMMENT = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+# "name =", "*name =", "name[$time,$lat] =" or "name@att =", not "=="
+ASSIGNMENT = re.compile(
+    r"^\s*(\*?)([A-Za-z_]\w*)\s*(\[[^\]]*\])?\s*(@\w+)?\s*([-+*/^%]?)=(?!=)"
+)
+# identifiers that aren't dimensions ($), attributes (@), methods (.) or
+# part of a number
+IDENTIFIER = re.compile(r"(?<![\w.$@])([A-Za-z_]\w*)\b(?!\s*\()")
+# the definition of a variable, to be prefixed with "*"
+RAM_DEFINITION = r"(^\s*|[;{{}}]\s*)({0}\s*(?:\[[^\]]*\])?\s*=(?!=))"
+KEYWORDS = frozenset(
+    ["if", "else", "where", "elsewhere", "for", "while", "break", "continue"]
+)
+
+
+def statements(expression):
+    """Split an ncap2 expression into its statements, strings blanked out"""
+    text = COMMENT.sub("", STRING.sub('""', expression))
+    return [s.strip() for s in re.split(r"[;{}]", text) if s.strip()]
+
+
+def analyze(statement):
+    """
+    Return the variable a statement defines (None for attributes and
+    statements that aren't assignments), whether it is a RAM variable, and
+    the variables it reads.  The variable of an attribute assignment isn't
+    read, see attribute_owner().
+    """
+    defined, ram = None, False
+    match = ASSIGNMENT.match(statement)
+    body = statement
+    if match is not None:
+        ram = bool(match.group(1))
+        name = match.group(2)
+        body = statement[match.end():]
+        if match.group(5) and not match.group(4):
+            # "name += ...", name must exist
+            body = name + " " + body
+        if not match.group(4):
+            defined = name
+    reads = set(IDENTIFIER.findall(body)) - KEYWORDS
+    return defined, ram, reads
+
+
+def attribute_owner(statement):
+    """
+    The variable whose attribute a statement assigns, None for global
+    attributes and other statements
+    """
+    match = ASSIGNMENT.match(statement)
+    if match is None or not match.group(4) or match.group(2) == "global":
+        return None
+    return match.group(2)
+
+
+class Ncap2Script(object):
+    """
+    ncap2 expressions collected into one script (-S)
+
+    :param nco: Nco instance running the script (only needed for run())
+    :param expressions: initial expression or list of expressions
+    :param keep: variables to write, other new variables of the script are
+        RAM variables (default: write all)
+    :param directory: directory of the script files (default:
+        cache_dir("scripts"))
+    """
+
+    def __init__(self, nco=None, expressions=None, keep=None, directory=None):
+        self.nco = nco
+        self.expressions = []
+        self.keep = None if keep is None else set(keep)
+        if directory is None:
+            directory = cache_dir("scripts")
+        self.directory = directory
+        if isinstance(expressions, str):
+            expressions = [expressions]
+        for expression in expressions or []:
+            self.add(expression)
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def add(self, expression):
+        """
+        Append an expression (one or more statements, as given to -s),
+        returns the script for chaining
+        """
+        expression = expression.strip()
+        # options as passed to separate calls: '-s "a=b*2"'
+        if expression.startswith("-s "):
+            expression = expression[3:].strip()
+        if len(expression) > 1 and expression[0] == expression[-1] in "'\"":
+            expression = expression[1:-1]
+        self.expressions.append(expression.rstrip().rstrip(";"))
+        return self
+
+    def definitions(self):
+        """Names of the variables the script defines, in order"""
+        names = []
+        for expression in self.expressions:
+            for statement in statements(expression):
+                defined, _, _ = analyze(statement)
+                if defined is not None and defined not in names:
+                    names.append(defined)
+        return names
+
+    def undefined(self, available=()):
+        """
+        Return (statement, name) of every variable read by a statement that
+        neither an earlier statement defines nor is in available, and of
+        every variable with an attribute assigned that is neither defined by
+        the script nor in available
+        """
+        known = set(available)
+        definitions = set(self.definitions())
+        missing = []
+        for expression in self.expressions:
+            for statement in statements(expression):
+                defined, _, reads = analyze(statement)
+                for name in sorted(reads - known):
+                    if name != defined:
+                        missing.append((statement, name))
+                owner = attribute_owner(statement)
+                if owner is not None and owner not in known | definitions:
+                    missing.append((statement, owner))
+                if defined is not None:
+                    known.add(defined)
+        return missing
+
+    def check(self, available=()):
+        """Raise ValueError for the variables undefined() finds"""
+        missing = self.undefined(available)
+        if missing:
+            raise ValueError(
+                "Undefined variables in ncap2 script: "
+                + ", ".join(
+                    "{0} (in {1!r})".format(name, statement)
+                    for statement, name in missing
+                )
+            )
+
+    def text(self, available=None):
+        """
+        The script:  with keep, the first definition of every new variable
+        (not in available) that isn't kept makes it a RAM variable
+        """
+        ram = set()
+        if self.keep is not None:
+            ram = set(self.definitions()) - self.keep - set(available or ())
+
+        lines = []
+        for expression in self.expressions:
+            for name in sorted(ram):
+                definition = re.compile(
+                    RAM_DEFINITION.format(re.escape(name)), re.MULTILINE
+                )
+                expression, count = definition.subn(r"\1*\2", expression, count=1)
+                if count:
+                    ram.discard(name)
+            lines.append(expression + ";")
+        return "\n".join(lines) + "\n"
+
+    def path(self, available=None):
+        """Path of the script file, written once per content"""
+        text = self.text(available).encode("utf-8")
+        digest = hashlib.sha256(text).hexdigest()[:32]
+        path = os.path.join(self.directory, "ncap2-{0}.nco".format(digest))
+        if not os.path.isfile(path):
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(text)
+            os.replace(tmp_file, path)
+        return path
+
+    def prn_option(self):
+        return ["-S", self.path()]
+
+    def run(self, input, append=False, new_only=False, check=True, **kwargs):
+        """
+        Run the script with a single ncap2 call
+
+        :param input: input file
+        :param append: append to the output file (-A)
+        :param new_only: only write the variables the script defines (-v)
+        :param check: check the variables the statements read against the
+            input (see check())
+        :param kwargs: passed on to ncap2
+        """
+        if self.nco is None:
+            raise ValueError("An Nco instance is needed to run the script")
+        available = None
+        if check or self.keep is not None:
+            description = self.nco.describe(input)
+            available = set(description["variables"]) | set(
+                description["dimensions"]
+            )
+        if check:
+            self.check(available)
+
+        options = list(kwargs.pop("options", None) or [])
+        options.extend(["-S", self.path(available)])
+        if append:
+            options.append("-A")
+        if new_only:
+            options.append("-v")
+        return self.nco.ncap2(input=input, options=options, **kwargs)
@@ -0,0 +1,102 @@
+"""
+trace module:
+Timeline of operator calls in the Chrome trace event format, which can be
+viewed with Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+
+    tracer = Tracer()
+    nco.add_call_hook(tracer)
+    list(nco.map("ncpdq", inputs, max_workers=8, arrange="time,lat,lon"))
+    tracer.export("trace.json")
+
+Every call is a slice on the timeline of the process and thread that ran
+it, so queueing, overlap, idle gaps and stragglers are easy to spot.
+Calls overlapping on one thread (asyncio, see nco.aio) get a track of
+their own each, "MainThread (2)" and so on, as slices of a track have to
+nest.
+"""
+
+import bisect
+import json
+import threading
+
+
+class Tracer(object):
+    """call hook (see Nco.add_call_hook) recording a timeline of the calls"""
+
+    def __init__(self):
+        self.events = []
+        # (process, thread) -> tracks of the calls it ran:  (start, end) of
+        # every call on the track, in order, and the track id
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def track(self, stats, start, end):
+        """The track (tid) of a call from start to end, with the lock held"""
+        thread = (stats["process"], stats["thread"])
+        tracks = self.threads.setdefault(thread, [])
+        for spans, tid in tracks:
+            index = bisect.bisect(spans, (start, end))
+            if (index == 0 or spans[index - 1][1] <= start) and (
+                index == len(spans) or end <= spans[index][0]
+            ):
+                spans.insert(index, (start, end))
+                return tid
+
+        # tids are numbers, one per track in the trace
+        tid = sum(len(tracks) for tracks in self.threads.values()) + 1
+        tracks.append(([(start, end)], tid))
+        name = stats["thread_name"]
+        if len(tracks) > 1:
+            name = "{0} ({1})".format(name, len(tracks))
+        self.events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": stats["process"],
+                "tid": tid,
+                "args": {"name": name},
+            }
+        )
+        return tid
+
+    def __call__(self, stats):
+        start = stats["start"] * 1e6
+        end = start + (stats["wall_time"] or 0.0) * 1e6
+        event = {
+            "name": stats["operator"],
+            "cat": "nco",
+            "ph": "X",
+            # microseconds
+            "ts": start,
+            "dur": end - start,
+            "pid": stats["process"],
+            "args": {
+                "pid": stats["pid"],
+                "inputs": stats["inputs"],
+                "output": stats["output"],
+                "cmd": stats["cmd"],
+                "returncode": stats["returncode"],
+                "user_time": stats["user_time"],
+                "sys_time": stats["sys_time"],
+                "max_rss": stats["max_rss"],
+            },
+        }
+
+        with self.lock:
+            event["tid"] = self.track(stats, start, end)
+            self.events.append(event)
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+            self.threads = {}
+
+    def trace(self):
+        """Return the recorded calls as a Chrome trace dict"""
+        with self.lock:
+            return {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        """Write the recorded calls to path as Chrome trace JSON"""
+        with open(path, "w") as f:
+            json.dump(self.trace(), f)
@@ -0,0 +1,103 @@
+"""
+Unit tests for cache.py.
+"""
+import os
+import time
+
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.cache import ResultCache
+
+
+pytestmark = pytest.mark.usefixtures("cleandir")
+
+
+def test_key_follows_inputs(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    infile = str(tmp_path / "in.nc")
+    with open(infile, "w") as f:
+        f.write("one")
+    cmd = ["ncra", "--output=", infile]
+    key = cache.key(cmd, "5.0.0")
+    assert cache.key(cmd, "5.0.0") == key
+    assert cache.key(cmd, "5.1.0") != key
+    assert cache.key(cmd[:2] + ["-O"] + cmd[2:], "5.0.0") != key
+
+    time.sleep(0.01)
+    with open(infile, "w") as f:
+        f.write("two")
+    assert cache.key(cmd, "5.0.0") != key
+
+
+def test_hash_content(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), hash_content=True)
+    infile = str(tmp_path / "in.nc")
+    with open(infile, "w") as f:
+        f.write("same")
+    key = cache.key(["ncra", infile], "5.0.0")
+    os.utime(infile, (0, 0))
+    assert cache.key(["ncra", infile], "5.0.0") == key
+
+
+def test_hashes_bounded(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), hash_content=True, max_hashes=2)
+    infiles = []
+    for name in ("a", "b", "c"):
+        infiles.append(str(tmp_path / "{0}.nc".format(name)))
+        with open(infiles[-1], "w") as f:
+            f.write(name)
+    cache.file_identity(infiles[0])
+    cache.file_identity(infiles[1])
+    # a is used again, b is the least recently used
+    cache.file_identity(infiles[0])
+    cache.file_identity(infiles[2])
+    assert [stamp[0] for stamp in cache.hashes] == [infiles[0], infiles[2]]
+
+
+def test_store_and_evict(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=150)
+    output = str(tmp_path / "out.nc")
+    with open(output, "wb") as f:
+        f.write(b"x" * 100)
+
+    cache.put("first", output)
+    assert cache.get("missing") is None
+    with open(cache.get("first"), "rb") as f:
+        assert f.read() == b"x" * 100
+
+    cache.put_stdout("second", b"y" * 40)
+    os.utime(cache.entry("second", "out"), (0, 0))
+    cache.put("third", output)
+    # second is the least recently used entry
+    assert cache.get_stdout("second") is None
+    assert cache.get("first") is None
+    assert cache.get("third") is not None
+    assert cache.total_bytes == 100
+
+
+def test_cached_operator(foo_nc, tmp_path, monkeypatch):
+    nco = Nco(cache=ResultCache(str(tmp_path / "cache")))
+    calls = []
+    call = nco.call
+
+    def counting_call(cmd, **kwargs):
+        calls.append(cmd)
+        return call(cmd, **kwargs)
+
+    monkeypatch.setattr(nco, "call", counting_call)
+    nco.ncwa(input=foo_nc, output="first.nc", average="dim0")
+    assert len(os.listdir(str(tmp_path / "cache"))) == 1
+    assert len(calls) == 1
+    nco.ncwa(input=foo_nc, output="second.nc", average="dim0")
+    # served from the cache, NCO didn't run
+    assert len(calls) == 1
+    with open("first.nc", "rb") as first, open("second.nc", "rb") as second:
+        assert first.read() == second.read()
+
+    mean = nco.ncwa(input=foo_nc, average="dim0", returnArray="random")
+    assert isinstance(mean, np.ndarray)
+    dump = nco.ncks(input=foo_nc, options=["-H"])
+    assert nco.ncks(input=foo_nc, options=["-H"]) == dump
+    assert len(os.listdir(str(tmp_path / "cache"))) == 2
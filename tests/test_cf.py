@@ -0,0 +1,101 @@
+"""
+Unit tests for cf.py.
+"""
+import netCDF4
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.cf import read_masked
+from nco.memmap import is_netcdf3
+
+
+@pytest.fixture(params=["NETCDF4", "NETCDF3_CLASSIC"])
+def packed_nc(request, tmp_path):
+    filename = str(tmp_path / "packed.nc")
+    dataset = netCDF4.Dataset(filename, "w", format=request.param)
+    dataset.createDimension("time", None)
+    dataset.createDimension("x", 4)
+    packed = dataset.createVariable("packed", "i2", ("time", "x"), fill_value=-999)
+    packed.scale_factor = np.float32(0.5)
+    packed.add_offset = np.float32(10.0)
+    packed.valid_range = np.array([0, 100], dtype="i2")
+    packed.missing_value = np.int16(-1)
+    unsigned = dataset.createVariable("unsigned", "i1", ("x",))
+    unsigned._Unsigned = "true"
+    plain = dataset.createVariable("plain", "f8", ("x",))
+    for variable in (packed, unsigned):
+        variable.set_auto_maskandscale(False)
+    packed[:] = np.array([[0, 1, -1, -999], [2, 200, 50, 100], [3, 4, 5, 6]])
+    unsigned[:] = np.array([-1, 1, 2, 3], dtype="i1")
+    plain[:] = [1.0, 2.0, 3.0, 4.0]
+    dataset.close()
+    return filename
+
+
+@pytest.mark.parametrize("block_bytes", [8, 2 ** 24])
+def test_read_masked(packed_nc, block_bytes):
+    with netCDF4.Dataset(packed_nc) as dataset:
+        expected = dataset.variables["packed"][:]
+        variable = dataset.variables["packed"]
+        variable.set_auto_maskandscale(False)
+        packed = read_masked(variable, block_bytes=block_bytes)
+
+        assert packed.dtype == np.float32
+        np.testing.assert_array_equal(packed.mask, expected.mask)
+        np.testing.assert_array_equal(packed.compressed(), expected.compressed())
+        assert read_masked(variable, dtype=np.float64).dtype == np.float64
+
+        variable = dataset.variables["unsigned"]
+        variable.set_auto_maskandscale(False)
+        assert read_masked(variable).tolist() == [255, 1, 2, 3]
+
+
+def test_read_masked_unsigned(tmp_path):
+    filename = str(tmp_path / "unsigned.nc")
+    with netCDF4.Dataset(filename, "w", format="NETCDF3_CLASSIC") as dataset:
+        dataset.createDimension("x", 5)
+        variable = dataset.createVariable("u", "i1", ("x",), fill_value=-1)
+        variable._Unsigned = "true"
+        # 1 to 200 as signed bytes
+        variable.valid_range = np.array([1, -56], dtype="i1")
+        variable.set_auto_maskandscale(False)
+        variable[:] = np.array([-1, 0, 1, -56, -55], dtype="i1")
+
+    with netCDF4.Dataset(filename) as dataset:
+        variable = dataset.variables["u"]
+        variable.set_auto_maskandscale(False)
+        values = read_masked(variable)
+        assert values.mask.tolist() == [True, True, False, False, True]
+        assert values.compressed().tolist() == [1, 200]
+
+
+@pytest.mark.parametrize("cdf_module", ["netcdf4", "scipy"])
+def test_read_ma_array(packed_nc, cdf_module):
+    if cdf_module == "scipy" and not is_netcdf3(packed_nc):
+        pytest.skip("scipy reads netCDF3 only")
+    nco = Nco(cdf_module=cdf_module)
+    packed = nco.read_ma_array(packed_nc, "packed")
+    assert packed.tolist() == [
+        [10.0, 10.5, None, None],
+        [11.0, None, 35.0, 60.0],
+        [11.5, 12.0, 12.5, 13.0],
+    ]
+    assert nco.read_ma_array(packed_nc, "plain").mask is np.ma.nomask
+
+    # the pooled handle still masks and scales for everybody else
+    with nco.dataset(packed_nc) as dataset:
+        if cdf_module == "netcdf4":
+            assert dataset.variables["packed"][:].dtype == np.float32
+
+
+def test_read_ma_array_keeps_borrower_settings(packed_nc):
+    nco = Nco(cdf_module="netcdf4")
+    with nco.dataset(packed_nc) as dataset:
+        variable = dataset.variables["packed"]
+        variable.set_auto_scale(False)
+        packed = nco.read_ma_array(packed_nc, "packed")
+        assert packed.dtype == np.float32
+        # the borrower's choice holds
+        assert variable[:].dtype == np.int16
+        assert variable.mask and not variable.scale
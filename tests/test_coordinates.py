@@ -0,0 +1,121 @@
+"""
+Unit tests for coordinates.py.
+"""
+import contextlib
+import os
+
+import netCDF4
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.coordinates import CoordinateIndex, index_range, nearest_index
+from nco.custom import Limit, LimitSingle
+
+
+@pytest.fixture
+def grid_nc(tmp_path):
+    """a file with decreasing latitudes and longitudes from 0 to 350"""
+    filename = str(tmp_path / "grid.nc")
+    dataset = netCDF4.Dataset(filename, "w")
+    dataset.createDimension("lat", 19)
+    dataset.createDimension("lon", 36)
+    lat = dataset.createVariable("lat", "f8", ("lat",))
+    lat.units = "degrees_north"
+    lat[:] = np.linspace(90, -90, 19)
+    lon = dataset.createVariable("lon", "f8", ("lon",))
+    lon.units = "degrees_east"
+    lon[:] = np.arange(0, 360, 10)
+    var = dataset.createVariable("T", "f4", ("lat", "lon"))
+    var[:] = np.random.rand(19, 36)
+    dataset.close()
+    return filename
+
+
+class CountingOpener(object):
+    def __init__(self):
+        self.opened = 0
+
+    @contextlib.contextmanager
+    def __call__(self, path):
+        self.opened += 1
+        with netCDF4.Dataset(path) as dataset:
+            yield dataset
+
+
+def test_index_range():
+    values = np.arange(0.0, 100.0, 10.0)
+    assert index_range(values, 15.0, 50.0) == (2, 5)
+    assert index_range(values, 20.0, 20.0) == (2, 2)
+    assert index_range(values, None, 35.0) == (0, 3)
+    assert index_range(values, 85.0) == (9, 9)
+    assert index_range(values, 91.0, 95.0) is None
+    assert index_range(values[::-1], 15.0, 50.0) == (4, 7)
+    assert index_range(values[::-1], 15.0) == (0, 7)
+
+    lon = np.arange(0.0, 360.0, 10.0)
+    assert index_range(lon, 340.0, 20.0, cyclic=True) == (34, 2)
+    assert index_range(lon, -20.0, 20.0, cyclic=True) == (34, 2)
+    assert index_range(lon, -170.0, -150.0, cyclic=True) == (19, 21)
+    assert index_range(lon, -180.0, 180.0, cyclic=True) == (0, 35)
+    assert index_range(lon[::-1], 340.0, 20.0, cyclic=True) == (33, 1)
+
+
+def test_nearest_index():
+    values = np.arange(0.0, 100.0, 10.0)
+    assert nearest_index(values, 14.0) == 1
+    assert nearest_index(values, 16.0) == 2
+    assert nearest_index(values, -5.0) == 0
+    assert nearest_index(values, 500.0) == 9
+    assert nearest_index(values[::-1], 16.0) == 7
+
+
+def test_resolve(grid_nc):
+    index = CoordinateIndex()
+    opener = CountingOpener()
+
+    limit = index.resolve(grid_nc, Limit("lat", -30.0, 30.0), opener)
+    assert limit.prn_option() == ["-d", "lat,6,12"]
+    limit = index.resolve(grid_nc, Limit("lon", 340.0, 20.0, 2), opener)
+    assert limit.prn_option() == ["-d", "lon,34,2,2"]
+    limit = index.resolve(grid_nc, LimitSingle("lon", 42.0), opener)
+    assert limit.prn_option() == ["-d", "lon,4"]
+    assert opener.opened == 2
+
+    # left to NCO
+    for limit in [Limit("lat", 0, 3), Limit("lat", 30.0, -30.0), Limit("x", 1.0)]:
+        assert index.resolve(grid_nc, limit, opener) is limit
+
+    # a new version of the file is read again
+    with netCDF4.Dataset(grid_nc, "a") as dataset:
+        dataset.variables["lat"][:] = np.linspace(-90, 90, 19)
+    limit = index.resolve(grid_nc, Limit("lat", 60.0, 90.0), opener)
+    assert limit.prn_option() == ["-d", "lat,15,18"]
+
+
+@pytest.mark.parametrize("sidecar", [True, "sidecars"])
+def test_sidecar(grid_nc, tmp_path, sidecar):
+    if sidecar is not True:
+        sidecar = str(tmp_path / sidecar)
+    opener = CountingOpener()
+    CoordinateIndex(sidecar=sidecar).resolve(grid_nc, Limit("lat", 0.0), opener)
+    assert os.path.isfile(CoordinateIndex(sidecar=sidecar).sidecar_path(grid_nc))
+
+    limit = CoordinateIndex(sidecar=sidecar).resolve(
+        grid_nc, Limit("lat", 0.0), opener
+    )
+    assert limit.prn_option() == ["-d", "lat,0,9"]
+    assert opener.opened == 1
+
+
+def test_nco_resolves_limits(grid_nc):
+    nco = Nco(coordinates=True)
+    nco_call = nco.build_call(
+        "ncks", grid_nc, {"options": [Limit("lat", -30.0, 30.0)], "output": "x.nc"}
+    )
+    assert "lat,6,12" in nco_call["cmd"]
+
+    nco_call = nco.build_call(
+        "ncra", [grid_nc, grid_nc], {"options": [Limit("lat", -30.0, 30.0)]}
+    )
+    assert "lat,-30.0,30.0" in nco_call["cmd"]
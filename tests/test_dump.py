@@ -0,0 +1,91 @@
+"""
+Unit tests for dump.py.
+"""
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.dump import parse_dump
+
+
+CDL = b"""netcdf in {
+  dimensions:
+    time = UNLIMITED ; // (3 currently)
+  variables:
+    double time(time) ;
+    float T(time,lat) ;
+    char name(nchar) ;
+      name:note = "a \\"quoted\\"; note" ;
+
+  data:
+    time = 0, 1, 2 ;
+
+    T =
+      273.1, 274.5,
+      _, 280 ;
+
+    name = "a;b", "c", "say \\"hi;\\"" ;
+
+} // group /
+"""
+
+TRD = b"""time[0]=0 days since 1990-01-01
+time[1]=1 days since 1990-01-01
+time[0]=0 lat[0]=-90 T[0]=273.1 kelvin
+time[0]=0 lat[1]=90 T[1]=274.5 kelvin
+time[1]=1 lat[0]=-90 T[2]=_ kelvin
+time[1]=1 lat[1]=90 T[3]=280 kelvin
+"""
+
+
+def test_parse_cdl():
+    arrays = parse_dump(CDL)
+    assert sorted(arrays) == ["T", "name", "time"]
+    np.testing.assert_array_equal(arrays["time"], [0, 1, 2])
+    np.testing.assert_array_equal(arrays["T"], [273.1, 274.5, np.nan, 280])
+    assert list(arrays["name"]) == ["a;b", "c", 'say "hi;"']
+
+    # an unclosed string ends with the dump
+    arrays = parse_dump(CDL.replace(b'"c"', b'"c'))
+    np.testing.assert_array_equal(arrays["time"], [0, 1, 2])
+    assert "name" in arrays
+
+
+def test_parse_trd():
+    arrays = parse_dump(TRD.decode("utf-8"))
+    np.testing.assert_array_equal(arrays["time"], [0, 1])
+    np.testing.assert_array_equal(arrays["T"], [273.1, 274.5, np.nan, 280])
+
+
+@pytest.mark.parametrize("text", [b"1 2.5\n_ 4\n", b"1, 2.5, _, 4"])
+def test_parse_bare_values(text):
+    arrays = parse_dump(text, var_names="T", shapes={"T": (2, 2)})
+    np.testing.assert_array_equal(arrays["T"], [[1, 2.5], [np.nan, 4]])
+
+    with pytest.raises(ValueError):
+        parse_dump(text)
+
+
+def test_parse_select_and_dtype():
+    arrays = parse_dump(CDL, var_names=["time"], dtype=np.int32)
+    assert list(arrays) == ["time"]
+    assert arrays["time"].dtype == np.int32
+
+
+def test_parse_large_dump():
+    values = np.arange(200000) / 8.0
+    text = "\n".join(
+        "time[{0}]={0} T[{1}]={2}".format(i // 100, i, value)
+        for i, value in enumerate(values.tolist())
+    )
+    arrays = parse_dump(text)
+    np.testing.assert_array_equal(arrays["T"], values)
+    assert list(arrays) == ["T"]
+
+
+def test_return_dump(foo_nc):
+    nco = Nco(debug=True)
+    options = ["-H", "-C", "-v", "random"]
+    dump = nco.ncks(input=foo_nc, options=options, returnDump="random")
+    random = nco.ncks(input=foo_nc, variable="random", returnArray="random")
+    np.testing.assert_allclose(dump, np.ravel(random), rtol=1e-6)
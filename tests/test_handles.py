@@ -0,0 +1,121 @@
+"""
+Unit tests for handles.py.
+"""
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.custom import Atted
+from nco.handles import HandlePool
+
+
+class FakeHandle(object):
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for name in ["a.nc", "b.nc", "c.nc"]:
+        path = tmp_path / name
+        path.write_bytes(b"data")
+        paths.append(str(path))
+    return paths
+
+
+def test_reuse_and_evict(files):
+    pool = HandlePool(max_open=2)
+    with pool.borrow(files[0], "r", FakeHandle) as first:
+        pass
+    with pool.borrow(files[0], "r", FakeHandle) as again:
+        assert again is first
+    with pool.borrow(files[0], "r+", FakeHandle) as other_mode:
+        assert other_mode is not first
+
+    # a is the least recently used
+    with pool.borrow(files[1], "r", FakeHandle):
+        pass
+    assert first.closed
+    assert len(pool) == 2
+
+    pool.close()
+    assert other_mode.closed
+    assert len(pool) == 0
+
+
+def test_borrowed_handles_stay_open(files):
+    with HandlePool(max_open=1) as pool:
+        with pool.borrow(files[0], "r", FakeHandle) as first:
+            with pool.borrow(files[1], "r", FakeHandle) as second:
+                assert not first.closed
+                assert len(pool) == 2
+            # over budget, the idle handle goes
+            assert second.closed
+            assert not first.closed
+            assert len(pool) == 1
+    assert first.closed
+
+
+def test_changed_file_is_reopened(files):
+    pool = HandlePool()
+    with pool.borrow(files[0], "r", FakeHandle) as first:
+        with open(files[0], "ab") as f:
+            f.write(b"more")
+        with pool.borrow(files[0], "r", FakeHandle) as second:
+            assert second is not first
+        assert not first.closed
+    assert first.closed
+
+    pool.invalidate(files[0])
+    assert second.closed
+
+    copy = pickle.loads(pickle.dumps(pool))
+    assert len(copy) == 0
+
+
+def test_read_array_reuses_handles(foo_nc, random_field):
+    nco = Nco()
+    first = nco.read_array(foo_nc, "random")
+    assert len(nco.handles) == 1
+    with nco.dataset(foo_nc) as dataset:
+        np.testing.assert_array_equal(nco.read_array(foo_nc, "random"), first)
+        assert dataset.isopen()
+    masked = nco.read_ma_array(foo_nc, "random")
+    np.testing.assert_array_equal(masked[0], random_field)
+    assert len(nco.handles) == 1
+
+    os.utime(foo_nc, ns=(0, 0))
+    with nco.dataset(foo_nc) as reopened:
+        assert reopened is not dataset
+    assert not dataset.isopen()
+
+
+def test_edit_in_place_after_read(foo_nc, tmp_path):
+    nco = Nco()
+    ifile = str(tmp_path / "in_place.nc")
+    nco.ncks(input=foo_nc, output=ifile)
+    nco.read_array(ifile, "random")
+    output = str(tmp_path / "out.nc")
+    nco.read_array(nco.ncks(input=foo_nc, output=output), "random")
+    assert len(nco.handles) == 2
+
+    # NCO can't write a file that is open for reading
+    nco_call = nco.build_call("ncatted", ifile, {"options": ["-h"]})
+    assert len(nco.handles) == 1
+    nco.ncatted(
+        input=ifile, options=[Atted("overwrite", "units", "random", "K")]
+    )
+    nco.ncks(input=foo_nc, output=output, options=["-A"])
+    assert len(nco.handles) == 0
+    with nco.dataset(ifile) as dataset:
+        assert dataset.variables["random"].units == "K"
+    assert nco_call["output"] is None
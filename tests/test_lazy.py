@@ -0,0 +1,96 @@
+"""
+Unit tests for lazy.py.
+"""
+import netCDF4
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.custom import Limit
+
+
+@pytest.fixture
+def fields(tmp_path):
+    """two files of the variables T and Q on a lat/lon grid"""
+    filenames = []
+    for name in ["a.nc", "b.nc"]:
+        filename = str(tmp_path / name)
+        dataset = netCDF4.Dataset(filename, "w")
+        dataset.createDimension("lat", 4)
+        dataset.createDimension("lon", 3)
+        dataset.createVariable("lat", "f8", ("lat",))[:] = np.arange(4)
+        dataset.createVariable("lon", "f8", ("lon",))[:] = np.arange(3)
+        for var_name in ["T", "Q"]:
+            var = dataset.createVariable(var_name, "f8", ("lat", "lon"))
+            var[:] = np.random.rand(4, 3)
+        dataset.close()
+        filenames.append(filename)
+    return filenames
+
+
+def test_fuse_scripts_and_restrict_variables(fields):
+    lazy = Nco().lazy()
+    anomaly = lazy.ncbo(input=fields, op_typ="sbt")
+    scaled = lazy.ncap2(input=anomaly, options=["-s", "TF=T*1.8"])
+    kelvin = lazy.ncap2(input=scaled, options=['-s "TK=T+273.15"'])
+    mean = lazy.ncwa(input=kelvin, average="lon")
+
+    assert mean.plan(variables=["TK"]) == [
+        ("ncbo", fields, ["--op_typ=sbt", "--variable=T"]),
+        ("ncap2", ["<0>"], ["-s", "TF=T*1.8; TK=T+273.15", "-v"]),
+        ("ncwa", ["<1>"], ["--average=lon", "--variable=TK"]),
+    ]
+    # without variables everything is kept
+    assert mean.plan()[0] == ("ncbo", fields, ["--op_typ=sbt"])
+    # the graph itself is not changed
+    assert kelvin.input is scaled
+
+
+def test_push_limits(fields):
+    lazy = Nco().lazy()
+    anomaly = lazy.ncbo(input=fields, op_typ="sbt")
+    mean = lazy.ncwa(input=anomaly, average="lon", options=[Limit("lat", 1, 2)])
+    assert mean.plan() == [
+        ("ncbo", fields, ["-d", "lat,1,2", "--op_typ=sbt"]),
+        ("ncwa", ["<0>"], ["--average=lon"]),
+    ]
+
+    # read by two calls, the hyperslab stays
+    other = lazy.ncwa(input=[anomaly], average="lat")
+    both = lazy.ncbo(input=[mean, other])
+    plan = both.plan()
+    assert plan[0] == ("ncbo", fields, ["--op_typ=sbt"])
+
+
+def test_push_limits_onto_hyperslab(fields):
+    lazy = Nco().lazy()
+    anomaly = lazy.ncbo(input=fields, options=[Limit("lat", 0, 2)])
+    mean = lazy.ncwa(
+        input=anomaly, average="lon", options=[Limit("lat", 1, 1), Limit("lon", 0, 1)]
+    )
+    # indices of lat count from the start of the hyperslab of ncbo
+    assert mean.plan() == [
+        ("ncbo", fields, ["-d", "lat,0,2", "-d", "lon,0,1"]),
+        ("ncwa", ["<0>"], ["-d", "lat,1,1", "--average=lon"]),
+    ]
+
+
+def test_only_deferred_operators():
+    lazy = Nco().lazy()
+    with pytest.raises(AttributeError):
+        lazy.ncks
+    with pytest.raises(TypeError):
+        lazy.ncwa(input="in.nc", output="out.nc")
+
+
+def test_compute(fields, tmp_path):
+    nco = Nco(debug=True)
+    lazy = nco.lazy()
+    anomaly = lazy.ncbo(input=fields, op_typ="sbt")
+    doubled = lazy.ncap2(input=anomaly, options=["-s", "T2=T*2"])
+    mean = lazy.ncwa(input=doubled, average="lon", options=[Limit("lat", 1, 2)])
+    result = mean.compute(variables=["T2"], returnArray="T2")
+
+    with netCDF4.Dataset(fields[0]) as a, netCDF4.Dataset(fields[1]) as b:
+        expected = (a["T"][1:3] - b["T"][1:3]).mean(axis=1) * 2
+    np.testing.assert_allclose(result, expected)
@@ -0,0 +1,73 @@
+"""
+Unit tests for memmap.py.
+"""
+import netCDF4
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.memmap import is_netcdf3, memmap_variable
+
+
+@pytest.fixture(
+    params=["NETCDF3_CLASSIC", "NETCDF3_64BIT_OFFSET", "NETCDF3_64BIT_DATA"]
+)
+def netcdf3_file(request, tmp_path):
+    filename = str(tmp_path / "classic.nc")
+    dataset = netCDF4.Dataset(filename, "w", format=request.param)
+    dataset.createDimension("time", None)
+    dataset.createDimension("lat", 3)
+    dataset.createDimension("lon", 2)
+    dataset.title = "memmap test"
+    field = dataset.createVariable("field", "f4", ("lat", "lon"))
+    field.units = "m"
+    field.valid_range = np.array([0, 10], dtype="i2")
+    field[:] = np.arange(6).reshape(3, 2)
+    time = dataset.createVariable("time", "f8", ("time",))
+    time[:] = [1.0, 2.0, 3.0, 4.0]
+    counts = dataset.createVariable("counts", "i2", ("time", "lat"))
+    counts[:] = np.arange(12).reshape(4, 3)
+    scalar = dataset.createVariable("scalar", "i4", ())
+    scalar.assignValue(7)
+    dataset.close()
+    return filename
+
+
+def test_memmap_variable(netcdf3_file):
+    assert is_netcdf3(netcdf3_file)
+
+    field = memmap_variable(netcdf3_file, "field")
+    assert isinstance(field, np.memmap)
+    np.testing.assert_array_equal(field, np.arange(6).reshape(3, 2))
+    assert not field.flags.writeable
+
+    # record variables are interleaved
+    np.testing.assert_array_equal(memmap_variable(netcdf3_file, "time"), [1, 2, 3, 4])
+    counts = memmap_variable(netcdf3_file, "counts")
+    np.testing.assert_array_equal(counts, np.arange(12).reshape(4, 3))
+    assert memmap_variable(netcdf3_file, "scalar") == 7
+
+    with pytest.raises(KeyError):
+        memmap_variable(netcdf3_file, "missing")
+
+
+def test_read_array_mmap(netcdf3_file, tmp_path):
+    nco = Nco()
+    arrays = nco.read_array(netcdf3_file, ["field", "counts"], mmap=True)
+    np.testing.assert_array_equal(arrays["counts"], np.arange(12).reshape(4, 3))
+    assert isinstance(arrays["field"], np.memmap)
+
+    netcdf4_file = str(tmp_path / "netcdf4.nc")
+    dataset = netCDF4.Dataset(netcdf4_file, "w")
+    dataset.createDimension("x", 2)
+    dataset.createVariable("x", "f8", ("x",))[:] = [1.0, 2.0]
+    dataset.close()
+    assert not is_netcdf3(netcdf4_file)
+    np.testing.assert_array_equal(nco.read_array(netcdf4_file, "x", mmap=True), [1, 2])
+
+
+def test_return_array_mmap(foo_nc, random_field):
+    nco = Nco()
+    random = nco.ncks(input=foo_nc, returnArray="random", mmap=True)
+    assert isinstance(random, np.ndarray)
+    np.testing.assert_array_equal(random[0], random_field)
@@ -0,0 +1,87 @@
+"""
+Unit tests for metadata.py.
+"""
+import netCDF4
+import pytest
+
+from nco import Nco
+from nco.custom import Atted, Rename
+from nco.metadata import MetadataEditor
+
+
+@pytest.fixture
+def editor():
+    return MetadataEditor(Nco())
+
+
+def test_fuse_attribute_edits(editor):
+    editor.add("a.nc", Atted("overwrite", "units", "T", "K"))
+    editor.add("a.nc", Atted("overwrite", "long_name", "T", "temperature"))
+    editor.add("b.nc", Atted("delete", "history", "global"))
+    editor.add("a.nc", Atted("overwrite", "units", "T", "degC"))
+    assert editor.commands("a.nc") == [
+        (
+            "ncatted",
+            ["-a", "long_name,T,o,c,temperature", "-a", "units,T,o,c,degC"],
+        )
+    ]
+    assert editor.commands("b.nc") == [("ncatted", ["-a", "history,global,d,,"])]
+    # inspecting doesn't change the edits
+    assert editor.commands("a.nc") == editor.commands("a.nc")
+
+
+def test_keep_order_of_dependent_edits(editor):
+    editor.add(
+        "a.nc",
+        Atted("overwrite", "units", "T", "K"),
+        Rename("variable", {"T": "temp"}),
+        # doesn't depend on the rename, joins the first ncatted
+        Atted("overwrite", "units", "Q", "1"),
+        # depends on it
+        Atted("overwrite", "long_name", "temp", "temperature"),
+        Rename("dimension", {"lon": "x"}),
+    )
+    assert editor.commands("a.nc") == [
+        ("ncatted", ["-a", "units,T,o,c,K", "-a", "units,Q,o,c,1"]),
+        ("ncrename", ["-v", "T,temp", "-d", "lon,x"]),
+        ("ncatted", ["-a", "long_name,temp,o,c,temperature"]),
+    ]
+
+
+def test_join_and_cancel_renames(editor):
+    editor.add(
+        "a.nc",
+        Rename("variable", {"a": "b"}),
+        Rename("variable", {"b": "c", "x": "y"}),
+        Rename("variable", {"y": "x"}),
+    )
+    assert editor.commands("a.nc") == [("ncrename", ["-v", "a,c"])]
+
+    editor.add("b.nc", Rename("variable", {"a": "b"}), Rename("variable", {"c": "a"}))
+    assert editor.commands("b.nc") == [
+        ("ncrename", ["-v", "a,b"]),
+        ("ncrename", ["-v", "c,a"]),
+    ]
+
+
+def test_split_long_commands(editor, monkeypatch):
+    monkeypatch.setattr("nco.nco.ARG_MAX", 2 ** 13)
+    for i in range(100):
+        editor.add("a.nc", Atted("overwrite", "att{0}".format(i), "T", "x" * 50))
+    commands = editor.commands("a.nc")
+    assert len(commands) > 1
+    options = [option for _, options in commands for option in options]
+    assert len(options) == 200
+
+
+def test_flush(foo_nc, tmp_path):
+    nco = Nco(debug=True)
+    ifile = nco.ncks(input=foo_nc, output=str(tmp_path / "edit.nc"))
+    with nco.metadata_editor() as editor:
+        editor.add(ifile, Atted("overwrite", "units", "random", "K"))
+        editor.add(ifile, Rename("variable", {"random": "noise"}))
+        editor.add(ifile, Atted("overwrite", "long_name", "noise", "noise"))
+    assert len(editor) == 0
+    with netCDF4.Dataset(ifile) as dataset:
+        assert dataset.variables["noise"].units == "K"
+        assert dataset.variables["noise"].long_name == "noise"
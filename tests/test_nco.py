@@ -1,9 +1,15 @@
 """
 Unit tests for nco.py.
 """
+import asyncio
+import collections
 import distutils.spawn
+import io
+import json
 import os
+import pickle
 import subprocess
+import sys
 
 import netCDF4
 import numpy as np
@@ -11,7 +17,8 @@ import pytest
 import scipy.io.netcdf
 
 from nco import Nco, NCOException
-from nco.custom import Atted, Limit, LimitSingle, Rename
+from nco.nco import fit_inputs, iter_lines, json_description, parse_version_text
+from nco.custom import Atted, AttedBulk, Limit, LimitSingle, Rename
 
 ops = [
     "ncap2",
@@ -354,6 +361,86 @@ def test_ncatted_with_atted(foo_nc, tmp_path):
     assert ds.getncattr('1 2 3') == 'one two three'
 
 
+def test_atted_bulk():
+    """AttedBulk formats the same -a switches as single Atted objects"""
+    rows = [
+        ("overwrite", "units", "temperature", "Kelvin", None),
+        ("overwrite", "min", "temperature", -127, "byte"),
+        ("modify", "min-max", "pressure", [100, 10000], "int32"),
+        ("create", "array", "time_bands", range(1, 10, 2), "d"),
+        ("append", "mean", "time_bands", 3.14159826253, None),
+        ("append", "mean_sng", "time_bands", 3.14159826253, "char"),
+        ("o", "n", "time", [1, 2.5], None),
+        ("delete", "short_name", "temp", None, None),
+        ("nappend", "long", "random", 2 ** 33, "ull"),
+    ]
+    expected = []
+    for row in rows:
+        expected.extend(Atted(*row).prn_option())
+    bulk = AttedBulk(*[[row[i] or "" for row in rows] for i in range(5)])
+    assert bulk.prn_option() == expected
+
+    bulk = AttedBulk.from_mapping(
+        {"T": {"units": "K", "valid_range": np.array([0.0, 400.0])}},
+    )
+    assert bulk.prn_option() == [
+        "-a", "units,T,o,c,K", "-a", "valid_range,T,o,d,0.0,400.0",
+    ]
+    bulk = AttedBulk("c", ["a", "b"], "x", np.array([[1, 2], [3, 4]], "i2"))
+    assert bulk.prn_option() == ["-a", "a,x,c,s,1,2", "-a", "b,x,c,s,3,4"]
+    with pytest.raises(KeyError):
+        AttedBulk("replace", "a", "x", [1])
+    with pytest.raises(ValueError):
+        AttedBulk("o", ["a", "b"], "x", [1])
+
+
+def test_atted_bulk_split():
+    names = ["station{0}".format(i) for i in range(1000)]
+    bulk = AttedBulk("o", names, "global", np.arange(1000.0))
+    parts = bulk.split(limit=2 ** 12)
+    assert len(parts) > 1
+    options = []
+    for part in parts:
+        assert sum(len(o) + 1 + 8 for o in part.prn_option()) <= 2 ** 12
+        options.extend(part.prn_option())
+    assert options == bulk.prn_option()
+    assert len(bulk.split()) == 1
+
+
+def test_ncatted_splits_atted_bulk(monkeypatch):
+    names = ["station{0}".format(i) for i in range(1000)]
+    bulk = AttedBulk("o", names, "global", np.arange(1000.0))
+    atted = Atted("append", "history", "global", "edited")
+    nco = Nco()
+    kwargs = {"options": ["-h", atted, bulk], "output": "out.nc", "env": {}}
+    assert nco.ncatted_parts("in.nc", kwargs) is None
+
+    monkeypatch.setattr("nco.nco.ARG_MAX", 2 ** 15)
+    calls = nco.ncatted_parts("in.nc", dict(kwargs, returnArray="T"))
+    assert len(calls) > 2
+    first_input, first_kwargs = calls[0]
+    assert first_input == "in.nc"
+    assert first_kwargs["output"] == "out.nc"
+    assert first_kwargs["options"][:2] == ["-h", atted]
+    for call_input, call_kwargs in calls[1:-1]:
+        assert call_input == "out.nc"
+        assert call_kwargs["options"][:-1] == ["-h"]
+        assert set(call_kwargs) == {"options", "env"}
+    assert calls[-1][1]["returnArray"] == "T"
+    options = []
+    for _, call_kwargs in calls:
+        options.extend(call_kwargs["options"][-1].prn_option())
+    assert options == bulk.prn_option()
+
+    # a single switch beyond the limit can't be split
+    large = AttedBulk("o", ["long"], "global", ["x" * 40000])
+    with pytest.raises(ValueError):
+        nco.ncatted_parts("in.nc", {"options": [bulk, large], "env": {}})
+    monkeypatch.setattr("nco.nco.ARG_MAX", 2 ** 10)
+    with pytest.raises(ValueError):
+        nco.ncatted_parts("in.nc", {"options": [bulk], "env": {}})
+
+
 def test_cdf_mod_scipy():
     nco = Nco(cdf_module="scipy")
     nco.set_return_array()
@@ -383,3 +470,312 @@ def test_operator_prints_out(bar_nc):
     nco = Nco()
     dump = nco.ncks(input=bar_nc, options=["--help"])
     print(dump)
+
+
+@pytest.mark.usefixtures("foo_nc", "bar_nc")
+def test_aio_operators(foo_nc, bar_nc):
+    nco = Nco()
+
+    async def run():
+        return await asyncio.gather(
+            nco.aio.ncra(input=foo_nc, output="aio_foo.nc"),
+            nco.aio.ncra(input=bar_nc, output="aio_bar.nc"),
+        )
+
+    assert asyncio.run(run()) == ["aio_foo.nc", "aio_bar.nc"]
+    random = asyncio.run(
+        nco.aio.ncks(input=foo_nc, output="aio_foo.nc", returnArray="random")
+    )
+    assert isinstance(random, np.ndarray)
+
+    with pytest.raises(NCOException):
+        asyncio.run(nco.aio.ncks(input="", output=""))
+
+
+def test_aio_cancel_kills_process(monkeypatch):
+    nco = Nco()
+    processes = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def spawn(*args, **kwargs):
+        proc = await create_subprocess_exec(*args, **kwargs)
+        processes.append(proc)
+        return proc
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", spawn)
+
+    async def run():
+        cmd = [sys.executable, "-c", "import time; time.sleep(60)"]
+        task = asyncio.ensure_future(nco.aio.call(cmd))
+        while not processes:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert processes[0].returncode is not None
+    with pytest.raises(ProcessLookupError):
+        # killed and reaped
+        os.kill(processes[0].pid, 0)
+
+
+def test_aio_ncatted_splits_atted_bulk(monkeypatch):
+    nco = Nco()
+    calls = []
+
+    async def call(self, cmd, inputs=None, environment=None, use_shell=False):
+        calls.append(cmd)
+        return {"stdout": b"", "stderr": b"", "returncode": 0, "stats": None}
+
+    monkeypatch.setattr("nco.aio.AsyncNco.call", call)
+    monkeypatch.setattr("nco.nco.ARG_MAX", 2 ** 15)
+    names = ["station{0}".format(i) for i in range(1000)]
+    bulk = AttedBulk("o", names, "global", np.arange(1000.0))
+    asyncio.run(nco.aio.ncatted(input="in.nc", options=[bulk], env={}))
+    assert len(calls) > 1
+
+
+@pytest.mark.usefixtures("testfiles8589")
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_map(testfiles8589, executor):
+    nco = Nco()
+    inputs = testfiles8589 + ["missing.nc"]
+    results = list(
+        nco.map(
+            "ncks",
+            inputs,
+            output_template="{stem}_{index}_out.nc",
+            max_workers=2,
+            executor=executor,
+            variable="random",
+        )
+    )
+    assert sorted(res[0] for res in results) == sorted(inputs)
+    for input, output, exception in results:
+        if input == "missing.nc":
+            assert output is None
+            assert isinstance(exception, NCOException)
+        else:
+            assert exception is None
+            assert os.path.isfile(output)
+
+
+def test_pickle_nco():
+    nco = Nco(returnCdf=True, cdf_module="scipy")
+    nco.load_cdf_module()
+    clone = pickle.loads(pickle.dumps(nco))
+    assert clone.nco_path == nco.nco_path
+    assert clone.cdf is nco.cdf
+
+
+def test_lazy_operator_doc(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYNCO_CACHE_DIR", str(tmp_path))
+    nco = Nco()
+    assert nco.ncwa.__name__ == "ncwa"
+    method = Nco.__dict__["ncwa"]
+    method.doc = None
+    assert os.listdir(str(tmp_path)) == []
+
+    doc = nco.ncwa.__doc__
+    assert "ncwa" in doc
+    assert len(os.listdir(str(tmp_path / "docs"))) == 1
+
+    # a fresh process reads the documentation from disk
+    method.doc = None
+    assert nco.ncwa.__doc__ == doc
+
+
+def test_parse_version_text():
+    text = (
+        "ncra, version 5.1.4\n"
+        "NCO netCDF Operators version 5.1.4 built by conda on Jan  1 2023\n"
+    )
+    assert parse_version_text(text) == "5.1.4"
+    text = 'NCO netCDF Operators version "4.7.9" last modified 2019/01/01 \n'
+    assert parse_version_text(text) == "4.7.9"
+
+
+def test_capabilities(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYNCO_CACHE_DIR", str(tmp_path))
+    nco = Nco()
+    capabilities = nco.capabilities()
+    assert nco.version() == capabilities["version"]
+    assert "ncks" in capabilities["operators"]
+    for feature in ["json", "thr_nbr", "ppc", "quantize"]:
+        assert isinstance(capabilities[feature], bool)
+    # probed once per process
+    assert Nco().capabilities() is capabilities
+
+
+@pytest.mark.usefixtures("foo_nc")
+def test_call_stats(foo_nc):
+    nco = Nco()
+    collected = []
+    nco.add_call_hook(collected.append)
+    nco.ncra(input=foo_nc, output="out.nc")
+    stats = nco.stats
+    assert collected == [stats]
+    assert stats["operator"] == "ncra"
+    assert stats["cmd"][-1] == foo_nc
+    assert stats["returncode"] == 0
+    assert stats["wall_time"] > 0
+    assert stats["user_time"] >= 0 and stats["sys_time"] >= 0
+    assert stats["max_rss"] > 0
+    assert stats["input_bytes"] == os.path.getsize(foo_nc)
+    assert stats["output_bytes"] == os.path.getsize("out.nc")
+
+    nco.remove_call_hook(collected.append)
+    with pytest.raises(NCOException):
+        nco.ncra(input="missing.nc", output="out.nc")
+    assert len(collected) == 1
+    assert nco.stats["returncode"] != 0
+
+
+def test_call_reports_resource_usage():
+    nco = Nco()
+    retvals = nco.call([sys.executable, "-c", "import sys; sys.exit(3)"])
+    assert retvals["returncode"] == 3
+    assert retvals["stats"]["user_time"] is not None
+    assert retvals["stats"]["max_rss"] > 0
+
+
+@pytest.mark.usefixtures("foo_nc")
+def test_stream_operator_output(foo_nc):
+    nco = Nco()
+    options = ["-H", "-v", "random"]
+    dump = nco.ncks(input=foo_nc, options=options)
+
+    assert b"".join(nco.ncks(input=foo_nc, options=options, stream=True)) == dump
+    lines = list(nco.ncks(input=foo_nc, options=options, stream="lines"))
+    assert lines == dump.splitlines(True)
+    sink = io.BytesIO()
+    assert nco.ncks(input=foo_nc, options=options, stream=sink) is None
+    assert sink.getvalue() == dump
+    chunks = []
+    nco.ncks(input=foo_nc, options=options, stream=chunks.append)
+    assert b"".join(chunks) == dump
+
+    # abandoning the iterator kills ncks
+    lines = nco.ncks(input=foo_nc, options=options, stream="lines")
+    next(lines)
+    lines.close()
+
+    with pytest.raises(NCOException):
+        list(nco.ncks(input="missing.nc", options=options, stream=True))
+
+
+def test_iter_lines():
+    chunks = (chunk for chunk in [b"a\nb", b"c\n\n", b"d"])
+    assert list(iter_lines(chunks)) == [b"a\n", b"bc\n", b"\n", b"d"]
+
+
+@pytest.mark.usefixtures("foo_nc")
+def test_describe(foo_nc, monkeypatch):
+    nco = Nco()
+    descriptions = []
+    for use_json in [True, False]:
+        monkeypatch.setattr(nco, "capabilities", lambda: {"json": use_json})
+        monkeypatch.setattr("nco.nco._descriptions", collections.OrderedDict())
+        descriptions.append(nco.describe(foo_nc))
+    # ncks and the cdf module tell the same
+    assert descriptions[0] == descriptions[1]
+
+    description = descriptions[0]
+    assert description["dimensions"] == {"dim0": 5, "dim1": 5, "time": 1}
+    random = description["variables"]["random"]
+    assert random["type"] == "double"
+    assert random["shape"] == ["time", "dim0", "dim1"]
+    assert random["chunking"] is None
+    assert "units" in description["variables"]["time"]["attributes"]
+
+    # memoized
+    calls = []
+    nco.add_call_hook(calls.append)
+    description["dimensions"].clear()
+    assert nco.describe(foo_nc)["dimensions"]["dim0"] == 5
+    assert calls == []
+
+
+def test_json_description():
+    text = """{
+      "dimensions": {"lat": 2, "time": 4},
+      "variables": {
+        "T": {
+          "shape": ["time", "lat"],
+          "type": "float",
+          "attributes": {
+            "units": "K",
+            "valid_range": {"type": "short", "data": [0, 400]},
+            "scale": {"type": "short", "data": 2},
+            "_ChunkSizes": [1, 2],
+            "_Storage": "chunked",
+            "_Endianness": "little",
+            "_FillValue": -999.0
+          }
+        }
+      },
+      "attributes": {"_Format": "netCDF-4", "_NCProperties": "version=2"},
+      "groups": {"g": {"variables": {"n": {"type": "int", "attributes": {}}}}}
+    }"""
+    description = json_description(json.loads(text))
+    assert description["dimensions"] == {"lat": 2, "time": 4}
+    assert description["attributes"] == {}
+    assert description["variables"]["T"]["chunking"] == [1, 2]
+    assert description["variables"]["T"]["attributes"] == {
+        "units": "K",
+        "valid_range": [0, 400],
+        "scale": 2,
+        "_FillValue": -999.0,
+    }
+    assert description["groups"]["g"]["variables"]["n"] == {
+        "type": "int",
+        "shape": [],
+        "chunking": None,
+        "attributes": {},
+    }
+
+
+@pytest.mark.parametrize("chunksizes", [None, (3, 7)])
+def test_iter_array(tmp_path, chunksizes):
+    filename = str(tmp_path / "long.nc")
+    dataset = netCDF4.Dataset(filename, "w")
+    dataset.createDimension("time", None)
+    dataset.createDimension("x", 3)
+    var = dataset.createVariable("v", "f8", ("x", "time"), chunksizes=chunksizes)
+    var[:] = np.arange(150).reshape(3, 50)
+    dataset.close()
+
+    nco = Nco()
+    blocks = list(nco.iter_array(filename, "v", dim="time", block=10))
+    expected = 14 if chunksizes else 10
+    assert [block.shape[1] for block in blocks[:-1]] == [expected] * (len(blocks) - 1)
+    np.testing.assert_array_equal(
+        np.concatenate(blocks, axis=1), np.arange(150).reshape(3, 50)
+    )
+    assert len(list(nco.iter_array(filename, "v"))) == 1
+
+
+def test_fit_inputs():
+    inputs = ["/data/run/f{0:04d}.nc".format(i) for i in range(1000)]
+    cmd, file_list = fit_inputs(["ncrcat", "--output=o.nc"], inputs[:2])
+    assert cmd == ["ncrcat", "--output=o.nc"] + inputs[:2]
+    assert file_list is None
+
+    cmd, file_list = fit_inputs(["ncrcat", "--output=o.nc"], inputs, arg_max=10000)
+    assert cmd == ["ncrcat", "--output=o.nc"]
+    assert file_list.decode("utf-8").split() == inputs
+
+    cmd, file_list = fit_inputs(["ncbo", "--output=o.nc"], inputs, arg_max=10000)
+    assert cmd[2:5] == ["-p", "/data/run", "f0000.nc"]
+    assert len(cmd) == 1004
+    assert file_list is None
+
+
+def test_inputs_beyond_arg_max(monthly_filelist, monkeypatch):
+    nco = Nco(debug=True)
+    expected = nco.ncrcat(input=monthly_filelist, returnArray="random")
+    monkeypatch.setattr("nco.nco.ARG_MAX", 1000)
+    np.testing.assert_array_equal(
+        nco.ncrcat(input=monthly_filelist, returnArray="random"), expected
+    )
@@ -0,0 +1,50 @@
+"""
+Unit tests for pipeline.py.
+"""
+import os
+
+import netCDF4
+import pytest
+
+from nco import Nco, NCOException
+
+
+pytestmark = pytest.mark.usefixtures("cleandir")
+
+
+def test_pipeline_branches(foo_nc, tmp_path):
+    nco = Nco()
+    scratch_dir = tmp_path / "scratch"
+    scratch_dir.mkdir()
+    pipe = nco.pipeline(scratch_dir=str(scratch_dir), max_workers=2)
+    subset = pipe.add("ncks", input=foo_nc, variable="random,time")
+    double = pipe.add("ncap2", input=subset, options=["-s", "double=random*2"])
+    triple = pipe.add("ncap2", input=subset, options=["-s", "triple=random*3"])
+    pipe.add("ncbo", input=[triple, double], output="diff.nc", op_typ="sub")
+    mean = pipe.add("ncra", input=double, name="mean")
+
+    results = pipe.run()
+    assert sorted(results) == ["mean", "ncbo_3"]
+    assert results["ncbo_3"] == "diff.nc"
+    # only the output nothing reads is left in the scratch directory
+    assert os.listdir(str(scratch_dir)) == [os.path.basename(mean.output)]
+
+    with netCDF4.Dataset("diff.nc") as dataset:
+        assert "triple" in dataset.variables
+
+
+def test_pipeline_error(foo_nc, tmp_path):
+    nco = Nco()
+    pipe = nco.pipeline(scratch_dir=str(tmp_path))
+    subset = pipe.add("ncks", input=foo_nc)
+    pipe.add("ncra", input=[subset, "missing.nc"])
+    with pytest.raises(NCOException):
+        pipe.run()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_pipeline_foreign_step(foo_nc):
+    nco = Nco()
+    step = nco.pipeline().add("ncks", input=foo_nc)
+    with pytest.raises(ValueError):
+        nco.pipeline().add("ncra", input=step)
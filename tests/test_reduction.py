@@ -0,0 +1,226 @@
+"""
+Unit tests for reduction.py.
+"""
+import netCDF4
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.custom import Limit, LimitSingle
+from nco.reduction import (
+    check_unweighted,
+    dimension_options,
+    merge_options,
+    operation_type,
+    output_options,
+    record_hyperslab,
+    record_layout,
+    split_ranges,
+)
+
+
+@pytest.fixture
+def members(tmp_path):
+    """7 ensemble members of a random field"""
+    filenames = []
+    for member in range(7):
+        filename = str(tmp_path / "member{0}.nc".format(member))
+        dataset = netCDF4.Dataset(filename, "w")
+        dataset.createDimension("x", 4)
+        var = dataset.createVariable("T", "f8", ("x",))
+        var[:] = np.random.rand(4)
+        dataset.close()
+        filenames.append(filename)
+    return filenames
+
+
+@pytest.fixture
+def records_nc(tmp_path):
+    """a netCDF4 file of 10 records, chunked by 3 records"""
+    filename = str(tmp_path / "records.nc")
+    dataset = netCDF4.Dataset(filename, "w")
+    dataset.createDimension("time", None)
+    dataset.createDimension("x", 4)
+    var = dataset.createVariable("T", "f8", ("time", "x"), chunksizes=(3, 4))
+    time = dataset.createVariable("time", "f8", ("time",))
+    time.units = "days since 1990-01-01"
+    var[:] = np.random.rand(10, 4)
+    time[:] = np.arange(10)
+    dataset.close()
+    return filename
+
+
+def test_split_ranges():
+    assert split_ranges(10, 3) == [(0, 3), (4, 7), (8, 9)]
+    assert split_ranges(10, 4, chunk=3) == [(0, 2), (3, 5), (6, 8), (9, 9)]
+    assert split_ranges(10, 2, chunk=4) == [(0, 7), (8, 9)]
+    assert split_ranges(2, 8) == [(0, 0), (1, 1)]
+    assert split_ranges(0, 4) == []
+    assert split_ranges(10, 2, first=3) == [(3, 6), (7, 9)]
+    assert split_ranges(10, 2, chunk=3, first=1) == [(1, 5), (6, 9)]
+    assert split_ranges(5, 2, first=5) == []
+
+
+def test_record_hyperslab():
+    other = Limit("x", 0, 1)
+    assert record_hyperslab([other, "-O"], "time", 10) == ([other, "-O"], 0, 9)
+    assert record_hyperslab(["-d time,2,5 -d x,1"], "time", 10) == (
+        ["-d", "x,1"],
+        2,
+        5,
+    )
+    assert record_hyperslab(["--dimension=time,4,"], "time", 10) == ([], 4, 9)
+    assert record_hyperslab([Limit("time", 1, 3)], "time", 10) == ([], 1, 3)
+    assert record_hyperslab([LimitSingle("time", 7)], "time", 10) == ([], 7, 7)
+    assert record_hyperslab(["-d", "time,7"], "time", 10) == ([], 7, 7)
+    for options in [
+        [Limit("time", 0, 9, 2)],
+        [Limit("time", 1.0, 5.0)],
+        ["-d time,0,9,1,2"],
+        ["-d time,1.5,3.0"],
+        ["-d time,0,2", "-d time,5,6"],
+        ["-d time,5,12"],
+    ]:
+        with pytest.raises(ValueError):
+            record_hyperslab(options, "time", 10)
+
+
+def test_check_unweighted():
+    check_unweighted(["-y", "max"], {"average": "time"})
+    for options, kwargs in [
+        (["-w", "gw"], None),
+        (["--wgt_var=gw"], None),
+        ([], {"weight": "gw"}),
+    ]:
+        with pytest.raises(ValueError):
+            check_unweighted(options, kwargs)
+    with pytest.raises(ValueError):
+        merge_options("nces", ["-w 1,2,3"], [4, 4])
+
+
+def test_merge_options():
+    assert merge_options("ncrcat", [], [5, 5]) == []
+    assert merge_options("ncecat", [], [5, 5]) == []
+    assert merge_options("ncra", [], [4, 4, 2]) == ["-y", "avg", "-w", "4,4,2"]
+    assert merge_options("nces", [], [4, 4]) == ["-y", "avg"]
+    assert merge_options("ncra", ["-y max"], [4, 4]) == ["-y", "max"]
+    assert merge_options("ncra", ["-y", "mibs"], [4, 4]) == ["-y", "min"]
+    assert merge_options("ncra", ["--op_typ=ttl"], [4, 4]) == ["-y", "ttl"]
+    assert merge_options("ncrcat", ["-4 -L 1", "-v T"], [5, 5]) == ["-4", "-L", "1"]
+    assert merge_options("ncra", ["-y max", "-7"], [4, 4], {"hdr_pad": 100}) == [
+        "-7",
+        "--hdr_pad=100",
+        "-y",
+        "max",
+    ]
+    assert operation_type(["-O", "-y", "rms"]) == "rms"
+    with pytest.raises(ValueError):
+        merge_options("ncra", ["-y", "rms"], [4, 4])
+
+
+def test_output_options():
+    options = ["-4", "-L", "5", "-v", "T", "--cnk_dmn=time,3", "-L1", Limit("x", 1)]
+    assert output_options(options) == ["-4", "-L", "5", "--cnk_dmn=time,3", "-L1"]
+    kwargs = {"fl_fmt": "netcdf4", "netcdf4": True, "cnk_dmn": ["time,3", "x,4"]}
+    assert output_options(["-O"], kwargs) == [
+        "--netcdf4",
+        "--fl_fmt=netcdf4",
+        "--cnk_dmn=time,3,x,4",
+    ]
+
+
+def test_dimension_options():
+    kwargs = {"dimension": ["time,0,5", "x,1"], "dmn": "y,2", "output": "o.nc"}
+    assert dimension_options(kwargs) == [
+        "--dimension=time,0,5",
+        "--dimension=x,1",
+        "--dmn=y,2",
+    ]
+    assert kwargs == {"output": "o.nc"}
+
+
+def test_record_layout(records_nc):
+    with netCDF4.Dataset(records_nc) as dataset:
+        assert record_layout(dataset) == ("time", 10, 3)
+        assert record_layout(dataset, "x") == ("x", 4, 1)
+        with pytest.raises(ValueError):
+            record_layout(dataset, "y")
+
+
+@pytest.mark.parametrize("nco_command", ["ncra", "ncrcat"])
+def test_split_records(records_nc, nco_command):
+    nco = Nco(debug=True)
+    serial = nco.ncra if nco_command == "ncra" else nco.ncrcat
+    expected = serial(input=records_nc, returnArray="T")
+    result = nco.split_records(
+        nco_command, input=records_nc, parts=3, returnArray="T"
+    )
+    np.testing.assert_allclose(result, expected)
+
+
+@pytest.mark.parametrize("nco_command", ["ncra", "ncrcat"])
+def test_split_records_hyperslab(records_nc, nco_command):
+    nco = Nco(debug=True)
+    options = ["-d", "time,2,8"]
+    serial = nco.ncra if nco_command == "ncra" else nco.ncrcat
+    expected = serial(input=records_nc, options=options, returnArray="T")
+    result = nco.split_records(
+        nco_command, input=records_nc, parts=3, options=options, returnArray="T"
+    )
+    np.testing.assert_allclose(result, expected)
+    with pytest.raises(ValueError):
+        nco.split_records(
+            nco_command, input=records_nc, parts=3, options=["-d", "time,0,9,2"]
+        )
+
+
+def test_split_records_output_format(records_nc, tmp_path):
+    nco = Nco(debug=True)
+    output = str(tmp_path / "mean.nc")
+    nco.split_records(
+        "ncra",
+        input=records_nc,
+        parts=3,
+        output=output,
+        options=["--fl_fmt=classic"],
+        dimension=["time,1,8"],
+    )
+    with netCDF4.Dataset(output) as dataset:
+        assert dataset.data_model == "NETCDF3_CLASSIC"
+
+
+@pytest.mark.parametrize(
+    "nco_command, options",
+    [("nces", []), ("nces", ["-y", "max"]), ("nces", ["-y", "ttl"]), ("ncecat", [])],
+)
+def test_tree_reduce(members, nco_command, options):
+    nco = Nco(debug=True)
+    expected = getattr(nco, nco_command)(
+        input=members, options=options, returnArray="T"
+    )
+    result = nco.tree_reduce(
+        nco_command, members, fan_in=2, options=options, returnArray="T"
+    )
+    np.testing.assert_allclose(result, expected)
+    assert len(nco.scratch.files) == 0
+
+
+@pytest.mark.parametrize("nco_command", ["nces", "ncecat"])
+def test_tree_reduce_output_format(members, tmp_path, nco_command):
+    nco = Nco(debug=True)
+    output = str(tmp_path / "reduced.nc")
+    expected = getattr(nco, nco_command)(
+        input=members, dimension=["x,1,2"], returnArray="T"
+    )
+    nco.tree_reduce(
+        nco_command,
+        members,
+        fan_in=2,
+        output=output,
+        options=["-3"],
+        dimension=["x,1,2"],
+    )
+    with netCDF4.Dataset(output) as dataset:
+        assert dataset.data_model == "NETCDF3_CLASSIC"
+        np.testing.assert_allclose(dataset.variables["T"][:], expected)
+    assert len(nco.scratch.files) == 0
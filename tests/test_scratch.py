@@ -0,0 +1,80 @@
+"""
+Unit tests for scratch.py.
+"""
+import gc
+import os
+import pickle
+
+from nco import Nco
+from nco.scratch import Scratch, ScratchFile
+
+
+def fill(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def test_removed_on_garbage_collection(tmp_path):
+    scratch = Scratch(str(tmp_path))
+    path = scratch.new_file(prefix="ncra_")
+    assert isinstance(path, ScratchFile)
+    assert os.path.isfile(path)
+    name = str(path)
+    del path
+    gc.collect()
+    assert not os.path.exists(name)
+    assert name not in scratch
+
+
+def test_cleanup_on_exit(tmp_path):
+    with Scratch(str(tmp_path)) as scratch:
+        paths = [scratch.new_file() for _ in range(3)]
+        assert all(os.path.isfile(path) for path in paths)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_lru_eviction(tmp_path):
+    scratch = Scratch(str(tmp_path), max_bytes=250)
+    paths = [scratch.new_file() for _ in range(3)]
+    for path in paths[:2]:
+        fill(path, 100)
+        scratch.track(path)
+    scratch.touch(paths[0])
+    scratch.pin(paths[0])
+    fill(paths[2], 100)
+    scratch.track(paths[2])
+    # paths[1] is the least recently used file
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+    assert scratch.total_bytes == 200
+
+
+def test_fast_directory(tmp_path):
+    fast = tmp_path / "fast"
+    fast.mkdir()
+    scratch = Scratch(str(tmp_path), fast_directory=str(fast), fast_max_bytes=10)
+    assert os.path.dirname(scratch.new_file(size_hint=5)) == str(fast)
+    assert os.path.dirname(scratch.new_file(size_hint=50)) == str(tmp_path)
+    assert os.path.dirname(scratch.new_file()) == str(tmp_path)
+
+
+def test_release_and_pickle(tmp_path):
+    scratch = Scratch(str(tmp_path), max_bytes=10)
+    path = scratch.new_file()
+    assert type(pickle.loads(pickle.dumps(path))) is str
+    clone = pickle.loads(pickle.dumps(scratch))
+    assert clone.max_bytes == 10
+    assert path not in clone
+    name = scratch.release(path)
+    del path
+    gc.collect()
+    assert os.path.isfile(name)
+
+
+def test_temporary_output(foo_nc, tmp_path):
+    nco = Nco(scratch=Scratch(str(tmp_path)))
+    output = nco.ncra(input=foo_nc)
+    assert os.path.dirname(output) == str(tmp_path)
+    assert nco.scratch.total_bytes == os.path.getsize(output)
+    del output
+    gc.collect()
+    assert os.listdir(str(tmp_path)) == []
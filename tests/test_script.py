@@ -0,0 +1,73 @@
+"""
+Unit tests for script.py.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from nco import Nco
+from nco.script import Ncap2Script, analyze, attribute_owner, statements
+
+
+def test_statements():
+    expression = 'a=b*2; b@units="m;s" // c=d\n{ d[$time]=a.avg($time) }'
+    assert statements(expression) == ["a=b*2", 'b@units=""', "d[$time]=a.avg($time)"]
+
+
+@pytest.mark.parametrize(
+    "statement, defined, ram, reads",
+    [
+        ("a=b*2", "a", False, {"b"}),
+        ("*tmp = sin(T)*1.5e3", "tmp", True, {"T"}),
+        ('T@units=""', None, False, set()),
+        ("T@scale += s", None, False, {"s"}),
+        ('global@history=""', None, False, set()),
+        ("T += dT", "T", False, {"T", "dT"}),
+        ("d[$time,$lat]=a.avg($lat)", "d", False, {"a"}),
+    ],
+)
+def test_analyze(statement, defined, ram, reads):
+    assert analyze(statement) == (defined, ram, reads)
+
+
+def test_check(tmp_path):
+    script = Ncap2Script(directory=str(tmp_path))
+    script.add('-s "a=b*2"').add("c = a + 1; d = c * e")
+    assert script.definitions() == ["a", "c", "d"]
+    assert script.undefined(["b", "e"]) == []
+    assert script.undefined(["b"]) == [("d = c * e", "e")]
+    with pytest.raises(ValueError):
+        # c is used before it is defined
+        Ncap2Script(expressions=["d = c", "c = b"]).check(["b"])
+
+
+def test_check_attributes():
+    script = Ncap2Script(expressions=['global@history="x"', "new = 1"])
+    script.add('new@units="m"; T@units="K"')
+    assert attribute_owner('global@history="x"') is None
+    assert attribute_owner('new@units="m"') == "new"
+    assert script.undefined(["T"]) == []
+    assert script.undefined() == [('T@units=""', "T")]
+    script.check(["T"])
+
+
+def test_text_and_path(tmp_path):
+    script = Ncap2Script(
+        expressions=["a=b*2", "c=a+1; d = c*2"], keep=["c"], directory=str(tmp_path)
+    )
+    assert script.text(["b"]) == "*a=b*2;\nc=a+1; *d = c*2;\n"
+    path = script.path(["b"])
+    assert os.path.dirname(path) == str(tmp_path)
+    assert script.path(["b"]) == path
+    assert script.prn_option()[0] == "-S"
+
+
+def test_run_script(foo_nc, tmp_path):
+    nco = Nco(debug=True)
+    script = nco.ncap2_script(directory=str(tmp_path))
+    script.add("double2 = random * 2").add("double4 = double2 * 2")
+    output = str(tmp_path / "out.nc")
+    result = script.run(input=foo_nc, output=output, returnArray="double4")
+    random = nco.ncks(input=foo_nc, returnArray="random")
+    np.testing.assert_allclose(result, random * 4)
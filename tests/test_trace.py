@@ -0,0 +1,88 @@
+"""
+Unit tests for trace.py.
+"""
+import json
+import threading
+
+import pytest
+
+from nco import Nco
+from nco.nco import call_stats
+from nco.trace import Tracer
+
+
+pytestmark = pytest.mark.usefixtures("cleandir")
+
+
+def fake_stats(operator, start, wall_time):
+    stats = call_stats(["/usr/bin/" + operator, "in.nc"], "in.nc", start, 42)
+    stats["wall_time"] = wall_time
+    stats["returncode"] = 0
+    return stats
+
+
+def test_trace_events(tmp_path):
+    tracer = Tracer()
+    tracer(fake_stats("ncra", 10.0, 0.5))
+    thread = threading.Thread(
+        target=lambda: tracer(fake_stats("ncwa", 10.25, 1.0))
+    )
+    thread.start()
+    thread.join()
+
+    path = str(tmp_path / "trace.json")
+    tracer.export(path)
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+
+    names = [event for event in events if event["ph"] == "M"]
+    calls = [event for event in events if event["ph"] == "X"]
+    assert len(names) == 2
+    assert [call["name"] for call in calls] == ["ncra", "ncwa"]
+    assert calls[0]["ts"] == 10.0e6
+    assert calls[0]["dur"] == 0.5e6
+    assert calls[0]["tid"] != calls[1]["tid"]
+    assert calls[0]["args"]["pid"] == 42
+    assert calls[0]["args"]["inputs"] == ["in.nc"]
+
+    tracer.clear()
+    assert tracer.trace()["traceEvents"] == []
+
+
+def test_trace_overlapping_calls():
+    tracer = Tracer()
+    # calls of one thread as asyncio runs them, reported as they end
+    tracer(fake_stats("ncra", 10.25, 0.25))
+    tracer(fake_stats("ncwa", 10.0, 1.0))
+    tracer(fake_stats("ncks", 10.75, 0.5))
+    tracer(fake_stats("ncap2", 11.25, 0.25))
+
+    events = tracer.trace()["traceEvents"]
+    names = dict(
+        (event["tid"], event["args"]["name"]) for event in events if event["ph"] == "M"
+    )
+    calls = dict((event["name"], event) for event in events if event["ph"] == "X")
+    assert calls["ncra"]["tid"] == calls["ncks"]["tid"] == calls["ncap2"]["tid"]
+    assert calls["ncwa"]["tid"] != calls["ncra"]["tid"]
+    assert names[calls["ncwa"]["tid"]] == names[calls["ncra"]["tid"]] + " (2)"
+
+    # the slices of every track follow one another
+    for tid in names:
+        spans = sorted(
+            (call["ts"], call["ts"] + call["dur"])
+            for call in calls.values()
+            if call["tid"] == tid
+        )
+        assert all(end <= start for (_, end), (start, _) in zip(spans, spans[1:]))
+
+
+def test_trace_operators(foo_nc, bar_nc):
+    nco = Nco()
+    tracer = Tracer()
+    nco.add_call_hook(tracer)
+    results = list(nco.map("ncra", [foo_nc, bar_nc], executor="process"))
+    assert len(results) == 2
+    calls = [event for event in tracer.trace()["traceEvents"] if event["ph"] == "X"]
+    assert sorted(call["args"]["inputs"][0] for call in calls) == sorted(
+        [foo_nc, bar_nc]
+    )